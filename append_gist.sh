@@ -17,7 +17,7 @@ while getopts g:u:t:n:sfp: OPT; do
     u) USER=$OPTARG ;;
     t) HASHTAG=$OPTARG ;;
     n) NUM=$OPTARG ;;
-    s) STOP_ON_EXISTING="-s" ;;
+    s) STOP_ON_EXISTING="-s --stop-mode snowflake" ;;
     f) FORCE_EMPTY="--force-empty" ;;
     p) PROMOTE_GIST_ID=$OPTARG ;;
     *) echo "Usage: $0 -g gist_id [-u user | -t hashtag] [-n num] [-s] [-f] [-p promote_gist_id]"
@@ -21,7 +21,7 @@ mkdir -p assets/data scripts
 # 2. X（Twitter）からの抽出
 echo "Step 2: Extracting $NUM items for @$USER (Mode: $MODE)..."
 # 引数を Python に渡す
-python3 scripts/extract_media.py -u "$USER" -n "$NUM"
+python3 scripts/extract_media.py -u "$USER" -n "$NUM" --output-format js
 
 # 3. Flutter用データへの変換
 echo "Step 3: Updating data format..."
@@ -504,7 +504,8 @@ class _GalleryPageState extends State<GalleryPage> {
     if (remainingCount != null) {
       if (remainingCount == 0 &&
           widget.userGistUsername != null &&
-          widget.keywordChildGistId == null) {
+          widget.keywordChildGistId == null &&
+          vm.olderUserSegmentCount(widget.userGistUsername!) == 0) {
         // ポストがなくなったユーザーをマスターGistから削除して画面を閉じる
         await vm.removeUserFromMaster(widget.userGistUsername!);
         if (mounted) Navigator.pop(context);
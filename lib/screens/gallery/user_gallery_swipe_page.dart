@@ -32,6 +32,11 @@ class _UserGallerySwipePageState extends State<UserGallerySwipePage> {
   final Map<String, List<TweetItem>?> _loadedItems = {};
   final Map<String, bool> _loading = {};
   final Map<String, ScrollController> _scrollControllers = {};
+  // ユーザー名 → head Gist のアイテム数（_loadedItems の先頭。削除は head に対して行う）
+  final Map<String, int> _headCounts = {};
+  // ユーザー名 → 読み込み済みの封印済みGistの数（スクロールが末尾に近づいたら次を読む）
+  final Map<String, int> _olderLoaded = {};
+  final Set<String> _loadingOlder = {};
 
   @override
   void initState() {
@@ -54,7 +59,38 @@ class _UserGallerySwipePageState extends State<UserGallerySwipePage> {
   String? get _currentGistId => widget.userGistIds[_currentIndex];
 
   ScrollController _controllerFor(String username) {
-    return _scrollControllers.putIfAbsent(username, () => ScrollController());
+    return _scrollControllers.putIfAbsent(username, () {
+      final controller = ScrollController();
+      controller.addListener(() {
+        if (controller.position.extentAfter < 1000) _loadOlder(username);
+      });
+      return controller;
+    });
+  }
+
+  /// 封印済みの古いGistを1つ読み、末尾に追加する
+  Future<void> _loadOlder(String username) async {
+    final vm = context.read<GalleryViewModel>();
+    final index = _olderLoaded[username] ?? 0;
+    if (_loadingOlder.contains(username) ||
+        _loadedItems[username] == null ||
+        index >= vm.olderUserSegmentCount(username)) {
+      return;
+    }
+    _loadingOlder.add(username);
+    try {
+      final older = await vm.fetchOlderUserItems(username, index);
+      if (mounted) {
+        setState(() {
+          _olderLoaded[username] = index + 1;
+          _loadedItems[username] = [..._loadedItems[username]!, ...older];
+        });
+      }
+    } catch (_) {
+      _olderLoaded[username] = index + 1; // 取得できないGistは飛ばす
+    } finally {
+      _loadingOlder.remove(username);
+    }
   }
 
   Future<void> _loadPage(int index) async {
@@ -65,7 +101,12 @@ class _UserGallerySwipePageState extends State<UserGallerySwipePage> {
     final vm = context.read<GalleryViewModel>();
     try {
       final items = await vm.fetchUserItems(username);
-      if (mounted) setState(() => _loadedItems[username] = items);
+      if (mounted) {
+        setState(() {
+          _loadedItems[username] = items;
+          _headCounts[username] = items.length;
+        });
+      }
     } catch (_) {
       if (mounted) setState(() => _loadedItems[username] = []);
     } finally {
@@ -119,21 +160,27 @@ class _UserGallerySwipePageState extends State<UserGallerySwipePage> {
 
     final gistId = widget.userGistIds[_currentIndex]!;
     final currentItems = _loadedItems[username] ?? [];
+    final headCount = _headCounts[username] ?? currentItems.length;
     final deletedIds = Set<String>.from(vm.selectedIds);
+    // 書き換えるのは head のみ（封印済みGistは書き換えないので、そのポストは画面上でのみ除外する）
     final remainingCount = await vm.deleteSelectedFromUserGist(
       gistId,
       username,
-      currentItems,
+      currentItems.take(headCount).toList(),
     );
 
     if (mounted) Navigator.pop(context);
 
     if (remainingCount != null) {
-      if (remainingCount == 0) {
+      if (remainingCount == 0 && vm.olderUserSegmentCount(username) == 0) {
         await vm.removeUserFromMaster(username);
         if (mounted) Navigator.pop(context);
       } else {
         setState(() {
+          _headCounts[username] = currentItems
+              .take(headCount)
+              .where((item) => !deletedIds.contains(item.id))
+              .length;
           _loadedItems[username] = currentItems
               .where((item) => !deletedIds.contains(item.id))
               .toList();
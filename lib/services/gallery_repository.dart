@@ -3,11 +3,16 @@ import 'package:flutter/foundation.dart';
 import 'package:http/http.dart' as http;
 import 'package:shared_preferences/shared_preferences.dart';
 import '../models/tweet_item.dart';
+import 'gist_format.dart';
 
 class GalleryData {
   final String userName;
   final List<TweetItem> items;
-  final Map<String, String> userGists; // username -> gist_id
+  final Map<String, String> userGists; // username -> gist_id（head）
+  // username -> 封印済みの古いGist（新しい順: {gist_id, min_id, max_id, count}）
+  final Map<String, List<Map<String, dynamic>>> userGistChains;
+  // gist_id -> 配置用の要約（{load, count, files}）。スクリプトが更新し、アプリはそのまま書き戻す
+  final Map<String, dynamic> userGistLoads;
   final Map<String, String> characterGists; // character_name -> gist_id
   final Map<String, String> keywordGists; // keyword -> gist_id
 
@@ -15,6 +20,8 @@ class GalleryData {
     required this.userName,
     required this.items,
     this.userGists = const {},
+    this.userGistChains = const {},
+    this.userGistLoads = const {},
     this.characterGists = const {},
     this.keywordGists = const {},
   });
@@ -46,6 +53,86 @@ class GalleryRepository {
     return response;
   }
 
+  /// Gist 内の任意のファイルを raw で取得
+  Future<http.Response> _fetchGistFile(String gistId, String filename) {
+    final t = DateTime.now().millisecondsSinceEpoch;
+    return http.get(Uri.parse('${_gistRawBaseUrl(gistId)}$filename?t=$t'));
+  }
+
+  /// Gist 内のファイル（{"tweets": [...]}）からツイートの JSON を取得
+  Future<List> _fetchTweetsFile(String gistId, String file) async {
+    final response = await _fetchGistFile(gistId, file);
+    if (response.statusCode != 200) {
+      throw Exception('Failed to load $file ($gistId)');
+    }
+    final shard = decodeGistDocument(utf8.decode(response.bodyBytes));
+    return shard['tweets'] as List? ?? [];
+  }
+
+  /// users の1エントリからツイートの JSON を取り出す。
+  /// sharded 形式（{file, count, segments}）ならユーザー別ファイル（user-<name>.json）と
+  /// 追記セグメント（seg-<id>.json）を並列に取得し、新しいセグメント → ベースの順に結合する。
+  /// snowflakeOrder（索引の "order": "snowflake"）なら結合後に ID の降順に並べる
+  Future<List<Map<String, dynamic>>> _loadUserEntryJson(
+    String gistId,
+    Map<String, dynamic> userData, {
+    bool snowflakeOrder = false,
+  }) async {
+    final file = userData['file'] as String?;
+    final segmentFiles = ((userData['segments'] as List?) ?? [])
+        .map((seg) => (seg as Map<String, dynamic>)['file'] as String)
+        .toList();
+    final lists = await Future.wait([
+      for (final seg in segmentFiles.reversed) _fetchTweetsFile(gistId, seg),
+      if (userData['tweets'] != null)
+        Future.value(userData['tweets'] as List)
+      else if (file != null)
+        _fetchTweetsFile(gistId, file),
+    ]);
+    final seen = <String>{};
+    final merged = <Map<String, dynamic>>[];
+    for (final tweets in lists) {
+      for (final t in tweets) {
+        final tweet = t as Map<String, dynamic>;
+        final id = tweet['id_str'] as String?;
+        if (id != null && id.isNotEmpty && !seen.add(id)) continue;
+        merged.add(tweet);
+      }
+    }
+    if (snowflakeOrder) {
+      BigInt idOf(Map<String, dynamic> t) =>
+          BigInt.tryParse(t['id_str'] as String? ?? '') ?? BigInt.zero;
+      merged.sort((a, b) => idOf(b).compareTo(idOf(a)));
+    }
+    return merged;
+  }
+
+  Future<List<TweetItem>> _loadUserEntryTweets(
+    String gistId,
+    Map<String, dynamic> userData, {
+    bool snowflakeOrder = false,
+  }) async {
+    final tweets = await _loadUserEntryJson(
+      gistId,
+      userData,
+      snowflakeOrder: snowflakeOrder,
+    );
+    return tweets
+        .map(TweetItem.fromJson)
+        .where((item) => item.mediaUrls.isNotEmpty)
+        .toList();
+  }
+
+  /// sharded エントリが持つファイル（ベース + セグメント）
+  List<String> _entryFiles(Map<String, dynamic>? userData) {
+    if (userData == null) return [];
+    return [
+      if (userData['file'] != null) userData['file'] as String,
+      for (final seg in (userData['segments'] as List?) ?? [])
+        (seg as Map<String, dynamic>)['file'] as String,
+    ];
+  }
+
   /// Gist からギャラリーデータを取得（キャッシュ対応）
   Future<GalleryData> fetchGalleryData(
     String gistId, {
@@ -91,13 +178,27 @@ class GalleryRepository {
   }
 
   GalleryData _parseGalleryData(String jsonStr) {
-    final data = json.decode(jsonStr);
+    final data = decodeGistDocument(jsonStr);
     final tweets = (data['tweets'] as List? ?? [])
         .map((e) => TweetItem.fromJson(e as Map<String, dynamic>))
         .where((item) => item.mediaUrls.isNotEmpty)
         .toList();
     final userGistsRaw = data['user_gists'] as Map<String, dynamic>? ?? {};
-    final userGists = userGistsRaw.map((k, v) => MapEntry(k, v as String));
+    // 値は gist_id（従来）か {gist_id, chain: [...]}（上限を超えたユーザー）
+    final userGists = <String, String>{};
+    final userGistChains = <String, List<Map<String, dynamic>>>{};
+    userGistsRaw.forEach((k, v) {
+      if (v is String) {
+        userGists[k] = v;
+      } else if (v is Map<String, dynamic>) {
+        final head = v['gist_id'] as String?;
+        if (head != null) userGists[k] = head;
+        final chain = (v['chain'] as List? ?? [])
+            .cast<Map<String, dynamic>>()
+            .toList();
+        if (chain.isNotEmpty) userGistChains[k] = chain;
+      }
+    });
     final characterGistsRaw =
         data['character_gists'] as Map<String, dynamic>? ?? {};
     final characterGists = characterGistsRaw.map(
@@ -112,6 +213,8 @@ class GalleryRepository {
       userName: data['user_screen_name'] ?? '',
       items: tweets,
       userGists: userGists,
+      userGistChains: userGistChains,
+      userGistLoads: data['user_gist_loads'] as Map<String, dynamic>? ?? {},
       characterGists: characterGists,
       keywordGists: keywordGists,
     );
@@ -124,16 +227,17 @@ class GalleryRepository {
     final response = await _fetchGistRaw(gistId);
 
     if (response.statusCode == 200) {
-      final data = json.decode(utf8.decode(response.bodyBytes));
+      final data = decodeGistDocument(utf8.decode(response.bodyBytes));
 
-      // 1. 標準の子Gist形式 (users -> username -> tweets)
+      // 1. 標準の子Gist形式 (users -> username -> tweets / sharded: users -> username -> file)
       final users = data['users'] as Map<String, dynamic>?;
       if (users != null && users.containsKey(username)) {
         final userData = users[username] as Map<String, dynamic>;
-        return (userData['tweets'] as List? ?? [])
-            .map((e) => TweetItem.fromJson(e as Map<String, dynamic>))
-            .where((item) => item.mediaUrls.isNotEmpty)
-            .toList();
+        return _loadUserEntryTweets(
+          gistId,
+          userData,
+          snowflakeOrder: data['order'] == 'snowflake',
+        );
       }
 
       // 2. フォールバック: 直下に 'tweets' がある形式
@@ -159,20 +263,23 @@ class GalleryRepository {
       throw Exception('Failed to load gist ($gistId)');
     }
 
-    final data = json.decode(utf8.decode(response.bodyBytes));
+    final data = decodeGistDocument(utf8.decode(response.bodyBytes));
     final List<TweetItem> allTweets = [];
 
-    // multi-user形式: users -> username -> tweets を全結合
+    // multi-user形式: users -> username -> tweets を全結合（sharded のファイルは並列に取得）
     final users = data['users'] as Map<String, dynamic>?;
     if (users != null) {
-      for (final userData in users.values) {
-        final tweets =
-            (userData as Map<String, dynamic>)['tweets'] as List? ?? [];
-        allTweets.addAll(
-          tweets
-              .map((e) => TweetItem.fromJson(e as Map<String, dynamic>))
-              .where((item) => item.mediaUrls.isNotEmpty),
-        );
+      final perUser = await Future.wait(
+        users.values.map(
+          (userData) => _loadUserEntryTweets(
+            gistId,
+            userData as Map<String, dynamic>,
+            snowflakeOrder: data['order'] == 'snowflake',
+          ),
+        ),
+      );
+      for (final tweets in perUser) {
+        allTweets.addAll(tweets);
       }
     }
 
@@ -195,18 +302,32 @@ class GalleryRepository {
     List<TweetItem> items, {
     String userName = '',
     Map<String, String> userGists = const {},
+    Map<String, List<Map<String, dynamic>>> userGistChains = const {},
+    Map<String, dynamic> userGistLoads = const {},
     Map<String, String> keywordGists = const {},
   }) {
-    return json.encode({
+    // チェーンを持つユーザーは {gist_id, chain} で書き戻す
+    final userGistsJson = userGists.map<String, dynamic>(
+      (user, gistId) => MapEntry(
+        user,
+        userGistChains[user] == null
+            ? gistId
+            : {'gist_id': gistId, 'chain': userGistChains[user]},
+      ),
+    );
+    return encodeGistDocument({
       'user_screen_name': userName,
-      if (userGists.isNotEmpty) 'user_gists': userGists,
+      if (userGists.isNotEmpty) 'user_gists': userGistsJson,
+      if (userGistLoads.isNotEmpty) 'user_gist_loads': userGistLoads,
       if (keywordGists.isNotEmpty) 'keyword_gists': keywordGists,
       'tweets': items.map((item) => item.toMasterJson()).toList(),
     });
   }
 
-  /// バッチGist内の対象ユーザーのツイートを更新した全体JSONを返す
-  Future<String> buildUserBatchGistJson(
+  /// バッチGist内の対象ユーザーのツイートを更新し、書き込むファイル（ファイル名 -> 内容）を返す。
+  /// sharded 形式ならそのユーザーのファイルと索引（data.json）だけ、従来形式なら data.json 全体。
+  /// 追記セグメントはユーザーのファイルに畳み込んで削除する。内容 null はファイル削除を表す
+  Future<Map<String, String?>> buildUserBatchGistFiles(
     String gistId,
     String username,
     List<TweetItem> remainingItems, {
@@ -220,15 +341,28 @@ class GalleryRepository {
     if (response.statusCode != 200) {
       throw Exception('Failed to fetch batch gist ($gistId)');
     }
-    final data =
-        json.decode(utf8.decode(response.bodyBytes)) as Map<String, dynamic>;
+    final data = decodeGistDocument(utf8.decode(response.bodyBytes));
     final users = (data['users'] as Map<String, dynamic>?) ?? {};
+    final files = <String, String?>{};
+    final userData = users[username] as Map<String, dynamic>?;
+    final oldFiles = _entryFiles(userData);
+    final shardFile = oldFiles.isEmpty
+        ? null
+        : (userData!['file'] as String? ?? 'user-$username.json');
+    for (final f in oldFiles) {
+      files[f] = null;
+    }
+    final tweetsJson = remainingItems.map((item) => item.toJson()).toList();
     if (remainingItems.isEmpty) {
       users.remove(username);
+    } else if (shardFile != null) {
+      users[username] = {'file': shardFile, 'count': tweetsJson.length};
+      files[shardFile] = encodeGistDocument({
+        'user': username,
+        'tweets': tweetsJson,
+      });
     } else {
-      users[username] = {
-        'tweets': remainingItems.map((item) => item.toJson()).toList(),
-      };
+      users[username] = {'tweets': tweetsJson};
     }
     data['users'] = users;
 
@@ -241,11 +375,14 @@ class GalleryRepository {
       data['deleted_ids'] = existingDeleted.toList();
     }
 
-    return json.encode(data);
+    files['data.json'] = encodeGistDocument(data);
+    return files;
   }
 
-  /// キーワード子Gistから選択したツイートを削除し、deleted_idsに追加したJSONを返す
-  Future<String> buildKeywordChildGistJsonAfterDelete(
+  /// キーワード子Gistから選択したツイートを削除し、deleted_idsに追加して、
+  /// 書き込むファイル（ファイル名 -> 内容、null は削除）を返す。
+  /// sharded のユーザーは削除対象を含む場合だけ、セグメントを畳み込んだファイルに書き直す
+  Future<Map<String, String?>> buildKeywordChildGistFilesAfterDelete(
     String gistId,
     Set<String> deletedIds,
   ) async {
@@ -257,22 +394,40 @@ class GalleryRepository {
     if (response.statusCode != 200) {
       throw Exception('Failed to fetch keyword gist ($gistId)');
     }
-    final data =
-        json.decode(utf8.decode(response.bodyBytes)) as Map<String, dynamic>;
+    final data = decodeGistDocument(utf8.decode(response.bodyBytes));
 
     // users 内の各ユーザーから対象ツイートを削除
     final users = (data['users'] as Map<String, dynamic>?) ?? {};
+    final files = <String, String?>{};
     final usersToRemove = <String>[];
     for (final entry in users.entries) {
       final userData = entry.value as Map<String, dynamic>;
-      final tweets = (userData['tweets'] as List?) ?? [];
+      final tweets = await _loadUserEntryJson(
+        gistId,
+        userData,
+        snowflakeOrder: data['order'] == 'snowflake',
+      );
       final remaining = tweets
-          .where(
-            (t) => !deletedIds.contains((t as Map<String, dynamic>)['id_str']),
-          )
+          .where((t) => !deletedIds.contains(t['id_str']))
           .toList();
+      if (remaining.length == tweets.length) continue;
+      final oldFiles = _entryFiles(userData);
+      for (final f in oldFiles) {
+        files[f] = null;
+      }
       if (remaining.isEmpty) {
         usersToRemove.add(entry.key);
+      } else if (oldFiles.isNotEmpty) {
+        final shardFile =
+            userData['file'] as String? ?? 'user-${entry.key}.json';
+        userData
+          ..remove('segments')
+          ..['file'] = shardFile
+          ..['count'] = remaining.length;
+        files[shardFile] = encodeGistDocument({
+          'user': entry.key,
+          'tweets': remaining,
+        });
       } else {
         userData['tweets'] = remaining;
       }
@@ -289,7 +444,8 @@ class GalleryRepository {
     existingDeleted.addAll(deletedIds);
     data['deleted_ids'] = existingDeleted.toList();
 
-    return json.encode(data);
+    files['data.json'] = encodeGistDocument(data);
+    return files;
   }
 
   // --- SharedPreferences ヘルパー ---
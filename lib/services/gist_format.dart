@@ -0,0 +1,122 @@
+import 'dart:convert';
+
+/// Gist に保存する JSON のワイヤーフォーマット（scripts/gist_format.py と同じ）。
+///
+/// schema 2（コンパクト形式）では
+/// - post_url が https://x.com/<user>/status/<id_str> と一致するツイートは post_url を省く
+/// - media_urls の共通プレフィックスを省き、文書の media_prefix に1回だけ書く
+/// schema の無い文書は従来形式としてそのまま扱う。
+const int gistSchemaVersion = 2;
+const String gistMediaPrefix = 'https://pbs.twimg.com/media/';
+
+String _postUrlFor(String user, String idStr) =>
+    'https://x.com/$user/status/$idStr';
+
+Map<String, dynamic> _packTweet(
+  Map<String, dynamic> tweet,
+  String? user,
+  String prefix,
+) {
+  final packed = Map<String, dynamic>.from(tweet);
+  final urls = packed['media_urls'] as List?;
+  if (urls != null && urls.isNotEmpty) {
+    packed['media_urls'] = urls
+        .map((u) => (u as String).startsWith(prefix)
+            ? u.substring(prefix.length)
+            : u)
+        .toList();
+  }
+  final idStr = packed['id_str'] as String?;
+  if (user != null && idStr != null && idStr.isNotEmpty) {
+    final name = packed['username'] as String? ?? user;
+    final postUrl = packed['post_url'] as String?;
+    if (postUrl == _postUrlFor(name, idStr)) {
+      packed.remove('post_url');
+    } else if (postUrl == null || postUrl.isEmpty) {
+      packed['post_url'] = '';
+    }
+  }
+  return packed;
+}
+
+Map<String, dynamic> _unpackTweet(
+  Map<String, dynamic> tweet,
+  String? user,
+  String prefix,
+) {
+  final urls = tweet['media_urls'] as List?;
+  if (urls != null && urls.isNotEmpty) {
+    tweet['media_urls'] = urls
+        .map((u) =>
+            (u as String).isEmpty || u.contains('://') ? u : '$prefix$u')
+        .toList();
+  }
+  final idStr = tweet['id_str'] as String?;
+  if (user != null &&
+      idStr != null &&
+      idStr.isNotEmpty &&
+      !tweet.containsKey('post_url')) {
+    tweet['post_url'] = _postUrlFor(tweet['username'] as String? ?? user, idStr);
+  }
+  return tweet;
+}
+
+/// 直下の tweets（ユーザーは文書の user）と users.<user>.tweets に convert を適用する
+Map<String, dynamic> _mapTweets(
+  Map<String, dynamic> data,
+  Map<String, dynamic> Function(Map<String, dynamic>, String?, String) convert,
+  String prefix,
+) {
+  final doc = Map<String, dynamic>.from(data);
+  final tweets = doc['tweets'];
+  if (tweets is List) {
+    doc['tweets'] = tweets
+        .map((t) => convert(t as Map<String, dynamic>, doc['user'], prefix))
+        .toList();
+  }
+  final users = doc['users'];
+  if (users is Map<String, dynamic>) {
+    doc['users'] = users.map((user, entry) {
+      if (entry is Map<String, dynamic> && entry['tweets'] is List) {
+        return MapEntry(user, {
+          ...entry,
+          'tweets': (entry['tweets'] as List)
+              .map((t) => convert(t as Map<String, dynamic>, user, prefix))
+              .toList(),
+        });
+      }
+      return MapEntry(user, entry);
+    });
+  }
+  return doc;
+}
+
+/// schema 2 の文書を従来形式に戻す（schema の無い文書はそのまま）
+Map<String, dynamic> unpackGistDocument(Map<String, dynamic> data) {
+  if (!data.containsKey('schema')) return data;
+  final schema = data['schema'];
+  if (schema is! int || schema > gistSchemaVersion) {
+    throw Exception('Unsupported Gist schema: $schema');
+  }
+  final prefix = data['media_prefix'] as String? ?? gistMediaPrefix;
+  final doc = Map<String, dynamic>.from(data)
+    ..remove('schema')
+    ..remove('media_prefix');
+  return _mapTweets(doc, _unpackTweet, prefix);
+}
+
+/// Gist のファイル内容を読み、従来形式の JSON を返す
+Map<String, dynamic> decodeGistDocument(String text) =>
+    unpackGistDocument(json.decode(text) as Map<String, dynamic>);
+
+/// ツイートを含む文書を schema 2 の JSON 文字列にする
+String encodeGistDocument(Map<String, dynamic> data) {
+  if (data['tweets'] is! List && data['users'] is! Map) {
+    return json.encode(data);
+  }
+  return json.encode({
+    'schema': gistSchemaVersion,
+    'media_prefix': gistMediaPrefix,
+    ..._mapTweets(data, _packTweet, gistMediaPrefix),
+  });
+}
@@ -130,6 +130,27 @@ class GitHubService {
     return response.statusCode == 200;
   }
 
+  /// Gist の複数ファイルを1回の PATCH で更新する（内容 null のファイルは削除）
+  Future<bool> updateGistFiles({
+    required String gistId,
+    required Map<String, String?> files,
+  }) async {
+    debugPrint('GitHubService: updateGistFiles gistId=$gistId, files=${files.keys.join(', ')}');
+    final url = Uri.parse('https://api.github.com/gists/$gistId');
+    final response = await http.patch(
+      url,
+      headers: _headers,
+      body: jsonEncode({
+        'files': files.map(
+          (name, content) =>
+              MapEntry(name, content == null ? null : {'content': content}),
+        ),
+      }),
+    );
+    debugPrint('GitHubService: updateGistFiles response status=${response.statusCode}');
+    return response.statusCode == 200;
+  }
+
   /// append_gist.yml をトリガーする（user と hashtag は排他）
   Future<bool> triggerAppendGistWorkflow({
     required String gistId,
@@ -88,6 +88,11 @@ class GalleryViewModel extends ChangeNotifier {
   Map<String, String> _userGists = {};
   Map<String, String> get userGists => _userGists;
 
+  // username -> 封印済みの古いGist（新しい順）。必要になったときだけ取得する
+  Map<String, List<Map<String, dynamic>>> _userGistChains = {};
+  // gist_id -> 配置用の要約（マスターを書き戻すときに保持する）
+  Map<String, dynamic> _userGistLoads = {};
+
   Map<String, String> _characterGists = {};
   Map<String, String> get characterGists => _characterGists;
 
@@ -200,6 +205,8 @@ class GalleryViewModel extends ChangeNotifier {
       _items = data.items;
       _userName = data.userName;
       _userGists = data.userGists;
+      _userGistChains = data.userGistChains;
+      _userGistLoads = data.userGistLoads;
       _favoriteUsers = await _repository.loadFavoriteUsers();
       _status = GalleryStatus.authenticated;
       _errorMessage = '';
@@ -230,6 +237,16 @@ class GalleryViewModel extends ChangeNotifier {
     }).toList();
   }
 
+  /// ユーザーの封印済みの古いGistの数
+  int olderUserSegmentCount(String username) =>
+      _userGistChains[username]?.length ?? 0;
+
+  /// 封印済みの古いGist（index 番目、0 が最も新しい）からポストを取得
+  Future<List<TweetItem>> fetchOlderUserItems(String username, int index) {
+    final gistId = _userGistChains[username]![index]['gist_id'] as String;
+    return _repository.fetchUserGist(gistId, username);
+  }
+
   /// キャラクターGistからポストを取得
   Future<List<TweetItem>> fetchCharacterItems(String charName) async {
     final gistId = _characterGists[charName];
@@ -579,17 +596,16 @@ class GalleryViewModel extends ChangeNotifier {
   Future<int?> _deleteSelectedFromGist({
     required String gistId,
     required List<TweetItem> currentItems,
-    required Future<String> Function() buildJson,
+    required Future<Map<String, String?>> Function() buildFiles,
   }) async {
     final remainingCount = currentItems
         .where((item) => !_selectedIds.contains(item.id))
         .length;
     try {
-      final jsonStr = await buildJson();
-      final success = await _githubService.updateGistFile(
+      final files = await buildFiles();
+      final success = await _githubService.updateGistFiles(
         gistId: gistId,
-        filename: 'data.json',
-        content: jsonStr,
+        files: files,
       );
       if (success) {
         _selectedIds.clear();
@@ -618,7 +634,7 @@ class GalleryViewModel extends ChangeNotifier {
     return _deleteSelectedFromGist(
       gistId: gistId,
       currentItems: currentItems,
-      buildJson: () => _repository.buildUserBatchGistJson(
+      buildFiles: () => _repository.buildUserBatchGistFiles(
         gistId,
         username,
         remainingItems,
@@ -635,7 +651,7 @@ class GalleryViewModel extends ChangeNotifier {
     return _deleteSelectedFromGist(
       gistId: gistId,
       currentItems: currentItems,
-      buildJson: () => _repository.buildKeywordChildGistJsonAfterDelete(
+      buildFiles: () => _repository.buildKeywordChildGistFilesAfterDelete(
         gistId,
         _selectedIds,
       ),
@@ -709,6 +725,7 @@ class GalleryViewModel extends ChangeNotifier {
     if (masterGistId.isEmpty) return;
 
     _userGists = Map.from(_userGists)..remove(username);
+    _userGistChains = Map.from(_userGistChains)..remove(username);
     _items = _items.where((item) {
       final key =
           item.username ??
@@ -721,6 +738,8 @@ class GalleryViewModel extends ChangeNotifier {
       _items,
       userName: _userName,
       userGists: _userGists,
+      userGistChains: _userGistChains,
+      userGistLoads: _userGistLoads,
     );
     await _githubService.updateGistFile(
       gistId: masterGistId,
@@ -5,19 +5,32 @@
       {user_screen_name, user_gists:{user:gist_id}, tweets:[代表1件ずつ]}
   - ユーザGist（子）は multi-user 形式:
       {users: {user: {tweets:[]}}}
+    追記時はユーザーごとのファイル（user-<user>.json）に分けた sharded 形式で保存する（gist_layout.py）
 """
+import asyncio
 import json
 import os
 import re
 import shutil
 import sys
 import argparse
-import subprocess
+from datetime import date, timedelta
 import tempfile
 
+# extract_media.py / extract_foryou.py をプロセス内で呼び出す
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from skip_index import SkipIdIndex, write_skip_ids_file
+from gist_store import get_store, dump_json
+from gist_format import write_schema
+from gist_layout import (
+    UserGist, GIST_MAX_TWEETS, GIST_MAX_FILES, SEGMENT_MAX_FILES, SNOWFLAKE_ORDER, read_document, load_many,
+    merge_tweet_lists, snowflake_id, sealed_segment, chain_user_entry, chain_max_id,
+)
+from gist_placement import choose_gist, gist_summary, tweets_size
+
 DATA_DIR = "data"
-TWEETS_JS = os.path.join(DATA_DIR, "tweets.js")
-GIST_MAX_TWEETS = 2000  # 移動先Gistの上限
+PLACEMENT_MAX_LOADS = 4  # 要約（user_gist_loads）の無い head Gist を配置のために読む上限
+CHAIN_SEAL_MIN_TWEETS = GIST_MAX_TWEETS // 4  # 上限超過時、ユーザー単独でこれ以上あれば古いポストを封印する
 USER_PATTERN = re.compile(r"^@([^:]+):")
 
 def parse_args():
@@ -29,10 +42,23 @@ def parse_args():
     parser.add_argument("-n", "--num", type=int, default=100, help=f"最大取得件数（上限{GIST_MAX_TWEETS}）")
     parser.add_argument("--hashtag", type=str, default=None, help="キーワード検索（ハッシュタグ or 一般キーワード）")
     parser.add_argument("-s", "--stop-on-existing", action="store_true", help="既存IDに当たったら停止")
+    parser.add_argument("--stop-mode", choices=["ordered", "snowflake"], default="ordered",
+                        help="ordered: 既知IDの連続一致で停止 / snowflake: 既知の最新IDより古いポストで停止")
+    parser.add_argument("--since", type=str, default=None,
+                        help="キーワードの期間分割バックフィル開始日（YYYY-MM-DD）。指定時は -n が期間ごとの上限になる")
+    parser.add_argument("--until", type=str, default=None, help="期間分割バックフィルの終了日（YYYY-MM-DD、含まない。省略時は明日）")
+    parser.add_argument("--window-days", type=int, default=7, help="期間分割の日数")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="期間分割時に同時にスクロールするページ数")
+    parser.add_argument("--no-worker", action="store_true",
+                        help="常駐ワーカー（extract_worker.py）が起動していても使わず、自前でブラウザを起動する")
     parser.add_argument("--force-empty", action="store_true", help="Gistが0件でも強制続行")
     parser.add_argument("-p", "--promote-gist-id", default=None,
                         help="移動先Gist IDを手動指定")
+    parser.add_argument("--no-segments", action="store_true",
+                        help="新規分をセグメントファイルとして追記せず、ユーザーのファイルを丸ごと書き直す")
     args = parser.parse_args()
+    if args.since and not args.hashtag:
+        parser.error("--since は --hashtag と組み合わせて使います。")
     if args.num > GIST_MAX_TWEETS:
         print(f"⚠️  --num {args.num} exceeds limit. Capping at {GIST_MAX_TWEETS}.")
         args.num = GIST_MAX_TWEETS
@@ -74,7 +100,9 @@ def get_gist_id_from_entry(entry):
     return entry  # legacy string format
 
 def get_user_tweets(data, user):
-    """データからユーザのツイートを取得"""
+    """データからユーザのツイートを取得（UserGist なら shard ファイルから読む）"""
+    if isinstance(data, UserGist):
+        return data.tweets(user)
     if is_master_gist_format(data):
         if not user:
             return data.get("tweets", [])
@@ -99,49 +127,74 @@ def _tweet_belongs_to_user(tweet, user):
 # Gist 取得
 # ---------------------------------------------------------------------------
 
+def fetch_user_gist(gist_id, max_segments=SEGMENT_MAX_FILES):
+    try:
+        return UserGist.load(gist_id, max_segments=max_segments)
+    except RuntimeError as e:
+        print(f"❌ Failed to fetch Gist data: {e}")
+        sys.exit(1)
+
 def fetch_gist_data(gist_id):
     try:
-        result = subprocess.run(
-            ["gh", "api", f"gists/{gist_id}"],
-            capture_output=True, text=True, check=True,
-        )
-        gist_meta = json.loads(result.stdout)
-    except Exception as e:
-        print(f"❌ Failed to fetch Gist metadata: {e}")
+        return read_document(gist_id)
+    except RuntimeError as e:
+        print(f"❌ Failed to fetch Gist data: {e}")
         sys.exit(1)
-    candidate_files = ["data.json", "gallary_data.json"]
-    files = gist_meta.get("files", {})
-    for filename in candidate_files:
-        if filename not in files:
-            continue
-        raw_url = files[filename].get("raw_url")
-        if not raw_url:
-            continue
-        try:
-            dl = subprocess.run(
-                ["curl", "-sf", "-L", raw_url],
-                capture_output=True, text=True,
-            )
-            if dl.returncode == 0:
-                return filename, json.loads(dl.stdout)
-        except Exception:
-            pass
-    print("❌ No valid data found in Gist.")
-    sys.exit(1)
-
-def select_promote_gist_from_master(full_data):
-    """user_gists に登録されているGistのうち最後に追加されたIDを返す"""
-    user_gists = full_data.get("user_gists", {})
-    if not user_gists:
-        return None
-    seen = set()
-    unique_gists = []
-    for entry in user_gists.values():
-        gist_id = get_gist_id_from_entry(entry)
-        if gist_id and gist_id not in seen:
-            unique_gists.append(gist_id)
-            seen.add(gist_id)
-    return unique_gists[-1] if unique_gists else None
+
+def save_gist_data(gist_id, filename, data):
+    try:
+        get_store().write(gist_id, filename, data)
+    except RuntimeError as e:
+        print(f"❌ Failed to update Gist: {e}")
+        sys.exit(1)
+
+def save_gist_batch(writes):
+    """{gist_id: {ファイル名: 内容}} を並列に書き込み、Gist ごとの送信量を表示する。
+    1件でも失敗したら（マスターを書き換える前に）終了する。"""
+    if not writes:
+        return
+    print(f"☁️ Batch Updating {len(writes)} Gist(s)...")
+    results = get_store().write_many(writes)
+    failed = []
+    for g_id, (sent, error) in results.items():
+        if error:
+            failed.append(g_id)
+            print(f"  ❌ {g_id}: {error}")
+        else:
+            print(f"  ✅ {g_id}: {sent / 1024:.1f} KB")
+    print(f"📦 Uploaded {sum(sent for sent, _ in results.values()) / 1024:.1f} KB to {len(results) - len(failed)} Gist(s)")
+    if failed:
+        print(f"❌ Failed to update {len(failed)} Gist(s).")
+        sys.exit(1)
+
+def select_promote_gist(full_data, tweets, gist_cache, max_segments=SEGMENT_MAX_FILES):
+    """新規ユーザーの配置先を選ぶ（gist_placement のビンパッキング）。
+    head Gist の負荷はマスターの user_gist_loads（読み込み済みの Gist はその場の値）を使い、
+    要約の無い Gist は新しいものから PLACEMENT_MAX_LOADS 件だけ読む（読んだ Gist は gist_cache で使い回す）。
+    見込みサイズが収まる最も空きの少ない Gist の ID を返し、どこにも収まらなければ None（新しい Gist を作る）。"""
+    head_ids = list(dict.fromkeys(
+        get_gist_id_from_entry(entry) for entry in full_data.get("user_gists", {}).values()
+        if get_gist_id_from_entry(entry)
+    ))
+    stored = full_data.get("user_gist_loads", {})
+    summaries = {g_id: gist_summary(gist_cache[g_id]) if g_id in gist_cache else stored.get(g_id)
+                 for g_id in head_ids}
+    missing = [g_id for g_id, summary in summaries.items() if summary is None][-PLACEMENT_MAX_LOADS:]
+    for g_id, gist, error in load_many(missing, max_segments=max_segments):
+        if error:
+            print(f"  ⚠️ {g_id}: {error}")
+        else:
+            gist_cache[g_id] = gist
+            summaries[g_id] = gist_summary(gist)
+    summaries = {g_id: summary for g_id, summary in summaries.items() if summary is not None}
+    return choose_gist(summaries, tweets_size(tweets), GIST_MAX_TWEETS)
+
+def updated_gist_loads(master_data, gist_cache):
+    """user_gist_loads を読み込んだ Gist の値で更新し、head でなくなった Gist を除いて返す"""
+    heads = {get_gist_id_from_entry(entry) for entry in master_data.get("user_gists", {}).values()}
+    loads = dict(master_data.get("user_gist_loads", {}))
+    loads.update({g_id: gist_summary(gist) for g_id, gist in gist_cache.items()})
+    return {g_id: summary for g_id, summary in loads.items() if g_id in heads}
 
 def get_existing_ids_ordered(tweets):
     ids = []
@@ -153,69 +206,113 @@ def get_existing_ids_ordered(tweets):
             seen.add(tid)
     return ids
 
-def write_skip_ids_file(ordered_ids):
-    fd, path = tempfile.mkstemp(suffix=".txt", prefix="skip_ids_")
-    with os.fdopen(fd, 'w') as f:
-        for tid in ordered_ids:
-            f.write(tid + "\n")
-    return path
-
-def run_extraction(args, skip_ids_file):
+def build_worker_job(args, known_below=0):
+    """extract_worker.py に送るジョブ（既知IDファイル以外）を組み立てる"""
+    if args.foryou:
+        return {"kind": "foryou", "num": args.num}
+    if args.since:
+        return {
+            "kind": "hashtag_windows", "hashtag": args.hashtag, "num": args.num,
+            "since": args.since, "until": args.until or (date.today() + timedelta(days=1)).isoformat(),
+            "window_days": args.window_days, "concurrency": args.concurrency,
+        }
+    return {
+        "kind": "timeline", "user": args.user, "hashtag": args.hashtag, "num": args.num,
+        "stop_on_existing": args.stop_on_existing, "stop_mode": args.stop_mode,
+        "known_below": str(known_below),
+    }
+
+async def extract_via_worker(args, known_ids, socket_path, known_below=0):
+    """起動中の extract_worker.py にジョブを送り、取得結果を返す（既知IDは一時ファイルで渡す）"""
+    from extract_worker import submit_job
+    fd, skip_ids_file = tempfile.mkstemp(suffix=".bin", prefix="skip_ids_")
+    os.close(fd)
+    extracted = []
+    try:
+        write_skip_ids_file(skip_ids_file, known_ids)
+        job = dict(build_worker_job(args, known_below), skip_ids_file=os.path.abspath(skip_ids_file))
+        print(f"🚀 Running Extraction via worker: {job}")
+        await submit_job(job, socket_path, sink=extracted)
+    except RuntimeError as e:
+        print(f"⚠️ {e} Keeping {len(extracted)} tweets fetched so far.")
+    except (OSError, ValueError) as e:
+        # ワーカーが途中で落ちた（接続リセット・途中で切れた行）場合も取得済み分は残す
+        print(f"⚠️ Worker connection lost ({e}). Keeping {len(extracted)} tweets fetched so far.")
+    finally:
+        os.unlink(skip_ids_file)
+    return extracted
+
+async def extract_new_tweets(args, known_ids, known_below=0):
+    """スクレイパーを実行し、Gist 用に変換済みの新規ツイートを返す。
+    常駐ワーカー（extract_worker.py）が起動していればそちらに任せ、無ければプロセス内で Playwright を起動する。
+    known_ids は既知IDを新しい順に並べたリスト（--stop-on-existing の判定に使う）。
+    known_below は封印済みチェーンの最新ID（これ以下は head に無くても既知として飛ばす）。"""
+    if not args.no_worker:
+        from extract_worker import WORKER_SOCKET, worker_available
+        if await worker_available(WORKER_SOCKET):
+            extracted = await extract_via_worker(args, known_ids, WORKER_SOCKET, known_below)
+            return [t for t in map(convert_extracted_tweet, extracted) if t]
+    # 既知IDはソート済み uint64 の索引にしてから渡す（文字列 set / dict を作らない）
+    skip_ids = SkipIdIndex.from_ids(known_ids)
+    # Playwright は抽出時にだけ必要なので遅延インポート
     if args.foryou:
-        cmd = [
-            sys.executable, "scripts/extract_foryou.py",
-            "-n", str(args.num),
-            "--skip-ids-file", skip_ids_file,
-        ]
+        from extract_foryou import extract_foryou_tweets
+        print(f"🚀 Running Extraction: For you (num={args.num}, known={len(known_ids)})")
+        extracted = await extract_foryou_tweets(num=args.num, skip_ids=skip_ids)
+    elif args.since:
+        from extract_media import extract_hashtag_windows
+        until = args.until or (date.today() + timedelta(days=1)).isoformat()
+        extracted = await extract_hashtag_windows(
+            args.hashtag, args.since, until,
+            window_days=args.window_days,
+            concurrency=args.concurrency,
+            num_per_window=args.num,
+            skip_ids=skip_ids,
+        )
     else:
-        cmd = [
-            sys.executable, "scripts/extract_media.py",
-            "--mode", "post_only",
-            "-n", str(args.num),
-            "--skip-ids-file", skip_ids_file,
-        ]
-        if args.user:
-            cmd.extend(["-u", args.user])
-        if args.hashtag:
-            cmd.extend(["--hashtag", args.hashtag])
-        if args.stop_on_existing:
-            cmd.append("--stop-on-existing")
-    print(f"🚀 Running Extraction: {' '.join(cmd)}")
-    subprocess.run(cmd)
-
-def parse_tweets_js():
-    if not os.path.exists(TWEETS_JS):
-        return []
-    with open(TWEETS_JS, 'r', encoding='utf-8') as f:
-        content = f.read()
-    json_str = re.sub(r'^window\.YTD\.tweets\.part0\s*=\s*', '', content)
-    raw_tweets = json.loads(json_str)
-    converted = []
-    for item in raw_tweets:
-        tweet = item.get('tweet', {})
-        media_list = (
-            tweet.get('extended_entities', {}).get('media', [])
-            or tweet.get('entities', {}).get('media', [])
+        from extract_media import extract_tweets
+        target = f"#{args.hashtag}" if args.hashtag else f"@{args.user}"
+        print(f"🚀 Running Extraction: {target} (num={args.num}, known={len(known_ids)},"
+              f" stop_on_existing={args.stop_on_existing}, stop_mode={args.stop_mode})")
+        extracted = await extract_tweets(
+            user=args.user,
+            hashtag=args.hashtag,
+            num=args.num,
+            skip_ids=skip_ids,
+            stop_on_existing=args.stop_on_existing,
+            stop_mode=args.stop_mode,
+            known_below=known_below,
         )
-        if not media_list:
-            continue
-        media_urls = [m.get('media_url_https', '') for m in media_list if m.get('media_url_https')]
-        if not media_urls:
-            continue
-        post_url = ''
-        for m in media_list:
-            eu = m.get('expanded_url', '')
-            if '/status/' in eu:
-                post_url = re.sub(r'/photo/\d+$', '', eu)
-                break
-        converted.append({
-            'full_text': tweet.get('full_text', ''),
-            'created_at': tweet.get('created_at', ''),
-            'media_urls': media_urls,
-            'id_str': tweet.get('id_str', ''),
-            'post_url': post_url,
-        })
-    return converted
+    return [t for t in map(convert_extracted_tweet, extracted) if t]
+
+def run_extraction(args, known_ids, known_below=0):
+    return asyncio.run(extract_new_tweets(args, known_ids, known_below))
+
+def convert_extracted_tweet(item):
+    """抽出スクリプトの出力1件を Gist 用のツイート dict に変換（画像なしは None）"""
+    tweet = item.get('tweet', {})
+    media_list = (
+        tweet.get('extended_entities', {}).get('media', [])
+        or tweet.get('entities', {}).get('media', [])
+    )
+    if not media_list:
+        return None
+    media_urls = [m.get('media_url_https', '') for m in media_list if m.get('media_url_https')]
+    if not media_urls:
+        return None
+    post_url = ''
+    for m in media_list:
+        eu = m.get('expanded_url', '')
+        if '/status/' in eu:
+            post_url = re.sub(r'/photo/\d+$', '', eu)
+            break
+    return {
+        'full_text': tweet.get('full_text', ''),
+        'created_at': tweet.get('created_at', ''),
+        'media_urls': media_urls,
+        'id_str': tweet.get('id_str', ''),
+        'post_url': post_url,
+    }
 
 def append_tweets(existing_tweets, new_tweets):
     if not new_tweets:
@@ -231,70 +328,71 @@ def append_tweets(existing_tweets, new_tweets):
 # Gist作成・移動 (インメモリ更新)
 # ---------------------------------------------------------------------------
 
-def create_gist_for_user(user, tweets):
-    """新しいユーザGistを作成 (階層構造: users -> user -> tweets)"""
-    data = {"users": {user: {"tweets": tweets}}}
-    # tempdir 内に data.json という名前で作成（gh gist create はファイル名をそのまま使う）
-    tmp_dir = tempfile.mkdtemp()
-    tmp_file = os.path.join(tmp_dir, "data.json")
+def create_gist_for_user(user, tweets, description="Gallery User Data"):
+    """新しいユーザGistを作成 (sharded: data.json の索引 + user-<user>.json)"""
     try:
-        with open(tmp_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        result = subprocess.run(
-            ["gh", "gist", "create", tmp_file, "-d", "Gallery User Data"],
-            capture_output=True, text=True,
-        )
-    finally:
-        if os.path.exists(tmp_file):
-            os.unlink(tmp_file)
-        os.rmdir(tmp_dir)
-    if result.returncode != 0:
-        print(f"❌ Failed: {result.stderr}")
+        return UserGist.create(user, tweets, description)
+    except RuntimeError as e:
+        print(f"❌ Failed: {e}")
         sys.exit(1)
-    return result.stdout.strip().rstrip("/").split("/")[-1]
-
-def update_or_migrate_user_gist_in_memory(promote_gist_id, promote_data, user, merged_tweets, gist_cache):
-    """ユーザGistのデータをメモリ上で更新し、必要なら新規Gistを作成してマイグレーションを行う。"""
-    if not is_multi_user_format(promote_data):
-        print(f"⚠️  Warning: Target Gist {promote_gist_id} is not in multi-user format. Converting...")
-        promote_data = {"users": {}}
-
-    users_data = dict(promote_data.get("users", {}))
-    # 他の全ユーザの全ポスト数を合計
-    current_total = sum(
-        len(u.get("tweets", []))
-        for u_name, u in users_data.items()
-        if u_name != user
-    )
 
-    if current_total + len(merged_tweets) > GIST_MAX_TWEETS:
-        merged_tweets = merged_tweets[:GIST_MAX_TWEETS]
-        print(f"⚠️  Limit reached ({GIST_MAX_TWEETS}). Creating new Gist...")
-        new_id = create_gist_for_user(user, merged_tweets)
-        # 移行元のGistからユーザのデータを削除（メモリ上）
-        if user in users_data:
-            del users_data[user]
-            # 移行元Gistの更新をキューに積む
-            gist_cache[promote_gist_id]["data"] = {"users": users_data}
-            gist_cache[promote_gist_id]["is_modified"] = True
-        return new_id, {"users": {user: {"tweets": merged_tweets}}}
+def seal_user_history(user, merged_tweets, keep):
+    """新しい keep 件を head に残し、それより古いポストを snowflake の範囲ごとに封印済みGistへ移す。
+    (head に残すツイート, 封印したチェーン要素（新しい順）) を返す。封印済みGistは以後書き換えない。"""
+    ordered = merge_tweet_lists([merged_tweets], SNOWFLAKE_ORDER)
+    head, older = ordered[:keep], ordered[keep:]
+    sealed = []
+    for start in range(0, len(older), GIST_MAX_TWEETS):
+        chunk = older[start:start + GIST_MAX_TWEETS]
+        archive = create_gist_for_user(user, chunk, "Gallery User Archive")
+        sealed.append(sealed_segment(archive.gist_id, chunk))
+    return head, sealed
+
+def update_or_migrate_user_gist_in_memory(promote_gist, user, merged_tweets, new_tweets, gist_cache):
+    """ユーザGistのデータをメモリ上で更新し、上限を超える場合は古いポストの封印か新規Gistへの移動を行う。
+    (書き込み先の head の Gist ID, 新しく封印したチェーン要素) を返す
+    （新規Gistは作成時に書き込み済みで、移動先は gist_cache に追加される）。
+    同じ Gist に残る場合は新規分（new_tweets）だけをセグメントとして追記する。"""
+    if not is_multi_user_format(promote_gist.index):
+        print(f"⚠️  Warning: Target Gist {promote_gist.gist_id} is not in multi-user format. Converting...")
+        promote_gist.reset()
+
+    # 他の全ユーザの全ポスト数を合計（shard は読まずに索引の件数を使う）
+    current_total = promote_gist.total_tweets(exclude=user)
+    new_user = user not in promote_gist
+
+    if (current_total + len(merged_tweets) > GIST_MAX_TWEETS
+            or promote_gist.file_count(extra_users=int(new_user)) > GIST_MAX_FILES):
+        print(f"⚠️  Limit reached ({GIST_MAX_TWEETS} tweets / {GIST_MAX_FILES} files).")
+        if len(merged_tweets) >= CHAIN_SEAL_MIN_TWEETS:
+            # 大きいユーザーは古いポストを封印済みGistに移し、head には新規分だけを残す（履歴は捨てない）
+            head, sealed = seal_user_history(user, merged_tweets, keep=len(new_tweets))
+            print(f"🔒 Sealed {sum(seg['count'] for seg in sealed)} older tweets of @{user} into {len(sealed)} Gist(s)")
+            promote_gist.set_tweets(user, head)
+            return promote_gist.gist_id, sealed
+        print("⚠️  Creating new Gist...")
+        new_gist = create_gist_for_user(user, merged_tweets)
+        gist_cache[new_gist.gist_id] = new_gist
+        # 移行元のGistからユーザのデータを削除（メモリ上。保存は最後にまとめて行う）
+        promote_gist.remove_user(user)
+        return new_gist.gist_id, []
 
     # 追記保存（メモリ上）
-    users_data[user] = {"tweets": merged_tweets}
-    updated_data = {"users": users_data}
-    return promote_gist_id, updated_data
+    promote_gist.append(user, new_tweets)
+    return promote_gist.gist_id, []
 
 # ---------------------------------------------------------------------------
 # メイン
 # ---------------------------------------------------------------------------
 
-def process_multi_user_append(master_data, new_tweets, promote_gist_id_override=None):
+def process_multi_user_append(master_data, new_tweets, promote_gist_id_override=None,
+                              max_segments=SEGMENT_MAX_FILES):
     user_groups = group_tweets_by_user(new_tweets)
     user_gists_map = master_data.get("user_gists", {})
     master_tweets = master_data.get("tweets", [])
 
     # Gistの取得結果と更新状態をキャッシュして、最後に一括で書き込む
-    gist_cache = {}  # { gist_id: {"filename": str, "data": dict, "is_modified": bool} }
+    gist_cache = {}  # { gist_id: UserGist }
 
     migrated_count = 0
 
@@ -307,41 +405,37 @@ def process_multi_user_append(master_data, new_tweets, promote_gist_id_override=
         promote_gist_id = (
             promote_gist_id_override
             or get_gist_id_from_entry(user_gists_map.get(user))
-            or select_promote_gist_from_master(master_data)
+            or select_promote_gist(master_data, tweets, gist_cache, max_segments)
         )
         if not promote_gist_id:
-            promote_gist_id = create_gist_for_user(user, [])
+            new_gist = create_gist_for_user(user, [])
+            promote_gist_id = new_gist.gist_id
+            gist_cache[promote_gist_id] = new_gist
 
         # キャッシュから取得、なければフェッチ
-        if promote_gist_id in gist_cache:
-            p_filename = gist_cache[promote_gist_id]["filename"]
-            p_data = gist_cache[promote_gist_id]["data"]
-        else:
-            p_filename, p_data = fetch_gist_data(promote_gist_id)
-            gist_cache[promote_gist_id] = {"filename": p_filename, "data": p_data, "is_modified": False}
+        if promote_gist_id not in gist_cache:
+            gist_cache[promote_gist_id] = fetch_user_gist(promote_gist_id, max_segments)
+        p_gist = gist_cache[promote_gist_id]
 
-        existing = get_user_tweets(p_data, user)
+        # 封印済みの範囲のポストは head に入れない（封印済みGistは書き換えないため）
+        # 抽出時に known_below で飛ばしているので、ここは取りこぼし対策
+        sealed_max = chain_max_id(user_gists_map.get(user))
+        if sealed_max:
+            tweets = [t for t in tweets if snowflake_id(t) > sealed_max]
+
+        existing = get_user_tweets(p_gist, user)
         merged = append_tweets(existing, tweets)
 
         if len(merged) == len(existing):
             continue
 
-        migrated_count += len(merged) - len(existing)
+        added = merged[:len(merged) - len(existing)]  # append_tweets は新規分を先頭に置く
+        migrated_count += len(added)
 
         # メモリ上でデータを更新
-        final_id, updated_data = update_or_migrate_user_gist_in_memory(
-            promote_gist_id, p_data, user, merged, gist_cache,
-        )
+        final_id, sealed = update_or_migrate_user_gist_in_memory(p_gist, user, merged, added, gist_cache)
 
-        # キャッシュを更新し、変更フラグを立てる
-        if final_id not in gist_cache:
-            # 新規Gistが作成された場合。作成時に書き込まれているので is_modified=False
-            gist_cache[final_id] = {"filename": "data.json", "data": updated_data, "is_modified": False}
-        else:
-            gist_cache[final_id]["data"] = updated_data
-            gist_cache[final_id]["is_modified"] = True
-
-        user_gists_map[user] = final_id
+        user_gists_map[user] = chain_user_entry(user_gists_map.get(user), final_id, sealed)
         master_tweets = [t for t in master_tweets if extract_username(t) != user]
         latest = merged[0]
         master_tweets.insert(0, {
@@ -352,20 +446,14 @@ def process_multi_user_append(master_data, new_tweets, promote_gist_id_override=
 
     print(f"📊 Total migrated to user Gists: {migrated_count} tweets")
 
-    # ループ終了後、変更があったGistのみを一括で更新する
-    for g_id, cache_info in gist_cache.items():
-        if cache_info.get("is_modified"):
-            print(f"☁️ Batch Updating Gist ({g_id})...")
-            fd, tmp = tempfile.mkstemp(suffix=".json")
-            try:
-                with os.fdopen(fd, 'w', encoding='utf-8') as f:
-                    json.dump(cache_info["data"], f, ensure_ascii=False, indent=2)
-                subprocess.run(["gh", "gist", "edit", g_id, "-f", cache_info["filename"], tmp])
-            finally:
-                if os.path.exists(tmp):
-                    os.unlink(tmp)
+    # ループ終了後、変更があったGistのみを並列に一括更新する（変更したユーザーのファイルと索引だけ）
+    modified = {g_id: gist for g_id, gist in gist_cache.items() if gist.is_modified}
+    save_gist_batch({g_id: gist.pending_files() for g_id, gist in modified.items()})
+    for gist in modified.values():
+        gist.mark_saved()
 
     master_data["user_gists"] = user_gists_map
+    master_data["user_gist_loads"] = updated_gist_loads(master_data, gist_cache)
     master_data["tweets"] = master_tweets
     return master_data
 
@@ -379,27 +467,21 @@ def process_keyword_mode(args, gist_filename, full_data):
 
     # 子Gistの取得 or 新規準備
     child_gist_id = keyword_gists.get(keyword)
-    child_data = None
-    child_filename = "data.json"
+    max_segments = 0 if args.no_segments else SEGMENT_MAX_FILES
     if child_gist_id:
-        child_filename, child_data = fetch_gist_data(child_gist_id)
-    if child_data is None:
-        child_data = {"users": {}, "deleted_ids": []}
+        child = fetch_user_gist(child_gist_id, max_segments)
+    else:
+        child = UserGist(None, index={"users": {}, "deleted_ids": []}, max_segments=max_segments)
+    # 期間分割バックフィルでは古いポストも混ざるため、読み込み時に ID 順に並べる
+    child.order = SNOWFLAKE_ORDER
 
     # skip_ids 構築（既存ツイート + 削除済みID）
     all_ids = []
-    users_data = child_data.get("users", {})
-    for u_data in users_data.values():
-        all_ids.extend(get_existing_ids_ordered(u_data.get("tweets", [])))
-    all_ids.extend(child_data.get("deleted_ids", []))
-
-    skip_ids_file = write_skip_ids_file(all_ids)
-    try:
-        run_extraction(args, skip_ids_file)
-    finally:
-        os.unlink(skip_ids_file)
+    for user in child.users():
+        all_ids.extend(get_existing_ids_ordered(child.tweets(user)))
+    all_ids.extend(child.index.get("deleted_ids", []))
 
-    new_tweets = parse_tweets_js()
+    new_tweets = run_extraction(args, all_ids)
     if not new_tweets:
         print("✅ No new tweets.")
         sys.exit(0)
@@ -408,44 +490,26 @@ def process_keyword_mode(args, gist_filename, full_data):
     user_groups = group_tweets_by_user(new_tweets)
     added_count = 0
     for user, tweets in user_groups.items():
-        existing = users_data.get(user, {}).get("tweets", [])
-        merged = append_tweets(existing, tweets)
-        users_data[user] = {"tweets": merged}
-        added_count += len(merged) - len(existing)
+        existing_ids = {t.get("id_str") for t in child.tweets(user)}
+        unique_new = [t for t in tweets if t.get("id_str") and t.get("id_str") not in existing_ids]
+        # 新規分だけをセグメントとして追記する
+        child.append(user, unique_new)
+        added_count += len(unique_new)
 
-    child_data["users"] = users_data
     print(f"📊 Total added for '{keyword}': {added_count} tweets")
 
     # 子Gistの保存
-    if child_gist_id:
-        fd, tmp = tempfile.mkstemp(suffix=".json")
-        try:
-            with os.fdopen(fd, 'w', encoding='utf-8') as f:
-                json.dump(child_data, f, ensure_ascii=False, indent=2)
-            subprocess.run(["gh", "gist", "edit", child_gist_id, "-f", child_filename, tmp])
-        finally:
-            if os.path.exists(tmp):
-                os.unlink(tmp)
-    else:
-        # 新規作成
-        tmp_dir = tempfile.mkdtemp()
-        tmp_file = os.path.join(tmp_dir, "data.json")
-        try:
-            with open(tmp_file, 'w', encoding='utf-8') as f:
-                json.dump(child_data, f, ensure_ascii=False, indent=2)
-            result = subprocess.run(
-                ["gh", "gist", "create", tmp_file, "-d", f"Keyword: {keyword}"],
-                capture_output=True, text=True,
-            )
-        finally:
-            if os.path.exists(tmp_file):
-                os.unlink(tmp_file)
-            os.rmdir(tmp_dir)
-        if result.returncode != 0:
-            print(f"❌ Failed to create child Gist: {result.stderr}")
-            sys.exit(1)
-        child_gist_id = result.stdout.strip().rstrip("/").split("/")[-1]
-        print(f"✨ Created child Gist: {child_gist_id}")
+    try:
+        if child_gist_id:
+            sent = child.save()
+            print(f"📦 Uploaded {sent / 1024:.1f} KB to child Gist {child_gist_id}")
+        else:
+            # 新規作成
+            child_gist_id = child.create_remote(f"Keyword: {keyword}")
+            print(f"✨ Created child Gist: {child_gist_id}")
+    except RuntimeError as e:
+        print(f"❌ Failed to update Gist: {e}")
+        sys.exit(1)
 
     # マスター更新: keyword_gists マッピング + 代表ツイート
     keyword_gists[keyword] = child_gist_id
@@ -465,11 +529,16 @@ def process_keyword_mode(args, gist_filename, full_data):
     os.makedirs("assets/data", exist_ok=True)
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(full_data, f, ensure_ascii=False, indent=2)
-    subprocess.run(["gh", "gist", "edit", args.gist_id, "-f", gist_filename, output_file])
+    save_gist_data(args.gist_id, gist_filename, full_data)
     print(f"✅ Keyword Gist updated for '{keyword}'!")
 
 def main():
     args = parse_args()
+    try:
+        write_schema()  # XPG_GIST_SCHEMA の誤りは書き込み前に検出する
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
     gist_filename, full_data = fetch_gist_data(args.gist_id)
 
     # キーワード検索モード
@@ -485,36 +554,33 @@ def main():
         print(f"❌ Error: {args.gist_id} is not a Master Gist.")
         sys.exit(1)
 
-    # skip_ids 作成
+    # skip_ids 作成（封印済みチェーンは head に無いので、最新IDより古いポストを既知扱いにする）
+    known_below = 0
     if args.user and not args.foryou:
-        ug_id = get_gist_id_from_entry(full_data.get("user_gists", {}).get(args.user))
+        entry = full_data.get("user_gists", {}).get(args.user)
+        known_below = chain_max_id(entry)
+        ug_id = get_gist_id_from_entry(entry)
         if ug_id:
-            _, p_data = fetch_gist_data(ug_id)
-            existing = get_user_tweets(p_data, args.user)
+            existing = get_user_tweets(fetch_user_gist(ug_id), args.user)
         else:
             existing = []
-        skip_ids_file = write_skip_ids_file(get_existing_ids_ordered(existing))
+        known_ids = get_existing_ids_ordered(existing)
     else:
-        skip_ids_file = write_skip_ids_file(
-            get_existing_ids_ordered(full_data.get("tweets", []))
-        )
-
-    try:
-        run_extraction(args, skip_ids_file)
-    finally:
-        os.unlink(skip_ids_file)
+        known_ids = get_existing_ids_ordered(full_data.get("tweets", []))
 
-    new_tweets = parse_tweets_js()
+    new_tweets = run_extraction(args, known_ids, known_below)
     if not new_tweets:
         print("✅ No new tweets.")
         sys.exit(0)
 
-    final_output = process_multi_user_append(full_data, new_tweets, args.promote_gist_id)
+    max_segments = 0 if args.no_segments else SEGMENT_MAX_FILES
+    final_output = process_multi_user_append(full_data, new_tweets, args.promote_gist_id, max_segments)
     output_file = "assets/data/data.json"
     os.makedirs("assets/data", exist_ok=True)
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(final_output, f, ensure_ascii=False, indent=2)
-    subprocess.run(["gh", "gist", "edit", args.gist_id, "-f", gist_filename, output_file])
+    # ユーザGistの書き込みが全て成功してからマスター（user_gists）を更新する
+    save_gist_batch({args.gist_id: {gist_filename: dump_json(final_output)}})
     print(f"✅ Master Gist updated!")
 
 if __name__ == "__main__":
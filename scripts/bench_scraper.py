@@ -0,0 +1,271 @@
+"""
+x.com にアクセスせずにスクレイパーのスループットを測るベンチマーク。
+
+  - ローカル HTTP サーバーが合成タイムラインを配信する
+      /timeline/<Operation>                 : article を描画するページ（スクロールで次ページを読み込む）
+      /i/api/graphql/bench/<Operation>      : GraphQL 形式のタイムラインJSON（--latency-ms の遅延つき）
+    ポストは 画像1〜2枚 / リポスト / 引用内の画像のみ / テキストのみ の混在
+  - extract_media（network / dom）と extract_foryou を実際のループのまま走らせ、
+    posts/sec・1ポストあたりの DOM 呼び出し回数・スクロール回数・待機タイムアウト（stall）・ピークメモリを表示する
+
+Usage:
+    python3 scripts/bench_scraper.py
+    python3 scripts/bench_scraper.py --total 2000 --page-size 40 --latency-ms 300 -o data/bench.json
+"""
+import asyncio
+import json
+import os
+import resource
+import sys
+import argparse
+import threading
+import time
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from playwright.async_api import async_playwright
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import extract_media
+import extract_foryou
+from extract_media import scrape_timeline, block_heavy_resources, parse_block_policy, DEFAULT_BLOCK
+from extract_foryou import scrape_foryou
+
+SCENARIOS = ("media-network", "media-dom", "foryou")
+BASE_STATUS_ID = 1_800_000_000_000_000_000
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--total", type=int, default=500, help="タイムライン上のポスト総数")
+    parser.add_argument("--page-size", type=int, default=20, help="1レスポンスあたりのポスト数")
+    parser.add_argument("--latency-ms", type=int, default=150, help="タイムラインJSONの応答遅延")
+    parser.add_argument("--scenarios", nargs="*", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--block", type=str, default=DEFAULT_BLOCK, help="中断するリソース種別（カンマ区切り / none）")
+    parser.add_argument("-o", "--output", default=None, help="結果を JSON で保存するパス")
+    return parser.parse_args()
+
+# ---------------------------------------------------------------------------
+# 合成タイムライン
+# ---------------------------------------------------------------------------
+
+def post_kind(i):
+    """i 番目のポストの種類（photo が大半、残りは抽出対象外の変種）"""
+    return {3: "repost", 6: "quote", 8: "text"}.get(i % 10, "photo")
+
+def expected_photo_posts(total):
+    return sum(1 for i in range(total) if post_kind(i) == "photo")
+
+def build_tweet_result(i):
+    status_id = str(BASE_STATUS_ID - i * 1000)
+    user = f"bench_user{i % 7}"
+    kind = post_kind(i)
+    photos = [{"type": "photo", "media_url_https": f"https://pbs.twimg.com/media/B{i}_{n}.jpg"}
+              for n in range(2 if i % 4 == 0 else 1)]
+    legacy = {
+        "id_str": status_id,
+        "full_text": f"bench post {i}",
+        "created_at": "Wed Oct 10 20:19:24 +0000 2018",
+    }
+    result = {
+        "__typename": "Tweet",
+        "rest_id": status_id,
+        "core": {"user_results": {"result": {"legacy": {"screen_name": user}}}},
+        "legacy": legacy,
+        "bench_kind": kind,
+    }
+    if kind == "photo":
+        legacy["extended_entities"] = {"media": photos}
+    elif kind == "repost":
+        legacy["full_text"] = f"RT @someone: bench post {i}"
+        legacy["retweeted_status_result"] = {"result": {"rest_id": str(int(status_id) - 1)}}
+    elif kind == "quote":
+        result["quoted_status_result"] = {"result": {"legacy": {"extended_entities": {"media": photos}}}}
+    return result
+
+def build_timeline_payload(cursor, total, page_size):
+    start = int(cursor or 0)
+    end = min(total, start + page_size)
+    entries = [{"entryId": f"tweet-{i}", "content": {"itemContent": {"tweet_results": {"result": build_tweet_result(i)}}}}
+               for i in range(start, end)]
+    if end < total:
+        entries.append({"entryId": f"cursor-bottom-{end}",
+                        "content": {"entryType": "TimelineTimelineCursor", "cursorType": "Bottom", "value": str(end)}})
+    return {"data": {"timeline": {"timeline": {"instructions": [{"type": "TimelineAddEntries", "entries": entries}]}}}}
+
+# ページ側: 最初のページを読み込み、下端に近づいたら次ページを取得して article を追加する
+TIMELINE_PAGE = """<!doctype html><html><head><meta charset="utf-8"><style>
+article { height: 600px; border-bottom: 1px solid #ccc; } img { width: 200px; height: 200px; }
+</style></head><body><main id="tl"></main><script>
+const OP = "__OP__";
+let cursor = "0", loading = false, done = false;
+function photos(urls) {
+  return urls.map((u) => `<div data-testid="tweetPhoto"><img src="${u.replace(/\\.(\\w+)$/, '?format=$1&name=small')}"></div>`).join('');
+}
+function render(r) {
+  const l = r.legacy, user = r.core.user_results.result.legacy.screen_name;
+  const media = ((l.extended_entities || {}).media || []).map((m) => m.media_url_https);
+  const quoted = r.quoted_status_result ? r.quoted_status_result.result.legacy.extended_entities.media.map((m) => m.media_url_https) : [];
+  const a = document.createElement('article');
+  a.innerHTML =
+    (r.bench_kind === 'repost' ? '<span data-testid="socialContext">Reposted</span>' : '') +
+    `<a href="/${user}/status/${l.id_str}">${user}</a><time datetime="2018-10-10T20:19:24.000Z"></time>` +
+    `<div data-testid="tweetText">${l.full_text}</div>` + photos(media) +
+    (quoted.length ? `<div data-testid="quotedTweet">${photos(quoted)}</div>` : '');
+  document.getElementById('tl').appendChild(a);
+}
+async function load() {
+  if (loading || done) return;
+  loading = true;
+  const res = await fetch(`/i/api/graphql/bench/${OP}?variables=${encodeURIComponent(JSON.stringify({cursor}))}`);
+  const entries = (await res.json()).data.timeline.timeline.instructions[0].entries;
+  done = true;
+  for (const e of entries) {
+    if (e.content.cursorType === 'Bottom') { cursor = e.content.value; done = false; }
+    else render(e.content.itemContent.tweet_results.result);
+  }
+  loading = false;
+}
+window.addEventListener('scroll', () => {
+  if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 1500) load();
+});
+load();
+</script></body></html>"""
+
+def make_handler(total, page_size, latency_ms):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            op = parts.path.rsplit("/", 1)[-1]
+            if parts.path.startswith("/timeline/"):
+                self._send(200, "text/html; charset=utf-8", TIMELINE_PAGE.replace("__OP__", op).encode("utf-8"))
+            elif parts.path.startswith("/i/api/graphql/"):
+                variables = json.loads(parse_qs(parts.query).get("variables", ["{}"])[0])
+                time.sleep(latency_ms / 1000)
+                payload = build_timeline_payload(variables.get("cursor"), total, page_size)
+                self._send(200, "application/json", json.dumps(payload).encode("utf-8"))
+            else:
+                self._send(404, "text/plain", b"not found")
+
+        def _send(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+def start_server(total, page_size, latency_ms):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(total, page_size, latency_ms))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ---------------------------------------------------------------------------
+# 計測
+# ---------------------------------------------------------------------------
+
+class PageCounters:
+    """ページとの往復（evaluate / wait_for_function）・スクロール・待機タイムアウトを数える"""
+
+    def __init__(self, page):
+        self.dom_calls = 0
+        self.scrolls = 0
+        self.stalls = 0
+        evaluate, wait_for_function, wheel = page.evaluate, page.wait_for_function, page.mouse.wheel
+
+        async def counted_evaluate(*args, **kwargs):
+            self.dom_calls += 1
+            return await evaluate(*args, **kwargs)
+
+        async def counted_wait_for_function(*args, **kwargs):
+            self.dom_calls += 1
+            return await wait_for_function(*args, **kwargs)
+
+        async def counted_wheel(*args, **kwargs):
+            self.scrolls += 1
+            return await wheel(*args, **kwargs)
+
+        page.evaluate = counted_evaluate
+        page.wait_for_function = counted_wait_for_function
+        page.mouse.wheel = counted_wheel
+
+def count_stalls(counters_ref):
+    """wait_for_timeline_update が上限まで待った回数を、実行中のシナリオのカウンタに加算する"""
+    original = extract_media.wait_for_timeline_update
+
+    async def counted(*args, **kwargs):
+        got_update = await original(*args, **kwargs)
+        if not got_update and counters_ref:
+            counters_ref[0].stalls += 1
+        return got_update
+
+    extract_media.wait_for_timeline_update = counted
+    extract_foryou.wait_for_timeline_update = counted
+
+async def bench_scenario(context, base_url, scenario, num, counters_ref):
+    page = await context.new_page()
+    counters = PageCounters(page)
+    counters_ref[:] = [counters]
+    tracemalloc.start()
+    started = time.perf_counter()
+    if scenario == "foryou":
+        tweets = await scrape_foryou(page, num, url=f"{base_url}/timeline/HomeTimeline")
+    else:
+        tweets = await scrape_timeline(page, f"{base_url}/timeline/UserTweets", num,
+                                       source="network" if scenario == "media-network" else "dom")
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await page.close()
+    return {
+        "scenario": scenario,
+        "posts": len(tweets),
+        "seconds": round(elapsed, 3),
+        "posts_per_sec": round(len(tweets) / elapsed, 2) if elapsed else None,
+        "dom_calls": counters.dom_calls,
+        "dom_calls_per_post": round(counters.dom_calls / len(tweets), 3) if tweets else None,
+        "scrolls": counters.scrolls,
+        "stalls": counters.stalls,
+        "py_peak_kb": peak // 1024,
+        "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+async def run():
+    args = parse_args()
+    num = expected_photo_posts(args.total)
+    server = start_server(args.total, args.page_size, args.latency_ms)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"🚀 Bench timeline: {args.total} posts ({num} with photos), page={args.page_size},"
+          f" latency={args.latency_ms}ms | {base_url}")
+
+    counters_ref = []
+    count_stalls(counters_ref)
+    results = []
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context()
+        await block_heavy_resources(context, parse_block_policy(args.block))
+        for scenario in args.scenarios:
+            print(f"\n⏱️ {scenario}")
+            result = await bench_scenario(context, base_url, scenario, num, counters_ref)
+            results.append(result)
+        await browser.close()
+    server.shutdown()
+
+    print("\n📊 Results")
+    print(f"  {'scenario':<14}{'posts':>7}{'sec':>9}{'posts/s':>9}{'dom/post':>10}{'scrolls':>9}{'stalls':>8}{'py peak':>10}")
+    for r in results:
+        print(f"  {r['scenario']:<14}{r['posts']:>7}{r['seconds']:>9}{r['posts_per_sec'] or 0:>9}"
+              f"{r['dom_calls_per_post'] or 0:>10}{r['scrolls']:>9}{r['stalls']:>8}{r['py_peak_kb']:>8}KB")
+        if r["posts"] != num:
+            print(f"  ⚠️ {r['scenario']}: expected {num} posts, got {r['posts']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Saved: {args.output}")
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -12,9 +12,7 @@ import io
 import json
 import os
 import random
-import subprocess
 import sys
-import tempfile
 import time
 
 import cv2
@@ -22,6 +20,11 @@ import numpy as np
 import requests
 from sklearn.metrics.pairwise import cosine_similarity
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gist_store import get_store, DATA_FILENAMES
+from gist_format import write_schema
+from gist_layout import read_user_chain, user_gist_id
+
 # --- InsightFace 初期化 ---
 _face_app = None
 
@@ -57,23 +60,14 @@ def download_image(url: str) -> tuple[np.ndarray | None, int, int]:
 
 
 # --- データ取得 ---
-GIST_RAW_BASE = "https://gist.githubusercontent.com/Yuji-HAMADA"
-
-
 def fetch_json(gist_id: str, filename: str = "data.json") -> dict | None:
-    """Gist raw URL から JSON を取得"""
-    t = int(time.time())
-    url = f"{GIST_RAW_BASE}/{gist_id}/raw/{filename}?t={t}"
-    resp = requests.get(url, timeout=30)
-    if resp.status_code == 200:
-        return resp.json()
-    # フォールバック
-    if filename == "data.json":
-        url2 = f"{GIST_RAW_BASE}/{gist_id}/raw/gallary_data.json?t={t}"
-        resp2 = requests.get(url2, timeout=30)
-        if resp2.status_code == 200:
-            return resp2.json()
-    return None
+    """Gist から JSON を取得（data.json は gallary_data.json にフォールバック）"""
+    filenames = DATA_FILENAMES if filename == "data.json" else (filename,)
+    try:
+        return get_store().read(gist_id, filenames)[1]
+    except RuntimeError as e:
+        print(f"  [WARN] {e}", file=sys.stderr)
+        return None
 
 
 def fetch_favorite_users(fav_gist_id: str) -> list[str]:
@@ -84,17 +78,13 @@ def fetch_favorite_users(fav_gist_id: str) -> list[str]:
     return data.get("favorite_users", [])
 
 
-def fetch_user_tweets(gist_id: str, username: str) -> list[dict]:
-    """子Gistからユーザーのツイートを取得"""
-    data = fetch_json(gist_id)
-    if data is None:
+def fetch_user_tweets(entry, username: str) -> list[dict]:
+    """子Gistからユーザーのツイートを取得（封印済みのチェーンも含む。sharded 形式はそのユーザーのファイルだけを読む）"""
+    try:
+        return read_user_chain(entry, username)
+    except (RuntimeError, ValueError) as e:
+        print(f"  [WARN] {e}", file=sys.stderr)
         return []
-    users = data.get("users", {})
-    if username in users:
-        return users[username].get("tweets", [])
-    if "tweets" in data:
-        return data["tweets"]
-    return []
 
 
 # --- 類似度ソート (nearest-neighbor TSP近似) ---
@@ -179,10 +169,10 @@ def process(
         if len(user_data) >= max_users:
             break
 
-        gist_id = user_gists[username]
+        gist_id = user_gist_id(user_gists[username])
         print(f"\n  [{i+1}/{len(available)}] @{username} (gist: {gist_id[:8]}... | 現在 {len(user_data)}/{max_users} 完了)")
 
-        tweets = fetch_user_tweets(gist_id, username)
+        tweets = fetch_user_tweets(user_gists[username], username)
         if not tweets:
             print(f"    → ツイートなし、スキップ")
             continue
@@ -296,37 +286,15 @@ def process(
 
 def upload_to_gist(data: dict) -> str | None:
     """Secret Gist にアップロードして Gist ID を返す"""
-    with tempfile.NamedTemporaryFile(
-        mode="w", suffix=".json", prefix="vector_gallery_", delete=False
-    ) as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-        tmp_path = f.name
-
+    current_time = time.strftime("%Y/%m/%d-%H:%M:%S")
+    n_users = len(data.get("users", []))
+    n_images = sum(len(u.get("images", [])) for u in data.get("users", []))
+    description = f"Vector Gallery ({n_users} users, {n_images} images) {current_time}-JST"
     try:
-        current_time = time.strftime("%Y/%m/%d-%H:%M:%S")
-        n_users = len(data.get("users", []))
-        n_images = sum(len(u.get("images", [])) for u in data.get("users", []))
-        description = f"Vector Gallery ({n_users} users, {n_images} images) {current_time}-JST"
-
-        result = subprocess.run(
-            [
-                "gh", "gist", "create", tmp_path,
-                "-d", description,
-                # secret gist (no -p flag)
-            ],
-            capture_output=True,
-            text=True,
-        )
-
-        if result.returncode != 0:
-            print(f"  ERROR: gh gist create failed: {result.stderr}", file=sys.stderr)
-            return None
-
-        gist_url = result.stdout.strip()
-        gist_id = gist_url.split("/")[-1]
-        return gist_id
-    finally:
-        os.unlink(tmp_path)
+        return get_store().create("vector_gallery.json", data, description)
+    except RuntimeError as e:
+        print(f"  ERROR: gist create failed: {e}", file=sys.stderr)
+        return None
 
 
 def main():
@@ -345,6 +313,11 @@ def main():
     parser.add_argument("--max-images", type=int, default=10, help="ユーザーあたり画像数上限")
     parser.add_argument("--output", default=None, help="ローカル出力JSONパス（指定時はGist非作成）")
     args = parser.parse_args()
+    try:
+        write_schema()  # XPG_GIST_SCHEMA の誤りは書き込み前に検出する
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
 
     data = process(
         master_gist_id=args.master_gist_id,
@@ -0,0 +1,103 @@
+"""
+ユーザーGist / キーワード子Gist の追記セグメント（seg-<id>.json）をベースファイルに畳み込むスクリプト。
+
+  - append_to_gist.py は新規分だけをセグメントとして追記するため、追記を重ねると読み込み時のファイル数が増える
+  - セグメントの合計サイズが --min-bytes 以上、またはセグメント数が --min-segments 以上のユーザーだけを
+    user-<user>.json に書き直し、セグメントファイルを削除する
+  - 対象はマスターGistの user_gists / keyword_gists から集めるか、-g で直接指定する
+
+Usage:
+    python3 scripts/compact_gist_segments.py -m <master_gist_id> --dry-run
+    python3 scripts/compact_gist_segments.py -g <gist_id> <gist_id> --min-bytes 0
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gist_store import get_store
+from gist_format import write_schema
+from gist_layout import UserGist, read_document
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--master-gist-id", default=None, help="user_gists / keyword_gists を持つマスターGist")
+    parser.add_argument("-g", "--gist-ids", nargs="*", default=[], help="対象のGist IDを直接指定")
+    parser.add_argument("--min-bytes", type=int, default=256 * 1024, help="畳み込むセグメント合計サイズの下限")
+    parser.add_argument("--min-segments", type=int, default=8, help="畳み込むセグメント数の下限")
+    parser.add_argument("--dry-run", action="store_true", help="対象の表示のみ（書き込まない）")
+    args = parser.parse_args()
+    if not args.master_gist_id and not args.gist_ids:
+        parser.error("-m か -g のどちらかを指定してください。")
+    return args
+
+def collect_gist_ids(master_gist_id):
+    """マスターGistが参照するユーザーGist / キーワード子Gist の ID（重複なし・出現順）"""
+    _, data = read_document(master_gist_id)
+    gist_ids = []
+    for mapping in (data.get("user_gists", {}), data.get("keyword_gists", {})):
+        for entry in mapping.values():
+            gist_id = entry.get("gist_id") if isinstance(entry, dict) else entry
+            if gist_id and gist_id not in gist_ids:
+                gist_ids.append(gist_id)
+    return gist_ids
+
+def compact_gist(gist_id, args):
+    """しきい値を超えたユーザーを畳み込み、(対象ユーザー数, 送信バイト数) を返す"""
+    gist = UserGist.load(gist_id)
+    targets = []
+    for user in gist.users():
+        segments = gist.segments(user)
+        if not segments:
+            continue
+        _, seg_bytes = gist.file_sizes(user)
+        if seg_bytes >= args.min_bytes or len(segments) >= args.min_segments:
+            targets.append(user)
+            print(f"  📦 @{user}: {len(segments)} segments, {seg_bytes / 1024:.1f} KB")
+    if not targets or args.dry_run:
+        return len(targets), 0
+    for user in targets:
+        gist.compact(user)
+    return len(targets), gist.save()
+
+def main():
+    args = parse_args()
+    try:
+        write_schema()  # XPG_GIST_SCHEMA の誤りは書き込み前に検出する
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    gist_ids = list(args.gist_ids)
+    if args.master_gist_id:
+        try:
+            gist_ids += [g for g in collect_gist_ids(args.master_gist_id) if g not in gist_ids]
+        except RuntimeError as e:
+            print(f"❌ Failed to fetch master Gist: {e}")
+            sys.exit(1)
+    print(f"🔍 Checking {len(gist_ids)} Gist(s) (min-bytes={args.min_bytes}, min-segments={args.min_segments})")
+
+    compacted_users = 0
+    sent_total = 0
+    failed = []
+    for gist_id in gist_ids:
+        print(f"--- {gist_id} ---")
+        try:
+            users, sent = compact_gist(gist_id, args)
+        except RuntimeError as e:
+            print(f"  ❌ {e}")
+            failed.append(gist_id)
+            continue
+        compacted_users += users
+        sent_total += sent
+
+    print(get_store().cache_report())
+    if args.dry_run:
+        print(f"✅ Dry run: {compacted_users} user(s) would be compacted.")
+    else:
+        print(f"✅ Compacted {compacted_users} user(s), uploaded {sent_total / 1024:.1f} KB.")
+    if failed:
+        print(f"❌ Failed: {len(failed)} Gist(s)")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,108 +1,130 @@
 import asyncio
-import json
 import os
 import sys
 import argparse
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, Error as PlaywrightError
 
 # extract_media.py から必要な関数と定数をインポート
 # (同じディレクトリにあることを前提としています)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from extract_media import extract_tweet_data, AUTH_PATH, DATA_DIR, OUTPUT_FILE
+from skip_index import SkipIdIndex
+from extract_media import (
+    extract_visible_tweets, wait_for_timeline_update, as_skip_index,
+    block_heavy_resources, parse_block_policy, format_block_stats, drain_sink,
+    NdjsonWriter, ndjson_to_tweets_js,
+    AUTH_PATH, DATA_DIR, OUTPUT_FILE, NDJSON_OUTPUT_FILE, INITIAL_WAIT_MS, SCROLL_WAIT_MS, DEFAULT_BLOCK,
+)
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("-n", "--num", type=int, default=100, help="取得する最大件数")
     parser.add_argument("--skip-ids-file", type=str, default="", help="スキップすべきIDのリストが書かれたファイルへのパス")
+    parser.add_argument("--output-format", choices=["ndjson", "js"], default="ndjson",
+                        help="ndjson: 逐次追記（既定） / js: 終了時に tweets.js も生成")
+    parser.add_argument("--block", type=str, default=DEFAULT_BLOCK, help="中断するリソース種別（カンマ区切り / none）")
     return parser.parse_args()
 
 def load_skip_ids(skip_ids_file):
-    """ファイルからスキップすべき既存IDのセットを読み込む"""
-    skip_ids = set()
-    if skip_ids_file and os.path.exists(skip_ids_file):
-        with open(skip_ids_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                tid = line.strip()
-                if tid:
-                    skip_ids.add(tid)
+    """ファイルからスキップすべき既存IDの索引を読み込む（skip_index 形式 or 1行1ID）"""
+    skip_ids = SkipIdIndex.open(skip_ids_file)
+    if skip_ids:
         print(f"✅ Loaded {len(skip_ids)} skip IDs from {skip_ids_file}")
     return skip_ids
 
+async def scrape_foryou(page, num, skip_ids=(), url="https://x.com/home", sink=None):
+    """1つのページで "For you" をスクロールし、新規ツイートを sink（省略時は list）に追加して返す"""
+    seen_ids_in_gist = as_skip_index(skip_ids)
+    new_tweets = sink if sink is not None else []
+
+    await page.goto(url, wait_until="domcontentloaded")
+    # タイムラインの初期ロード待機（読み込まれ次第すぐに開始）
+    await wait_for_timeline_update(page, INITIAL_WAIT_MS)
+
+    current_run_ids = set() # 今回の実行内で重複を防ぐ用
+    stop_scraping = False
+    no_new_data_count = 0
+    idle_count = 0
+
+    while len(new_tweets) < num and not stop_scraping:
+        added_in_this_scroll = 0
+        for data in await extract_visible_tweets(page):
+            data.pop("pinned", None)
+            tid = data["tweet"]["id_str"]
+
+            # 重複チェック: 既存リスト（Masterの代表ポストなど）にあるならスキップ
+            if tid in seen_ids_in_gist:
+                continue
+
+            # 重複チェック: 今回すでに取得済みならスキップ
+            if tid in current_run_ids: continue
+
+            current_run_ids.add(tid)
+            new_tweets.append(data)
+            added_in_this_scroll += 1
+            print(f"  [{len(new_tweets)}] Saved: @{tid}")
+
+            if len(new_tweets) >= num:
+                stop_scraping = True
+                break
+
+        if stop_scraping: break
+
+        # スクロール（新しい article かレスポンスが来るまで待機）
+        await drain_sink(new_tweets)
+        await page.mouse.wheel(0, 2000)
+        got_update = await wait_for_timeline_update(page, SCROLL_WAIT_MS)
+
+        # 何も読み込まれない（読み込まれても新規が増えない）場合の無限ループ防止
+        if added_in_this_scroll == 0:
+            idle_count += 1
+            if not got_update:
+                no_new_data_count += 1
+            if no_new_data_count > 5 or idle_count > 20:
+                print("⚠️ No new tweets found after scrolling multiple times. Stopping.")
+                break
+        else:
+            no_new_data_count = idle_count = 0
+    return new_tweets
+
+async def extract_foryou_tweets(num=100, skip_ids=(), block=DEFAULT_BLOCK, auth_path=AUTH_PATH,
+                                url="https://x.com/home", sink=None):
+    """プロセス内から呼び出す抽出API。"For you" の新規ツイートを sink に追加して返す。
+    途中でタイムアウト等が起きた場合もそれまでに取得した分を返す。"""
+    new_tweets = sink if sink is not None else []
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context(storage_state=auth_path) if auth_path else await browser.new_context()
+        block_stats = await block_heavy_resources(context, parse_block_policy(block))
+        page = await context.new_page()
+        try:
+            await scrape_foryou(page, num, skip_ids=skip_ids, url=url, sink=new_tweets)
+        except PlaywrightError as e:
+            print(f"⚠️ Extraction aborted after {len(new_tweets)} tweets: {e}")
+        finally:
+            print(format_block_stats(block_stats))
+            await browser.close()
+    return new_tweets
+
 async def run():
     args = parse_args()
     if not os.path.exists(AUTH_PATH):
         print(f"❌ Error: {AUTH_PATH} not found."); return
 
     os.makedirs(DATA_DIR, exist_ok=True)
-    
+
     # 1. 既存データのIDを取得（停止条件用）
     seen_ids_in_gist = load_skip_ids(args.skip_ids_file)
 
-    url = "https://x.com/home"
-    print(f"🚀 Fetching 'For you' tweets from: {url}")
+    print("🚀 Fetching 'For you' tweets from: https://x.com/home")
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=AUTH_PATH)
-        page = await context.new_page()
-        
-        await page.goto(url, wait_until="domcontentloaded")
-        # タイムラインの初期ロード待機
-        await page.wait_for_timeout(5000)
-
-        new_tweets = []
-        current_run_ids = set() # 今回の実行内で重複を防ぐ用
-        stop_scraping = False
-        no_new_data_count = 0
-        
-        while len(new_tweets) < args.num and not stop_scraping:
-            articles = await page.query_selector_all('article')
-            
-            added_in_this_scroll = 0
-            for article in articles:
-                data = await extract_tweet_data(article)
-                if not data: continue
-                
-                tid = data["tweet"]["id_str"]
-                
-                # 重複チェック: 既存リスト（Masterの代表ポストなど）にあるならスキップ
-                if tid in seen_ids_in_gist:
-                    continue
-
-                # 重複チェック: 今回すでに取得済みならスキップ
-                if tid in current_run_ids: continue
-                
-                current_run_ids.add(tid)
-                new_tweets.append(data)
-                added_in_this_scroll += 1
-                print(f"  [{len(new_tweets)}] Saved: @{tid}")
-
-                if len(new_tweets) >= args.num: 
-                    stop_scraping = True
-                    break
-            
-            if stop_scraping: break
-            
-            # スクロール
-            await page.mouse.wheel(0, 2000)
-            await asyncio.sleep(3)
-            
-            # 新しいデータが見つからない場合の無限ループ防止
-            if added_in_this_scroll == 0:
-                no_new_data_count += 1
-                if no_new_data_count > 5:
-                    print("⚠️ No new tweets found after scrolling multiple times. Stopping.")
-                    break
-            else:
-                no_new_data_count = 0
-
-        # 保存 (extract_media.py と同じ形式)
-        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-            f.write("window.YTD.tweets.part0 = ")
-            json.dump(new_tweets if new_tweets else [], f, ensure_ascii=False, indent=2)
-        
-        print(f"\n✅ Done: {len(new_tweets)} new tweets saved locally.")
-        await browser.close()
+    with NdjsonWriter(NDJSON_OUTPUT_FILE) as new_tweets:
+        await extract_foryou_tweets(num=args.num, skip_ids=seen_ids_in_gist, block=args.block, sink=new_tweets)
+
+    # 保存（取得ごとに追記済み。必要なら extract_media.py と同じ tweets.js 形式も生成）
+    if args.output_format == "js":
+        ndjson_to_tweets_js(NDJSON_OUTPUT_FILE, OUTPUT_FILE)
+    print(f"\n✅ Done: {len(new_tweets)} new tweets saved locally.")
 
 if __name__ == "__main__":
     asyncio.run(run())
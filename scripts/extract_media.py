@@ -1,15 +1,40 @@
 import asyncio
+import html
 import json
 import os
 import re
 import argparse
-from urllib.parse import quote
-from playwright.async_api import async_playwright
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import quote, urlsplit, urlunsplit, parse_qs, urlencode
+from playwright.async_api import async_playwright, Error as PlaywrightError
+
+from skip_index import SkipIdIndex
 
 # --- 設定・定数 ---
 DATA_DIR = "data"
 OUTPUT_FILE = os.path.join(DATA_DIR, "tweets.js")
+# 1ツイート1行で逐次追記する出力（途中で落ちても取得済み分は残る）
+NDJSON_OUTPUT_FILE = os.path.join(DATA_DIR, "tweets.ndjson")
 AUTH_PATH = os.path.join(DATA_DIR, "auth.json")
+# 深い取得の途中経過（ページングカーソルと最古の処理済みID）を保存する場所
+CHECKPOINT_DIR = os.path.join(DATA_DIR, "checkpoints")
+# ページが取得する GraphQL タイムライン（ネットワーク取得モードで横取りする）
+# HomeTimeline / HomeLatestTimeline は For you（extract_foryou.py）の待機判定用
+TIMELINE_OPERATIONS = ("UserTweets", "SearchTimeline", "HomeTimeline", "HomeLatestTimeline")
+# 待機の上限（新しい article かタイムラインレスポンスが来た時点で即座に戻る）
+INITIAL_WAIT_MS = 15000
+SCROLL_WAIT_MS = 8000
+# 取得中に中断するリソース種別（img の src 属性は DOM に残るため抽出には影響しない）
+DEFAULT_BLOCK = "image,media,font"
+BLOCKABLE_RESOURCES = ("image", "media", "font", "stylesheet", "tracking")
+TRACKING_URL_PATTERNS = ("/jot/", "client_event", "google-analytics.com", "doubleclick.net", "ads-twitter.com")
+# 中断したリクエストはサイズが分からないため、種別ごとの平均サイズで削減量を見積もる
+ESTIMATED_RESOURCE_BYTES = {"image": 80_000, "media": 400_000, "font": 50_000, "stylesheet": 30_000, "tracking": 2_000}
+# --stop-on-existing の停止判定
+#   ordered  : Gist と同じ順で既知IDが連続したら停止
+#   snowflake: 固定ポスト以外で、既知の最新IDより古いポストが一定数出たら停止（ステータスIDは時系列順）
+STOP_MODES = ("ordered", "snowflake")
+PINNED_WORDS = ("固定", "Pinned")
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -17,55 +42,92 @@ def parse_args():
     parser.add_argument("-u", "--user", type=str, default=None, help="Target user ID (--user または --hashtag のどちらか必須)")
     parser.add_argument("--hashtag", type=str, default=None, help="Target hashtag (#なし)")
     parser.add_argument("--mode", type=str, default="post_only", help="(deprecated, ignored: always post_only)")
-    parser.add_argument("--skip-ids-file", type=str, default=None, help="File with IDs to skip (one per line)")
+    parser.add_argument("--skip-ids-file", type=str, default=None, help="File with IDs to skip (skip_index binary, or one per line)")
     parser.add_argument("--stop-on-existing", action="store_true", help="Stop when hitting a known ID (for user-specific append)")
+    parser.add_argument("--stop-mode", choices=STOP_MODES, default="ordered",
+                        help="ordered: 既知IDの連続一致で停止（既定） / snowflake: 既知の最新IDより古いポストで停止")
+    parser.add_argument("--source", choices=["network", "dom"], default="network",
+                        help="network: GraphQL レスポンスから抽出（既定） / dom: article 要素から抽出")
+    parser.add_argument("--output-format", choices=["ndjson", "js"], default="ndjson",
+                        help=f"ndjson: {NDJSON_OUTPUT_FILE} に逐次追記（既定） / js: 終了時に {OUTPUT_FILE} も生成")
+    parser.add_argument("--checkpoint", type=str, default=None,
+                        help=f"カーソルのチェックポイントを保存するファイル（省略時: {CHECKPOINT_DIR}/<target>.json）")
+    parser.add_argument("--resume", action="store_true",
+                        help="チェックポイントのカーソルから再開する（-n 件ずつ分割して深く遡る用）")
+    parser.add_argument("--since", type=str, default=None, help="期間分割バックフィルの開始日（YYYY-MM-DD、--hashtag 用）")
+    parser.add_argument("--until", type=str, default=None, help="期間分割バックフィルの終了日（YYYY-MM-DD、含まない。省略時は明日）")
+    parser.add_argument("--window-days", type=int, default=7, help="期間分割の日数")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="期間分割時に同時にスクロールするページ数")
+    parser.add_argument("--block", type=str, default=DEFAULT_BLOCK,
+                        help=f"中断するリソース種別（カンマ区切り: {','.join(BLOCKABLE_RESOURCES)} / none）")
     return parser.parse_args()
 
+def build_search_url(hashtag, since=None, until=None):
+    """キーワード検索URL（since / until は YYYY-MM-DD。until は含まない）"""
+    query = f'"{hashtag}"'
+    if since:
+        query += f" since:{since}"
+    if until:
+        query += f" until:{until}"
+    return f"https://x.com/search?q={quote(query)}&f=live"
+
 def build_url(user, hashtag, mode):
     if hashtag:
         # キーワード検索: Latestタブ使用（メディアはコード側でフィルタ）
-        quoted = f'"{hashtag}"'
-        return f"https://x.com/search?q={quote(quoted)}&f=live"
+        return build_search_url(hashtag)
     else:
         # ユーザーはPostsタブを使用（article要素あり、画像なし・リポストはコード側でフィルター）
         return f"https://x.com/{user}"
 
-async def extract_tweet_data(article):
-    """1つのarticle要素からツイート情報を抽出するロジック"""
-    # ステータスIDとユーザー名の取得
-    links = await article.query_selector_all('a[href*="/status/"]')
-    origin_user, origin_status_id = "unknown", ""
-    for link in links:
-        href = await link.get_attribute('href')
-        match = re.search(r'/([^/]+)/status/(\d+)', href)
-        if match:
-            origin_user, origin_status_id = match.group(1), match.group(2)
-            break
-    
+# 処理済み article に付ける属性（スクロールごとに新規挿入分だけを直列化するため）
+PROCESSED_ATTR = "data-xpg-done"
+# 一度でも直列化した article に付ける属性（新規挿入の検知用）
+SEEN_ATTR = "data-xpg-seen"
+
+# 未処理の article を1回の evaluate でプレーンな dict に直列化する。
+# 画像の src が揃った article には処理済み属性を付け、次回以降は対象外にする
+# （遅延ロード中のものは次のスクロールで再取得）。
+SERIALIZE_ARTICLES_JS = """([attr, seenAttr]) => Array.from(document.querySelectorAll(`article:not([${attr}])`)).map((article) => {
+    article.setAttribute(seenAttr, '1');
+    let user = 'unknown', statusId = '';
+    for (const a of article.querySelectorAll('a[href*="/status/"]')) {
+        const m = (a.getAttribute('href') || '').match(/\\/([^/]+)\\/status\\/(\\d+)/);
+        if (m) { user = m[1]; statusId = m[2]; break; }
+    }
+    const social = article.querySelector('[data-testid="socialContext"]');
+    const textEl = article.querySelector('[data-testid="tweetText"]');
+    const timeEl = article.querySelector('time');
+    // 引用ツイート内などの画像は除外
+    const photos = Array.from(article.querySelectorAll('[data-testid="tweetPhoto"] img'))
+        .filter((img) => !img.closest('[data-testid="quotedTweet"]')
+                      && !img.closest('[data-testid="placementTracking"]'))
+        .map((img) => img.getAttribute('src') || '');
+    if (statusId && !photos.includes('')) article.setAttribute(attr, '1');
+    return {
+        user, statusId,
+        socialContext: social ? social.textContent : '',
+        text: textEl ? textEl.innerText : '',
+        timestamp: timeEl ? (timeEl.getAttribute('datetime') || '') : '',
+        photos,
+    };
+})"""
+
+def build_dom_record(raw):
+    """直列化済み article 1件からツイート情報を組み立てるロジック"""
+    origin_user, origin_status_id = raw["user"], raw["statusId"]
     if not origin_status_id: return None
 
-    # テキストとリポスト判定（リポストは除外）
-    inner_text = await article.inner_text()
-    is_repost = any(w in inner_text for w in ["リポスト", "Reposted", "reposted"])
-    if is_repost: return None
+    # リポスト判定（リポストは除外）
+    if any(w in raw["socialContext"] for w in ["リポスト", "Reposted", "reposted"]):
+        return None
 
-    tweet_text_el = await article.query_selector('[data-testid="tweetText"]')
-    raw_text = await tweet_text_el.inner_text() if tweet_text_el else ""
-    full_text = f"@{origin_user}: {raw_text}"
+    full_text = f"@{origin_user}: {raw['text']}"
 
     # メディア抽出
-    images = await article.query_selector_all('[data-testid="tweetPhoto"] img')
     media_urls = []
-    for img in images:
-        # 引用ツイート内などは除外
-        is_excluded = await img.evaluate("""(node) => {
-            return !!node.closest('[data-testid="quotedTweet"]') || 
-                   !!node.closest('[data-testid="placementTracking"]');
-        }""")
-        src = await img.get_attribute('src')
-        if is_excluded or not src or any(sz in src for sz in ["name=120x120", "name=240x240"]):
+    for src in raw["photos"]:
+        if not src or any(sz in src for sz in ["name=120x120", "name=240x240"]):
             continue
-        
         src = src.split('&name=')[0]
         media_urls.append({
             "media_url_https": src,
@@ -75,20 +137,646 @@ async def extract_tweet_data(article):
 
     if not media_urls: return None
 
-    # 時間
-    time_el = await article.query_selector('time')
-    timestamp = await time_el.get_attribute('datetime') if time_el else ""
+    record = {
+        "tweet": {
+            "id_str": origin_status_id,
+            "full_text": full_text,
+            "created_at": raw["timestamp"],
+            "entities": {"media": media_urls},
+            "extended_entities": {"media": media_urls}
+        }
+    }
+    # 固定ポスト（停止判定から除外する。scrape_timeline で取り除かれ出力には残らない）
+    if any(w in raw["socialContext"] for w in PINNED_WORDS):
+        record["pinned"] = True
+    return record
+
+async def extract_visible_tweets(page):
+    """新たに挿入された article からツイート情報を抽出する（ページとの往復は1回のみ）"""
+    raws = await page.evaluate(SERIALIZE_ARTICLES_JS, [PROCESSED_ATTR, SEEN_ATTR])
+    return [data for data in map(build_dom_record, raws) if data]
+
+NEW_ARTICLE_JS = "(seenAttr) => !!document.querySelector(`article:not([${seenAttr}])`)"
+
+async def wait_for_timeline_update(page, timeout_ms, response_event=None):
+    """新しい article の挿入、またはタイムラインレスポンスの完了まで待つ（上限 timeout_ms）。
+    response_event を渡した場合（ネットワーク取得モード）はその取り込み完了を待つ。
+    何も起きずに上限に達した場合は False を返す。"""
+    if response_event is not None:
+        waiters = [asyncio.ensure_future(response_event.wait())]
+    else:
+        waiters = [
+            asyncio.ensure_future(page.wait_for_function(NEW_ARTICLE_JS, arg=SEEN_ATTR, timeout=timeout_ms)),
+            asyncio.ensure_future(page.wait_for_event(
+                "response", predicate=lambda r: is_timeline_response(r.url), timeout=timeout_ms)),
+        ]
+    pending = set(waiters)
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout_ms / 1000
+        while pending:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return False
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if any(t.exception() is None for t in done):
+                return True
+        return False
+    finally:
+        for t in pending:
+            t.cancel()
+
+# ---------------------------------------------------------------------------
+# リソースブロック（画像・動画・フォント等をダウンロードしない）
+# ---------------------------------------------------------------------------
+
+def parse_block_policy(value):
+    kinds = {k.strip() for k in (value or "").split(",") if k.strip()}
+    if kinds & {"none", "off"}:
+        return set()
+    unknown = kinds - set(BLOCKABLE_RESOURCES)
+    if unknown:
+        print(f"⚠️ Unknown resource types ignored: {', '.join(sorted(unknown))}")
+    return kinds & set(BLOCKABLE_RESOURCES)
+
+def _classify_request(request):
+    if any(p in request.url for p in TRACKING_URL_PATTERNS):
+        return "tracking"
+    # 動画セグメントは fetch/xhr で取得されるため URL でも判定する
+    if "video.twimg.com" in request.url:
+        return "media"
+    return request.resource_type
+
+async def block_heavy_resources(context, kinds):
+    """context の全ページに中断ルールを設定し、種別ごとの中断件数を記録する dict を返す"""
+    stats = {}
+    if not kinds:
+        return stats
+
+    async def handle(route):
+        kind = _classify_request(route.request)
+        if kind in kinds:
+            stats[kind] = stats.get(kind, 0) + 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", handle)
+    return stats
+
+def format_block_stats(stats):
+    if not stats:
+        return "🧱 Blocked 0 requests."
+    saved = sum(ESTIMATED_RESOURCE_BYTES.get(k, 0) * n for k, n in stats.items())
+    detail = ", ".join(f"{k}: {n}" for k, n in sorted(stats.items()))
+    return f"🧱 Blocked {sum(stats.values())} requests ({detail}), ~{saved / 1_000_000:.1f} MB saved (est.)"
+
+# ---------------------------------------------------------------------------
+# ネットワーク取得モード（GraphQL タイムラインJSONからの抽出）
+# ---------------------------------------------------------------------------
+
+def is_timeline_response(url):
+    return "/graphql/" in url and any(f"/{op}" in url for op in TIMELINE_OPERATIONS)
+
+def _find_instructions(node):
+    """レスポンス内の timeline.instructions を探す（UserTweets / SearchTimeline でパスが異なるため）"""
+    if isinstance(node, dict):
+        if isinstance(node.get("instructions"), list):
+            return node["instructions"]
+        for value in node.values():
+            found = _find_instructions(value)
+            if found is not None:
+                return found
+    return None
+
+def _find_bottom_cursor(instructions):
+    """instructions から次ページ（古い方向）のカーソルを返す"""
+    for inst in instructions:
+        entries = inst.get("entries") or ([inst["entry"]] if inst.get("entry") else [])
+        for entry in entries:
+            content = entry.get("content", {})
+            if content.get("cursorType") == "Bottom" and content.get("value"):
+                return content["value"]
+    return None
+
+def _iter_tweet_results(instructions):
+    """instructions から (tweet_results.result, 固定ポストか) を出現順に列挙する"""
+    for inst in instructions:
+        pinned = inst.get("type") == "TimelinePinEntry"
+        entries = inst.get("entries") or ([inst["entry"]] if inst.get("entry") else [])
+        for entry in entries:
+            content = entry.get("content", {})
+            item_contents = [content.get("itemContent")]
+            # 会話モジュール（TimelineTimelineModule）は items 配下に入る
+            item_contents += [i.get("item", {}).get("itemContent") for i in content.get("items", [])]
+            for ic in item_contents:
+                result = (ic or {}).get("tweet_results", {}).get("result")
+                if result:
+                    yield result, pinned
+
+def _unwrap_tweet_result(result):
+    if result.get("__typename") == "TweetWithVisibilityResults":
+        return result.get("tweet", {})
+    return result
+
+def _screen_name(result):
+    user = result.get("core", {}).get("user_results", {}).get("result", {})
+    return (user.get("core", {}).get("screen_name")
+            or user.get("legacy", {}).get("screen_name")
+            or "unknown")
+
+def _to_iso_timestamp(created_at):
+    """'Wed Oct 10 20:19:24 +0000 2018' → DOM の time[datetime] と同じ ISO 形式"""
+    try:
+        dt = datetime.strptime(created_at, "%a %b %d %H:%M:%S %z %Y")
+    except (TypeError, ValueError):
+        return created_at or ""
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+def _to_display_media_url(media_url_https):
+    """'.../media/XXX.jpg' → DOM の img[src] と同じ '.../media/XXX?format=jpg' 形式"""
+    m = re.match(r"^(https://pbs\.twimg\.com/media/[^.?]+)\.(\w+)$", media_url_https)
+    if m:
+        return f"{m.group(1)}?format={m.group(2)}"
+    return media_url_https
+
+def _tweet_text(result, legacy):
+    note = result.get("note_tweet", {}).get("note_tweet_results", {}).get("result", {})
+    text = note.get("text") or legacy.get("full_text", "")
+    # 画像の t.co リンクは除去、その他のURLは展開（DOM の tweetText と揃える）
+    for m in legacy.get("entities", {}).get("media", []):
+        text = text.replace(m.get("url", ""), "")
+    for u in legacy.get("entities", {}).get("urls", []):
+        if u.get("url"):
+            text = text.replace(u["url"], u.get("expanded_url", u["url"]))
+    return html.unescape(text).strip()
+
+def build_tweet_record(result):
+    """GraphQL の tweet result を build_dom_record（extract_visible_tweets の DOM 取得）と同じ形式に変換する。
+    呼び出し元はネットワーク取得の parse_timeline_response"""
+    result = _unwrap_tweet_result(result)
+    legacy = result.get("legacy")
+    if not legacy:
+        return None
+    # リポストは除外
+    if legacy.get("retweeted_status_result") or legacy.get("full_text", "").startswith("RT @"):
+        return None
+
+    origin_user = _screen_name(result)
+    origin_status_id = legacy.get("id_str") or result.get("rest_id", "")
+    if not origin_status_id:
+        return None
+
+    media_list = legacy.get("extended_entities", {}).get("media", [])
+    media_urls = []
+    for i, m in enumerate(media_list, start=1):
+        if m.get("type") != "photo" or not m.get("media_url_https"):
+            continue
+        media_urls.append({
+            "media_url_https": _to_display_media_url(m["media_url_https"]),
+            "type": "photo",
+            "expanded_url": f"https://x.com/{origin_user}/status/{origin_status_id}/photo/{i}"
+        })
+    if not media_urls:
+        return None
 
     return {
         "tweet": {
             "id_str": origin_status_id,
-            "full_text": full_text,
-            "created_at": timestamp,
+            "full_text": f"@{origin_user}: {_tweet_text(result, legacy)}",
+            "created_at": _to_iso_timestamp(legacy.get("created_at")),
             "entities": {"media": media_urls},
             "extended_entities": {"media": media_urls}
         }
     }
 
+def parse_timeline_response(payload):
+    """タイムラインJSONからツイートレコードのリストを返す（画像なし・リポストは除外）"""
+    instructions = _find_instructions(payload)
+    if not instructions:
+        return []
+    records = []
+    for result, pinned in _iter_tweet_results(instructions):
+        record = build_tweet_record(result)
+        if record:
+            if pinned:
+                record["pinned"] = True
+            records.append(record)
+    return records
+
+def checkpoint_path_for(user=None, hashtag=None):
+    """ターゲットごとのチェックポイントファイル（例: data/checkpoints/user_foo.json）"""
+    kind = "hashtag" if hashtag else "user"
+    name = re.sub(r'[\\/:*?"<>|\s]+', "_", hashtag or user)
+    return os.path.join(CHECKPOINT_DIR, f"{kind}_{name}.json")
+
+class TimelineCheckpoint:
+    """タイムラインのページングカーソルと最古の処理済みIDを保存し、次回そこから再開する。
+    カーソルはそのページのポストを全て処理し終えた時点でのみ進める（途中で止まった分は再取得される）。"""
+
+    def __init__(self, path, url):
+        self.path = path
+        self.url = url
+        self.cursor = None
+        self.oldest_id = None
+        self.count = 0
+        self.done = False
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get("url") == url:
+                self.cursor = state.get("cursor")
+                self.oldest_id = state.get("oldest_id")
+                self.count = state.get("count", 0)
+                self.done = state.get("done", False)
+
+    def record(self, tid):
+        """処理したポストのIDを記録する（最古のIDだけ保持）"""
+        if self.oldest_id is None or int(tid) < int(self.oldest_id):
+            self.oldest_id = tid
+
+    def advance(self, cursor):
+        self.cursor = cursor
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                "url": self.url,
+                "cursor": self.cursor,
+                "oldest_id": self.oldest_id,
+                "count": self.count,
+                "done": self.done,
+                "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+async def resume_timeline_at(page, cursor):
+    """ページが最初に送るタイムライン GraphQL リクエストの variables.cursor を差し替える"""
+    pending = True
+
+    async def handle(route):
+        nonlocal pending
+        request = route.request
+        if pending and is_timeline_response(request.url):
+            parts = urlsplit(request.url)
+            query = parse_qs(parts.query)
+            if "variables" in query:
+                variables = json.loads(query["variables"][0])
+                variables["cursor"] = cursor
+                query["variables"] = [json.dumps(variables, separators=(",", ":"))]
+                pending = False
+                await route.continue_(url=urlunsplit(parts._replace(query=urlencode(query, doseq=True))))
+                return
+        # 差し替え対象外はコンテキスト側のルート（リソース中断）に渡す
+        await route.fallback()
+
+    await page.route("**/graphql/**", handle)
+
+def as_skip_index(skip_ids):
+    """既知ID（新しい順のリスト or SkipIdIndex）を SkipIdIndex にそろえる"""
+    if isinstance(skip_ids, SkipIdIndex):
+        return skip_ids
+    return SkipIdIndex.from_ids(skip_ids or ())
+
+def load_skip_ids(skip_ids_file):
+    """既知IDファイル（バイナリ索引 or 1行1IDのテキスト）を SkipIdIndex として開く"""
+    return SkipIdIndex.open(skip_ids_file)
+
+class NdjsonWriter:
+    """取得したツイートを1行ずつ追記し、その都度 flush するシンク（list と同じく append / len が使える）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, 'w', encoding='utf-8')
+        self._count = 0
+
+    def append(self, data):
+        self._f.write(json.dumps(data, ensure_ascii=False) + "\n")
+        self._f.flush()
+        self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+async def drain_sink(sink):
+    """sink が drain を持つ（extract_worker の StreamSink）なら送信が追いつくまで待つ"""
+    drain = getattr(sink, "drain", None)
+    if drain is not None:
+        await drain()
+
+def iter_ndjson(path):
+    """NDJSON を1行ずつ読む（強制終了で途中まで書かれた最終行は無視）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+def ndjson_to_tweets_js(ndjson_path, js_path):
+    """NDJSON を tweets.js（window.YTD 形式）に逐次変換する"""
+    with open(js_path, 'w', encoding='utf-8') as f:
+        # 空リスト [] でも書き込むことで、Flutter側のエラーを防ぐ
+        f.write("window.YTD.tweets.part0 = [")
+        for i, data in enumerate(iter_ndjson(ndjson_path)):
+            f.write(",\n" if i else "\n")
+            f.write(json.dumps(data, ensure_ascii=False, indent=2))
+        f.write("\n]")
+
+async def scrape_timeline(page, url, num, skip_ids=None, stop_on_existing=False,
+                          source="network", log_prefix="", sink=None, stop_mode="ordered",
+                          checkpoint=None, resume=False, known_below=0):
+    """1つのページでタイムラインをスクロールし、新規ツイートを sink（省略時は list）に追加して返す。
+    skip_ids は SkipIdIndex（ordered: Gist 内の並び位置 / snowflake: 最新IDで停止を判定する）。
+    known_below（封印済みチェーンの最新ID）以下のポストは skip_ids に無くても既知として扱う。
+    checkpoint（TimelineCheckpoint）を渡すとカーソルを保存し、resume=True ならそこから再開する。"""
+    skip_ids = as_skip_index(skip_ids)
+    # snowflake モード: 既知の最新IDより古いポストが出たら、それ以降は取得済みの履歴
+    newest_known = skip_ids.max_id() if stop_on_existing and stop_mode == "snowflake" else None
+
+    # ネットワーク取得モード: ページ自身が取得するタイムラインJSONを横取りする
+    captured = []
+    timeline_seen = False
+    timeline_updated = asyncio.Event()
+
+    async def on_response(response):
+        nonlocal timeline_seen
+        if not is_timeline_response(response.url):
+            return
+        try:
+            payload = await response.json()
+        except Exception:
+            return
+        timeline_seen = True
+        # レスポンス単位で (ポスト, 次ページのカーソル, 絞り込み前のツイート数) を保持する
+        instructions = _find_instructions(payload) or []
+        captured.append((parse_timeline_response(payload), _find_bottom_cursor(instructions),
+                         sum(1 for _ in _iter_tweet_results(instructions))))
+        timeline_updated.set()
+
+    # 再開: チェックポイントのカーソルから読み込み、処理済み（最古IDより新しい）ポストは飛ばす
+    resume_below = None
+    if checkpoint is not None and resume:
+        if source == "network" and checkpoint.cursor:
+            print(f"{log_prefix}⏩ Resuming from checkpoint ({checkpoint.count} posts so far, oldest {checkpoint.oldest_id}).")
+            await resume_timeline_at(page, checkpoint.cursor)
+            resume_below = int(checkpoint.oldest_id) if checkpoint.oldest_id else None
+        elif source != "network":
+            print(f"{log_prefix}⚠️ --resume needs --source network. Starting from the top.")
+
+    if source == "network":
+        page.on("response", on_response)
+
+    await page.goto(url, wait_until="domcontentloaded")
+    await wait_for_timeline_update(page, INITIAL_WAIT_MS, timeline_updated if source == "network" else None)
+
+    if source == "network" and not timeline_seen:
+        print(f"{log_prefix}⚠️ Timeline response not captured. Falling back to DOM extraction.")
+        page.remove_listener("response", on_response)
+        source = "dom"
+        resume_below = None
+
+    CONSECUTIVE_STOP = 5  # 連続一致でストップする閾値
+    OLDER_STOP = 3  # 既知の最新IDより古い（固定以外の）ポストがこの件数出たらストップ
+    older_count = 0
+    archived_count = 0
+    new_tweets = sink if sink is not None else []
+    seen_ids = set()
+    stall_count = 0
+    MAX_STALLS = 5  # 待機が上限に達した（何も読み込まれなかった）回数
+    idle_count = 0
+    MAX_IDLE_SCROLLS = 20  # 読み込みはあるが新規ポストが増えない回数
+    got_update = True
+    skipped_count = 0
+    hit_existing = False
+    consecutive_count = 0
+    last_gist_index = -1
+    reached_end = False  # 直近のレスポンスがタイムラインの終端（ツイート無し・カーソルが進まない）だった
+    last_cursor = None
+
+    while len(new_tweets) < num and not hit_existing:
+        if source == "network":
+            # 各レスポンスの末尾に (None, カーソル) を挟み、ページを処理し終えたらカーソルを進める
+            candidates = []
+            for records, cursor, raw_count in captured:
+                # 終端かどうかは直近のレスポンスで決める（後のページでカーソルが進めば取り消す）
+                reached_end = not raw_count or not cursor or cursor == last_cursor
+                last_cursor = cursor or last_cursor
+                candidates += [(data, None) for data in records] + [(None, cursor)]
+            del captured[:]
+        else:
+            candidates = [(data, None) for data in await extract_visible_tweets(page)]
+        prev_seen = len(seen_ids)
+        for data, cursor in candidates:
+            if data is None:
+                if checkpoint is not None and cursor:
+                    checkpoint.advance(cursor)
+                continue
+            pinned = data.pop("pinned", False)
+            tid = data["tweet"]["id_str"]
+            if tid in seen_ids: continue
+            seen_ids.add(tid)
+            if resume_below is not None and int(tid) >= resume_below:
+                continue
+            if checkpoint is not None and not pinned:
+                checkpoint.record(tid)
+
+            # 封印済みの範囲: 以降はすべてアーカイブ済みなので、停止モードに関わらず止める
+            if known_below and not pinned and int(tid) <= known_below:
+                skipped_count += 1
+                archived_count += 1
+                if stop_on_existing and archived_count >= OLDER_STOP:
+                    print(f"{log_prefix}🛑 {OLDER_STOP} posts in the sealed archive range. Stopping.")
+                    hit_existing = True
+                    break
+                continue
+
+            if newest_known is not None and not pinned and int(tid) <= newest_known:
+                older_count += 1
+                if older_count >= OLDER_STOP:
+                    print(f"{log_prefix}🛑 {OLDER_STOP} posts older than the newest known ID. Stopping.")
+                    hit_existing = True
+                    break
+
+            if tid in skip_ids:
+                if stop_on_existing and newest_known is None:
+                    gist_idx = skip_ids.position(tid)
+                    if gist_idx >= 0 and last_gist_index >= 0 and gist_idx == last_gist_index + 1:
+                        consecutive_count += 1
+                    else:
+                        consecutive_count = 1
+                    last_gist_index = gist_idx
+                    if consecutive_count >= CONSECUTIVE_STOP:
+                        print(f"{log_prefix}🛑 {CONSECUTIVE_STOP} consecutive existing IDs matched in order. Stopping.")
+                        hit_existing = True
+                        break
+                skipped_count += 1
+                continue
+
+            # 新規ポスト → 連続カウントをリセット
+            consecutive_count = 0
+            last_gist_index = -1
+
+            new_tweets.append(data)
+            if checkpoint is not None:
+                checkpoint.count += 1
+            print(f"  {log_prefix}[{len(new_tweets)}] Saved: @{tid}")
+
+            if len(new_tweets) >= num:
+                break
+
+        if len(new_tweets) >= num or hit_existing: break
+
+        # スクロールしても何も読み込まれなければ終端
+        if len(seen_ids) > prev_seen:
+            stall_count = idle_count = 0
+        else:
+            idle_count += 1
+            stall_count = 0 if got_update else stall_count + 1
+            if stall_count >= MAX_STALLS or idle_count >= MAX_IDLE_SCROLLS:
+                print(f"\n{log_prefix}⚠️ No more posts found after {idle_count} scrolls. Stopping.")
+                # 完了にするのは終端に達したときだけ。読み込みの停滞や DOM 取得での停止は
+                # 保存済みのカーソルから --resume で続けられるようにしておく
+                if checkpoint is not None:
+                    checkpoint.done = reached_end
+                break
+
+        await drain_sink(new_tweets)
+        timeline_updated.clear()
+        await page.mouse.wheel(0, 2000)
+        got_update = await wait_for_timeline_update(
+            page, SCROLL_WAIT_MS, timeline_updated if source == "network" else None)
+
+    if skipped_count:
+        print(f"{log_prefix}⏭️ Skipped {skipped_count} already-known posts.")
+    if checkpoint is not None:
+        checkpoint.done = checkpoint.done or hit_existing
+        checkpoint.save()
+    return new_tweets
+
+def split_date_windows(since, until, window_days=7):
+    """[since, until) を window_days 日ごとの (since, until) に分割する（新しい期間から順に）"""
+    start, end = date.fromisoformat(since), date.fromisoformat(until)
+    windows = []
+    while end > start:
+        w_start = max(start, end - timedelta(days=window_days))
+        windows.append((w_start.isoformat(), end.isoformat()))
+        end = w_start
+    return windows
+
+def merge_by_snowflake(batches):
+    """複数の取得結果を ID で重複除去し、新しい順（snowflake の降順）に並べる"""
+    merged = {}
+    for batch in batches:
+        for data in batch:
+            merged.setdefault(data["tweet"]["id_str"], data)
+    return [merged[tid] for tid in sorted(merged, key=int, reverse=True)]
+
+async def scrape_hashtag_windows(context, hashtag, windows, concurrency=4, num_per_window=100,
+                                 skip_ids=(), source="network"):
+    """期間ごとに別ページを開いて並列に取得し、snowflake ID の降順にマージして返す"""
+    skip_ids = as_skip_index(skip_ids)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def scrape_window(w_since, w_until):
+        label = f"[{w_since}..{w_until}] "
+        tweets = []
+        async with semaphore:
+            page = await context.new_page()
+            try:
+                await scrape_timeline(
+                    page, build_search_url(hashtag, w_since, w_until), num_per_window,
+                    skip_ids=skip_ids, source=source, log_prefix=label, sink=tweets,
+                )
+            except PlaywrightError as e:
+                print(f"⚠️ {label}aborted after {len(tweets)} tweets: {e}")
+            finally:
+                await page.close()
+        return tweets
+
+    batches = await asyncio.gather(*(scrape_window(*w) for w in windows))
+    merged = merge_by_snowflake(batches)
+    print(f"📊 #{hashtag}: {len(merged)} tweets from {len(windows)} windows.")
+    return merged
+
+async def extract_hashtag_windows(hashtag, since, until, window_days=7, concurrency=4, num_per_window=100,
+                                  skip_ids=(), source="network", block=DEFAULT_BLOCK, auth_path=AUTH_PATH):
+    """キーワード検索を since: / until: の期間ごとに分け、別々のページで並列に取得する。
+    結果は snowflake ID の降順にマージして返す。"""
+    windows = split_date_windows(since, until, window_days)
+    print(f"🚀 #{hashtag}: {len(windows)} windows ({since}..{until}, {window_days}d) | Concurrency: {concurrency}")
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context(storage_state=auth_path) if auth_path else await browser.new_context()
+        block_stats = await block_heavy_resources(context, parse_block_policy(block))
+        try:
+            return await scrape_hashtag_windows(
+                context, hashtag, windows,
+                concurrency=concurrency, num_per_window=num_per_window, skip_ids=skip_ids, source=source,
+            )
+        finally:
+            print(format_block_stats(block_stats))
+            await browser.close()
+
+async def extract_tweets(user=None, hashtag=None, num=100, skip_ids=(), stop_on_existing=False,
+                         source="network", block=DEFAULT_BLOCK, auth_path=AUTH_PATH, url=None, sink=None,
+                         stop_mode="ordered", checkpoint_file=None, resume=False, known_below=0):
+    """プロセス内から呼び出す抽出API。新規ツイート（tweets.js と同じ形式の dict）を sink に追加して返す。
+    skip_ids は既知IDを新しい順に並べたもの（--stop-on-existing の連続一致判定にも使う）。
+    known_below 以下のIDは封印済みチェーンにあるものとして既知扱いにする。
+    checkpoint_file を指定するとページングカーソルを保存し、resume=True ならそこから続きを取得する。
+    途中でタイムアウト等が起きた場合もそれまでに取得した分を返す。"""
+    url = url or build_url(user, hashtag, "post_only")
+    checkpoint = TimelineCheckpoint(checkpoint_file, url) if checkpoint_file else None
+    if checkpoint is not None and resume and checkpoint.done:
+        print(f"✅ Checkpoint {checkpoint_file} has reached the end of the timeline. Nothing to resume.")
+        return sink if sink is not None else []
+    skip_ids = as_skip_index(skip_ids)
+    if skip_ids:
+        print(f"⏭️ Skipping {len(skip_ids)} known IDs.")
+    new_tweets = sink if sink is not None else []
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context(storage_state=auth_path) if auth_path else await browser.new_context()
+        block_stats = await block_heavy_resources(context, parse_block_policy(block))
+        page = await context.new_page()
+        try:
+            await scrape_timeline(
+                page, url, num,
+                skip_ids=skip_ids,
+                stop_on_existing=stop_on_existing,
+                stop_mode=stop_mode,
+                source=source,
+                sink=new_tweets,
+                checkpoint=checkpoint,
+                resume=resume,
+                known_below=known_below,
+            )
+        except PlaywrightError as e:
+            print(f"⚠️ Extraction aborted after {len(new_tweets)} tweets: {e}")
+            if checkpoint is not None:
+                checkpoint.save()  # 最後に処理し終えたページのカーソルから再開できる
+        finally:
+            print(format_block_stats(block_stats))
+            await browser.close()
+    return new_tweets
+
 async def run():
     args = parse_args()
     if not args.user and not args.hashtag:
@@ -100,96 +788,43 @@ async def run():
     mode = "post_only"  # 固定
     url = build_url(args.user, args.hashtag, mode)
     target_label = f"#{args.hashtag}" if args.hashtag else f"@{args.user}"
-    print(f"🚀 Mode: {mode} | Target: {target_label} | URL: {url}")
-
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=AUTH_PATH)
-        page = await context.new_page()
-        
-        await page.goto(url, wait_until="domcontentloaded")
-        await page.wait_for_timeout(10000)
-
-        # 既知IDの読み込み（スキップ対象）
-        skip_ids = set()
-        # 順序付きID→インデックスマップ（連続一致判定用）
-        gist_id_index = {}
-        if args.skip_ids_file and os.path.exists(args.skip_ids_file):
-            with open(args.skip_ids_file, 'r') as f:
-                ordered_ids = [line.strip() for line in f if line.strip()]
-            skip_ids = set(ordered_ids)
-            gist_id_index = {tid: i for i, tid in enumerate(ordered_ids)}
-            print(f"⏭️ Skipping {len(skip_ids)} known IDs.")
-
-        CONSECUTIVE_STOP = 5  # 連続一致でストップする閾値
-        new_tweets, seen_ids = [], set()
-        stall_count = 0
-        MAX_STALLS = 5
-        skipped_count = 0
-        hit_existing = False
-        consecutive_count = 0
-        last_gist_index = -1
-
-        while len(new_tweets) < args.num and not hit_existing:
-            articles = await page.query_selector_all('article')
-            prev_seen = len(seen_ids)
-            for article in articles:
-                data = await extract_tweet_data(article)
-                if not data: continue
-
-                tid = data["tweet"]["id_str"]
-                if tid in seen_ids: continue
-                seen_ids.add(tid)
-
-                if tid in skip_ids:
-                    if args.stop_on_existing and gist_id_index:
-                        gist_idx = gist_id_index.get(tid, -1)
-                        if gist_idx >= 0 and last_gist_index >= 0 and gist_idx == last_gist_index + 1:
-                            consecutive_count += 1
-                        else:
-                            consecutive_count = 1
-                        last_gist_index = gist_idx
-                        if consecutive_count >= CONSECUTIVE_STOP:
-                            print(f"🛑 {CONSECUTIVE_STOP} consecutive existing IDs matched in order. Stopping.")
-                            hit_existing = True
-                            break
-                    skipped_count += 1
-                    continue
-
-                # 新規ポスト → 連続カウントをリセット
-                consecutive_count = 0
-                last_gist_index = -1
+    print(f"🚀 Mode: {mode} | Source: {args.source} | Target: {target_label} | URL: {url}")
+    checkpoint_file = args.checkpoint or (checkpoint_path_for(args.user, args.hashtag) if args.resume else None)
 
+    if args.since:
+        if not args.hashtag:
+            print("❌ Error: --since は --hashtag と組み合わせて使います。"); return
+        until = args.until or (date.today() + timedelta(days=1)).isoformat()
+        merged = await extract_hashtag_windows(
+            args.hashtag, args.since, until,
+            window_days=args.window_days,
+            concurrency=args.concurrency,
+            num_per_window=args.num,
+            skip_ids=load_skip_ids(args.skip_ids_file),
+            source=args.source,
+            block=args.block,
+        )
+        with NdjsonWriter(NDJSON_OUTPUT_FILE) as new_tweets:
+            for data in merged:
                 new_tweets.append(data)
-                print(f"  [{len(new_tweets)}] Saved: @{tid}")
-
-                if len(new_tweets) >= args.num:
-                    break
-
-            if len(new_tweets) >= args.num or hit_existing: break
-
-            # スクロールしても新しいarticleが出てこなければ終端
-            if len(seen_ids) > prev_seen:
-                stall_count = 0
-            else:
-                stall_count += 1
-                if stall_count >= MAX_STALLS:
-                    print(f"\n⚠️ No more posts found after {MAX_STALLS} scrolls. Stopping.")
-                    break
-
-            await page.mouse.wheel(0, 2000)
-            await asyncio.sleep(4)
-
-        if skipped_count:
-            print(f"⏭️ Skipped {skipped_count} already-known posts.")
-
-        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-            f.write("window.YTD.tweets.part0 = ")
-            # 空リスト [] でも書き込むことで、Flutter側のエラーを防ぐ
-            json.dump(new_tweets if new_tweets else [], f, ensure_ascii=False, indent=2)
-        print(f"\n✅ Done: {len(new_tweets)} tweets saved.")
+    else:
+        with NdjsonWriter(NDJSON_OUTPUT_FILE) as new_tweets:
+            await extract_tweets(
+                num=args.num,
+                skip_ids=load_skip_ids(args.skip_ids_file),
+                stop_on_existing=args.stop_on_existing,
+                stop_mode=args.stop_mode,
+                source=args.source,
+                block=args.block,
+                url=url,
+                sink=new_tweets,
+                checkpoint_file=checkpoint_file,
+                resume=args.resume,
+            )
 
-        await browser.close()
+    if args.output_format == "js":
+        ndjson_to_tweets_js(NDJSON_OUTPUT_FILE, OUTPUT_FILE)
+    print(f"\n✅ Done: {len(new_tweets)} tweets saved.")
 
 if __name__ == "__main__":
-    asyncio.run(run())
\ No newline at end of file
+    asyncio.run(run())
@@ -0,0 +1,169 @@
+"""
+複数ユーザー / ハッシュタグを1つのブラウザで並列に取得する。
+
+  - Chromium は1回だけ起動し、data/auth.json を共有するコンテキスト上で
+    最大 --concurrency 枚のページを同時にスクロールする
+  - ターゲットごとに data/multi/<target>.ndjson（--output-format js なら
+    tweets.js と同じ形式の <target>.js も）を出力し、
+    data/multi/results.json に件数・出力先・エラーをまとめる
+
+Usage:
+    python3 scripts/extract_multi.py -u userA userB --hashtags 風景 -n 100
+    python3 scripts/extract_multi.py --queue-file fetch_queue.json -c 6
+"""
+import asyncio
+import json
+import os
+import re
+import sys
+import argparse
+from playwright.async_api import async_playwright
+
+# extract_media.py から必要な関数と定数をインポート
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from extract_media import (
+    build_url, load_skip_ids, scrape_timeline, NdjsonWriter, ndjson_to_tweets_js,
+    TimelineCheckpoint, checkpoint_path_for,
+    block_heavy_resources, parse_block_policy, format_block_stats,
+    AUTH_PATH, DATA_DIR, DEFAULT_BLOCK, STOP_MODES,
+)
+
+OUTPUT_DIR = os.path.join(DATA_DIR, "multi")
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-u", "--users", nargs="*", default=[], help="対象ユーザーID（複数可）")
+    parser.add_argument("--hashtags", nargs="*", default=[], help="対象キーワード（#なし、複数可）")
+    parser.add_argument("--queue-file", default=None,
+                        help="fetch_queue.json 形式のファイル（users[] の未処理エントリを対象にする）")
+    parser.add_argument("-n", "--num", type=int, default=100, help="ターゲットあたりの最大取得件数")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="同時にスクロールするページ数")
+    parser.add_argument("-s", "--stop-on-existing", action="store_true", help="既存IDに当たったら停止")
+    parser.add_argument("--stop-mode", choices=STOP_MODES, default="ordered",
+                        help="ordered: 既知IDの連続一致で停止 / snowflake: 既知の最新IDより古いポストで停止")
+    parser.add_argument("--skip-ids-dir", default=None,
+                        help="<target>.bin（skip_index 形式）または <target>.txt の既知IDファイルを置いたディレクトリ")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="ターゲットごとの出力先ディレクトリ")
+    parser.add_argument("--source", choices=["network", "dom"], default="network")
+    parser.add_argument("--resume", action="store_true",
+                        help="ターゲットごとのチェックポイント（data/checkpoints/<target>.json）から再開する")
+    parser.add_argument("--output-format", choices=["ndjson", "js"], default="ndjson")
+    parser.add_argument("--block", type=str, default=DEFAULT_BLOCK, help="中断するリソース種別（カンマ区切り / none）")
+    return parser.parse_args()
+
+def target_slug(target):
+    """ターゲットをファイル名に使える文字列にする（例: user_foo, hashtag_風景）"""
+    kind = "hashtag" if target.get("hashtag") else "user"
+    name = target.get("hashtag") or target.get("user")
+    return f"{kind}_" + re.sub(r'[\\/:*?"<>|\s]+', "_", name)
+
+def build_targets(args):
+    """CLI 引数とキューファイルからターゲット一覧を組み立てる（重複は除外）"""
+    targets = [{"user": u} for u in args.users] + [{"hashtag": h} for h in args.hashtags]
+    if args.queue_file:
+        with open(args.queue_file, encoding="utf-8") as f:
+            queue = json.load(f)
+        for entry in queue.get("users", []):
+            if entry.get("done"):
+                continue
+            if entry.get("user") or entry.get("hashtag"):
+                targets.append({k: entry[k] for k in ("user", "hashtag", "count", "stop_on_existing", "stop_mode") if k in entry})
+
+    unique, seen = [], set()
+    for t in targets:
+        slug = target_slug(t)
+        if slug not in seen:
+            seen.add(slug)
+            unique.append(t)
+    return unique
+
+def find_skip_ids_file(skip_ids_dir, slug):
+    """ターゲットの既知IDファイルを探す（バイナリ索引を優先）"""
+    if not skip_ids_dir:
+        return None
+    for ext in (".bin", ".txt"):
+        path = os.path.join(skip_ids_dir, slug + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+async def scrape_one(context, semaphore, target, args):
+    slug = target_slug(target)
+    label = f"#{target['hashtag']}" if target.get("hashtag") else f"@{target['user']}"
+    num = int(target.get("count", args.num))
+    stop_on_existing = target.get("stop_on_existing", args.stop_on_existing)
+    stop_mode = target.get("stop_mode", args.stop_mode)
+    skip_ids = load_skip_ids(find_skip_ids_file(args.skip_ids_dir, slug))
+    output_file = os.path.join(args.output_dir, f"{slug}.ndjson")
+    result = {"target": label, "slug": slug, "count": 0, "file": output_file, "error": None}
+    url = build_url(target.get("user"), target.get("hashtag"), "post_only")
+    checkpoint = None
+    if args.resume:
+        checkpoint = TimelineCheckpoint(checkpoint_path_for(target.get("user"), target.get("hashtag")), url)
+        if checkpoint.done:
+            print(f"✅ [{label}] checkpoint reached the end of the timeline. Skipping.")
+            skip_ids.close()
+            return result
+
+    async with semaphore:
+        print(f"🚀 [{label}] start (num={num}, skip={len(skip_ids)}, stop_on_existing={stop_on_existing})")
+        page = await context.new_page()
+        new_tweets = NdjsonWriter(output_file)
+        try:
+            await scrape_timeline(
+                page, url, num,
+                skip_ids=skip_ids,
+                stop_on_existing=stop_on_existing,
+                stop_mode=stop_mode,
+                source=args.source,
+                log_prefix=f"[{label}] ",
+                sink=new_tweets,
+                checkpoint=checkpoint,
+                resume=args.resume,
+            )
+            print(f"✅ [{label}] {len(new_tweets)} tweets saved.")
+        except Exception as e:
+            result["error"] = str(e)
+            print(f"❌ [{label}] {e}")
+            if checkpoint is not None:
+                checkpoint.save()
+        finally:
+            # 途中で失敗しても取得済み分は NDJSON に残っている
+            result["count"] = len(new_tweets)
+            new_tweets.close()
+            skip_ids.close()
+            await page.close()
+        if args.output_format == "js":
+            ndjson_to_tweets_js(output_file, output_file[:-len(".ndjson")] + ".js")
+    return result
+
+async def run():
+    args = parse_args()
+    if not os.path.exists(AUTH_PATH):
+        print(f"❌ Error: {AUTH_PATH} not found."); return
+
+    targets = build_targets(args)
+    if not targets:
+        print("❌ Error: ターゲットがありません（-u / --hashtags / --queue-file）。"); return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    print(f"🚀 Targets: {len(targets)} | Concurrency: {args.concurrency}")
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context(storage_state=AUTH_PATH)
+        block_stats = await block_heavy_resources(context, parse_block_policy(args.block))
+        semaphore = asyncio.Semaphore(max(1, args.concurrency))
+        results = await asyncio.gather(*(scrape_one(context, semaphore, t, args) for t in targets))
+        await browser.close()
+
+    with open(os.path.join(args.output_dir, "results.json"), "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    print(format_block_stats(block_stats))
+    failed = [r for r in results if r["error"]]
+    print(f"\n✅ Done: {sum(r['count'] for r in results)} tweets from {len(results)} targets"
+          f" ({len(failed)} failed).")
+
+if __name__ == "__main__":
+    asyncio.run(run())
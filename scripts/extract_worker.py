@@ -0,0 +1,237 @@
+"""
+ログイン済みのブラウザを起動したまま待機し、ローカルソケット経由で取得ジョブを受け付ける常駐ワーカー。
+
+  - Chromium の起動と data/auth.json からのコンテキスト作成は最初の1回だけ
+  - ジョブごとに新しいページを開いてスクロールし、終わったら閉じる（同時実行数は --max-jobs）
+  - プロトコルは Unix ソケット上の JSON Lines:
+      リクエスト: {"kind": "timeline" | "foryou" | "hashtag_windows" | "ping" | "shutdown", ...}
+      レスポンス: {"type": "tweet", "data": {...}} を1件ずつ → 最後に {"type": "done", "count": n, "error": null}
+  - 既知IDは skip_index 形式のファイルパス（skip_ids_file）で渡す（封印済みチェーンの最新IDは known_below）
+  - append_to_gist.py はソケットがあればワーカーに投げ、無ければ従来どおり自前で Playwright を起動する
+
+Usage:
+    python3 scripts/extract_worker.py &                 # 起動
+    python3 scripts/extract_worker.py --ping            # 起動確認
+    python3 scripts/extract_worker.py --shutdown        # 停止
+"""
+import asyncio
+import json
+import os
+import sys
+import argparse
+from playwright.async_api import async_playwright, Error as PlaywrightError
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from skip_index import SkipIdIndex
+from extract_media import (
+    build_url, scrape_timeline, scrape_hashtag_windows, split_date_windows, TimelineCheckpoint,
+    block_heavy_resources, parse_block_policy, format_block_stats,
+    AUTH_PATH, DATA_DIR, DEFAULT_BLOCK,
+)
+from extract_foryou import scrape_foryou
+
+WORKER_SOCKET = os.environ.get("XPG_WORKER_SOCKET", os.path.join(DATA_DIR, "extract_worker.sock"))
+STREAM_LIMIT = 16 * 1024 * 1024  # 1行（1ツイート）の最大サイズ
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", default=WORKER_SOCKET, help="待ち受ける Unix ソケットのパス")
+    parser.add_argument("--max-jobs", type=int, default=2, help="同時に実行するジョブ数")
+    parser.add_argument("--block", type=str, default=DEFAULT_BLOCK, help="中断するリソース種別（カンマ区切り / none）")
+    parser.add_argument("--ping", action="store_true", help="ワーカーが応答するか確認して終了")
+    parser.add_argument("--shutdown", action="store_true", help="起動中のワーカーを停止して終了")
+    return parser.parse_args()
+
+# ---------------------------------------------------------------------------
+# クライアント側
+# ---------------------------------------------------------------------------
+
+async def submit_job(job, socket_path=WORKER_SOCKET, sink=None):
+    """ジョブを送り、返ってきたツイートを sink（省略時は list）に追加して返す。
+    ワーカー側でエラーになった場合は取得済み分を sink に残したまま RuntimeError を送出する
+    （ワーカーが途中で落ちた場合の OSError / json.JSONDecodeError も同様に sink は残る）。"""
+    new_tweets = sink if sink is not None else []
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=STREAM_LIMIT)
+    try:
+        writer.write((json.dumps(job, ensure_ascii=False) + "\n").encode("utf-8"))
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise RuntimeError("Worker closed the connection before finishing the job.")
+            msg = json.loads(line)
+            if msg.get("type") == "tweet":
+                new_tweets.append(msg["data"])
+            elif msg.get("type") == "done":
+                if msg.get("error"):
+                    raise RuntimeError(f"Worker job failed: {msg['error']}")
+                return new_tweets
+    finally:
+        writer.close()
+
+async def worker_available(socket_path=WORKER_SOCKET):
+    """ワーカーが起動していて応答するか"""
+    if not os.path.exists(socket_path):
+        return False
+    try:
+        await asyncio.wait_for(submit_job({"kind": "ping"}, socket_path), timeout=5)
+        return True
+    except (OSError, RuntimeError, asyncio.TimeoutError, json.JSONDecodeError):
+        return False
+
+# ---------------------------------------------------------------------------
+# ワーカー側
+# ---------------------------------------------------------------------------
+
+class StreamSink:
+    """取得したツイートをその都度クライアントへ送るシンク（list と同じく append / len が使える）。
+    スクレイパーはスクロールごとに drain を待つので、クライアントが遅くても送信バッファが溜まり続けない"""
+
+    def __init__(self, writer):
+        self._writer = writer
+        self._count = 0
+
+    def append(self, data):
+        self._writer.write((json.dumps({"type": "tweet", "data": data}, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._count += 1
+
+    async def drain(self):
+        await self._writer.drain()
+
+    def __len__(self):
+        return self._count
+
+class ExtractWorker:
+    """ブラウザとログイン済みコンテキストを保持し、ジョブごとにページを開いて取得する"""
+
+    def __init__(self, playwright, block, max_jobs):
+        self._playwright = playwright
+        self._block = block
+        self._semaphore = asyncio.Semaphore(max(1, max_jobs))
+        self._stopped = asyncio.Event()
+        self._launch_lock = asyncio.Lock()
+        self.browser = None
+        self.context = None
+        self.block_stats = None
+        self.jobs = 0
+
+    async def ensure_context(self):
+        """ブラウザが落ちていれば起動し直す（同時に来たジョブが二重に起動しないようロックする）"""
+        async with self._launch_lock:
+            if self.browser is not None and self.browser.is_connected():
+                return self.context
+            if self.browser is not None:
+                try:
+                    await self.browser.close()
+                except PlaywrightError:
+                    pass  # 切断済み
+            self.browser = await self._playwright.chromium.launch(headless=True)
+            self.context = await self.browser.new_context(storage_state=AUTH_PATH)
+            self.block_stats = await block_heavy_resources(self.context, parse_block_policy(self._block))
+            print("🌐 Browser ready.")
+            return self.context
+
+    async def run_job(self, job, sink):
+        kind = job.get("kind")
+        skip_ids = SkipIdIndex.open(job.get("skip_ids_file"))
+        try:
+            async with self._semaphore:
+                context = await self.ensure_context()
+                if kind == "hashtag_windows":
+                    windows = split_date_windows(job["since"], job["until"], job.get("window_days", 7))
+                    for data in await scrape_hashtag_windows(
+                            context, job["hashtag"], windows,
+                            concurrency=job.get("concurrency", 4),
+                            num_per_window=job.get("num", 100),
+                            skip_ids=skip_ids,
+                            source=job.get("source", "network")):
+                        sink.append(data)
+                        await sink.drain()
+                    return
+                page = await context.new_page()
+                try:
+                    if kind == "foryou":
+                        await scrape_foryou(page, job.get("num", 100), skip_ids=skip_ids, sink=sink)
+                    elif kind == "timeline":
+                        url = job.get("url") or build_url(job.get("user"), job.get("hashtag"), "post_only")
+                        checkpoint_file = job.get("checkpoint_file")
+                        await scrape_timeline(
+                            page, url, job.get("num", 100),
+                            skip_ids=skip_ids,
+                            stop_on_existing=job.get("stop_on_existing", False),
+                            stop_mode=job.get("stop_mode", "ordered"),
+                            source=job.get("source", "network"),
+                            sink=sink,
+                            checkpoint=TimelineCheckpoint(checkpoint_file, url) if checkpoint_file else None,
+                            resume=job.get("resume", False),
+                            known_below=int(job.get("known_below") or 0),
+                        )
+                    else:
+                        raise ValueError(f"Unknown job kind: {kind}")
+                finally:
+                    await page.close()
+        finally:
+            skip_ids.close()
+
+    async def handle(self, reader, writer):
+        error = None
+        sink = StreamSink(writer)
+        try:
+            job = json.loads(await reader.readline())
+            kind = job.get("kind")
+            if kind == "shutdown":
+                print("🛑 Shutdown requested.")
+                self._stopped.set()
+            elif kind != "ping":
+                self.jobs += 1
+                label = f"#{job['hashtag']}" if job.get("hashtag") else (f"@{job['user']}" if job.get("user") else kind)
+                print(f"🚀 Job {self.jobs}: {kind} {label} (num={job.get('num', 100)})")
+                await self.run_job(job, sink)
+                print(f"✅ Job {self.jobs}: {len(sink)} tweets.")
+        except Exception as e:
+            # 想定外のエラーでも done 行は必ず返す（クライアントが理由なく切断されないように）
+            error = f"{type(e).__name__}: {e}"
+            print(f"❌ Job failed after {len(sink)} tweets: {e}")
+        try:
+            writer.write((json.dumps({"type": "done", "count": len(sink), "error": error}) + "\n").encode("utf-8"))
+            await writer.drain()
+            writer.close()
+        except OSError:
+            pass  # クライアントが先に切断した
+
+    async def serve(self, socket_path):
+        await self.ensure_context()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+        server = await asyncio.start_unix_server(self.handle, path=socket_path, limit=STREAM_LIMIT)
+        print(f"✅ Worker listening on {socket_path}")
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            if self.block_stats is not None:
+                print(format_block_stats(self.block_stats))
+            if self.browser is not None:
+                await self.browser.close()
+
+async def run():
+    args = parse_args()
+    if args.ping or args.shutdown:
+        if not await worker_available(args.socket):
+            print(f"❌ Worker is not running ({args.socket})."); sys.exit(1)
+        if args.shutdown:
+            await submit_job({"kind": "shutdown"}, args.socket)
+        print("✅ Worker is running." if args.ping else "✅ Worker stopped.")
+        return
+
+    if not os.path.exists(AUTH_PATH):
+        print(f"❌ Error: {AUTH_PATH} not found."); sys.exit(1)
+
+    async with async_playwright() as p:
+        await ExtractWorker(p, args.block, args.max_jobs).serve(args.socket)
+
+if __name__ == "__main__":
+    asyncio.run(run())
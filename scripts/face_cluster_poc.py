@@ -10,6 +10,7 @@
 import argparse
 import io
 import json
+import os
 import re
 import sys
 import time
@@ -21,6 +22,10 @@ import requests
 from sklearn.cluster import DBSCAN
 from sklearn.metrics.pairwise import cosine_distances
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gist_store import get_store
+from gist_layout import read_user_chain, user_gist_id
+
 # --- InsightFace 初期化 ---
 _face_app = None
 
@@ -166,36 +171,18 @@ def pick_best_label(keywords: list[str], cluster_id: int) -> str:
 
 
 # --- データ取得 ---
-GIST_RAW_BASE = "https://gist.githubusercontent.com/Yuji-HAMADA"
-
 def fetch_master_data(master_gist_id: str) -> dict:
     """マスターGistからユーザー一覧と user_gists を取得"""
-    url = f"{GIST_RAW_BASE}/{master_gist_id}/raw/data.json"
-    resp = requests.get(url, timeout=30)
-    resp.raise_for_status()
-    return resp.json()
-
-
-def fetch_user_tweets(gist_id: str, username: str) -> list[dict]:
-    """子Gistからユーザーのツイートを取得"""
-    t = int(time.time())
-    url = f"{GIST_RAW_BASE}/{gist_id}/raw/data.json?t={t}"
-    resp = requests.get(url, timeout=30)
-    if resp.status_code == 404:
-        url = f"{GIST_RAW_BASE}/{gist_id}/raw/gallary_data.json?t={t}"
-        resp = requests.get(url, timeout=30)
-    if resp.status_code != 200:
-        return []
-    data = resp.json()
+    return get_store().read(master_gist_id)[1]
 
-    # 子Gist形式: users -> username -> tweets
-    users = data.get('users', {})
-    if username in users:
-        return users[username].get('tweets', [])
-    # フォールバック: 直下に tweets
-    if 'tweets' in data:
-        return data['tweets']
-    return []
+
+def fetch_user_tweets(entry, username: str) -> list[dict]:
+    """子Gistからユーザーのツイートを取得（封印済みのチェーンも含む）"""
+    # 子Gist形式（users -> username -> tweets / sharded）、直下に tweets の形式にも対応
+    try:
+        return read_user_chain(entry, username)
+    except (RuntimeError, ValueError):
+        return []
 
 
 # --- メイン処理 ---
@@ -236,11 +223,11 @@ def process_users(master_gist_id: str, max_users: int = 10,
 
     print(f"\n[2/5] 実写判定 + embedding抽出 ({len(usernames)} users)...")
     for i, username in enumerate(usernames):
-        gist_id = user_gists[username]
+        gist_id = user_gist_id(user_gists[username])
         print(f"\n  [{i+1}/{len(usernames)}] @{username} (gist: {gist_id[:8]}...)")
 
         # 子Gistからツイート取得
-        tweets = fetch_user_tweets(gist_id, username)
+        tweets = fetch_user_tweets(user_gists[username], username)
         if not tweets:
             print(f"    → ツイートなし、スキップ")
             skip_count += 1
@@ -0,0 +1,99 @@
+"""
+Gist に保存する JSON のワイヤーフォーマット。
+
+  - schema 2（コンパクト形式）:
+      - 改行・インデントなしで書く（従来は indent=2）
+      - ツイートの post_url が https://x.com/<user>/status/<id_str> と一致すれば省き、読み込み時に復元する
+        <user> はツイートの username、無ければ users のキー / shard ファイルの "user"
+        post_url が無い・空のツイートは "post_url": "" を残す（読み込み時に作り足さない）
+        マスターGist直下の tweets（代表ツイート）は post_url を持たないので対象外
+      - media_urls の共通プレフィックス（MEDIA_PREFIX）を省き、文書の "media_prefix" に1回だけ書く
+      - 文書の先頭に "schema": 2 を入れる
+  - 読み込み側は load_json / unpack_document で従来形式に戻して受け取る（schema が無い文書はそのまま）
+  - XPG_GIST_SCHEMA=1 で従来形式（indent=2、省略なし）で書く（古いアプリに戻すときの切り戻し用）
+    値は書き込むときに読む（1 / 2 以外は ValueError。各スクリプトは main の先頭で write_schema() を呼んで検出する）
+
+Usage:
+    text = dump_document(data)        # 書き込み
+    data = load_json(text)            # 読み込み（新旧どちらの形式でも従来形式で返る）
+"""
+import json
+import os
+
+SCHEMA_VERSION = 2
+MEDIA_PREFIX = "https://pbs.twimg.com/media/"
+
+def write_schema():
+    """書き込む形式（XPG_GIST_SCHEMA。未設定・空なら SCHEMA_VERSION）。1 / 2 以外は ValueError"""
+    value = os.environ.get("XPG_GIST_SCHEMA", "").strip()
+    if not value:
+        return SCHEMA_VERSION
+    if value not in ("1", str(SCHEMA_VERSION)):
+        raise ValueError(f"XPG_GIST_SCHEMA must be 1 or {SCHEMA_VERSION} (got {value!r})")
+    return int(value)
+
+def post_url_for(user, id_str):
+    return f"https://x.com/{user}/status/{id_str}"
+
+def _pack_tweet(tweet, user, prefix):
+    packed = dict(tweet)
+    urls = packed.get("media_urls")
+    if urls:
+        packed["media_urls"] = [u[len(prefix):] if u.startswith(prefix) else u for u in urls]
+    tid = packed.get("id_str")
+    if user and tid:
+        name = packed.get("username") or user
+        if packed.get("post_url") == post_url_for(name, tid):
+            del packed["post_url"]
+        elif not packed.get("post_url"):
+            packed["post_url"] = ""
+    return packed
+
+def _unpack_tweet(tweet, user, prefix):
+    urls = tweet.get("media_urls")
+    if urls:
+        tweet["media_urls"] = [u if not u or "://" in u else prefix + u for u in urls]
+    tid = tweet.get("id_str")
+    if user and tid and "post_url" not in tweet:
+        tweet["post_url"] = post_url_for(tweet.get("username") or user, tid)
+    return tweet
+
+def _map_tweets(data, convert, prefix):
+    """文書内のツイート（直下の tweets / users.<user>.tweets）に convert(tweet, user, prefix) を適用した文書を返す"""
+    doc = dict(data)
+    if isinstance(doc.get("tweets"), list):
+        doc["tweets"] = [convert(t, doc.get("user"), prefix) for t in doc["tweets"]]
+    if isinstance(doc.get("users"), dict):
+        doc["users"] = {
+            user: dict(entry, tweets=[convert(t, user, prefix) for t in entry["tweets"]])
+            if isinstance(entry, dict) and isinstance(entry.get("tweets"), list) else entry
+            for user, entry in doc["users"].items()
+        }
+    return doc
+
+def pack_document(data):
+    """ツイートを含む文書を schema 2 に変換する（ツイートを含まない文書はそのまま）"""
+    if not isinstance(data, dict) or not (isinstance(data.get("tweets"), list) or isinstance(data.get("users"), dict)):
+        return data
+    doc = _map_tweets(data, _pack_tweet, MEDIA_PREFIX)
+    return {"schema": SCHEMA_VERSION, "media_prefix": MEDIA_PREFIX, **doc}
+
+def unpack_document(data):
+    """schema 2 の文書を従来形式に戻す（schema の無い文書はそのまま）"""
+    if not isinstance(data, dict) or "schema" not in data:
+        return data
+    schema = data.get("schema")
+    if not isinstance(schema, int) or schema > SCHEMA_VERSION:
+        raise RuntimeError(f"Unsupported Gist schema: {schema}")
+    doc = {k: v for k, v in data.items() if k not in ("schema", "media_prefix")}
+    return _map_tweets(doc, _unpack_tweet, data.get("media_prefix", MEDIA_PREFIX))
+
+def dump_document(data):
+    """Gist に保存する JSON 文字列（XPG_GIST_SCHEMA=1 なら従来の indent=2）"""
+    if write_schema() < 2:
+        return json.dumps(data, ensure_ascii=False, indent=2)
+    return json.dumps(pack_document(data), ensure_ascii=False, separators=(",", ":"))
+
+def load_json(text):
+    """Gist のファイル内容を読み、従来形式の JSON を返す"""
+    return unpack_document(json.loads(text))
@@ -0,0 +1,408 @@
+"""
+ユーザーGist / キーワード子Gist（multi-user 形式）のファイル構成を扱うモジュール。
+
+  - inline（従来）: data.json にすべてのユーザーのツイートを入れる
+      data.json = {"users": {user: {"tweets": [...]}}, "deleted_ids": [...]}
+  - sharded: data.json は小さな索引だけを持ち、ツイートはユーザーごとのファイルに分ける
+      data.json        = {"layout": "sharded", "users": {user: {"file": "user-<user>.json", "count": n, "rate": r,
+                                                               "segments": [{"file": "seg-<id>.json", "count": k}]}}, ...}
+      （rate は直近 RATE_WINDOW_DAYS 日の増加ペース（件/日）。配置ポリシー gist_placement.py が使う）
+      user-<user>.json = {"user": user, "tweets": [...]}   （ベース）
+      seg-<id>.json    = {"user": user, "tweets": [...]}   （追記分。<id> は含まれる最新ポストの snowflake ID）
+    追記は新しいポストだけを小さなセグメントファイルに書き、索引にその名前を足す（書き込み量は新規分だけ）
+    全体を書き直すとき（削除・移動・compact_gist_segments.py）にセグメントをベースへ畳み込む
+  - 読み込み時は 新しいセグメント → … → ベース の順に結合し、id_str で重複を除く
+    索引に "order": "snowflake" がある Gist（キーワード子Gist）は結合後に ID の降順に並べる
+  - users の各エントリは tweets（inline）/ file・segments（sharded）のどちらでもよく、移行途中の混在もそのまま読める
+  - 読み込み側は read_document / read_many で従来と同じ {"users": {user: {"tweets": [...]}}} に展開して受け取る
+    （API のメタデータに各ファイルの内容が含まれるので、ファイルが増えてもリクエスト数は変わらない）
+
+Usage:
+    from gist_layout import UserGist, read_document, read_user_tweets
+    gist = UserGist.load(gist_id)
+    gist.append("user", new_tweets)               # 新規分をセグメントとして追記
+    gist.save()                                   # 変更したファイル + 索引だけを書き込む
+    filename, data = read_document(gist_id)       # 展開済みの従来形式
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gist_store import get_store, dump_json, DATA_FILENAMES
+from gist_format import load_json
+
+INDEX_FILENAME = "data.json"
+SHARDED = "sharded"
+SNOWFLAKE_ORDER = "snowflake"
+GIST_MAX_TWEETS = 2000    # 1つのユーザーGistに置くツイート数の上限（追記・配置・rebalance で共通）
+GIST_MAX_FILES = 300      # API がファイル一覧を返す上限（これを超えると一部のファイルが見えなくなる）
+SEGMENT_MAX_FILES = 16    # 1ユーザーのセグメント数がこれに達したら、次の追記でベースに畳み込む
+TWITTER_EPOCH_MS = 1288834974657
+RATE_WINDOW_DAYS = 90     # 増加ペース（件/日）を測る期間
+
+def shard_filename(user):
+    """ユーザーのツイートを置くファイル名（X のユーザー名は英数字と _ のみ）"""
+    return f"user-{user}.json"
+
+def segment_filename(tweets):
+    """追記セグメントのファイル名（含まれるポストの最新の snowflake ID）"""
+    newest = max((snowflake_id(t) for t in tweets), default=0)
+    return f"seg-{newest or int(time.time() * 1000)}.json"
+
+def _is_inline(entry):
+    return isinstance(entry, dict) and "tweets" in entry
+
+def _segments(entry):
+    return entry.get("segments", []) if isinstance(entry, dict) else []
+
+def _entry_files(entry):
+    """エントリが持つファイル（ベース + セグメント）"""
+    files = [entry["file"]] if isinstance(entry, dict) and entry.get("file") else []
+    return files + [seg["file"] for seg in _segments(entry)]
+
+def is_sharded(data):
+    return isinstance(data, dict) and any(
+        isinstance(entry, dict) and ("file" in entry or "segments" in entry)
+        for entry in data.get("users", {}).values())
+
+def snowflake_id(tweet):
+    tid = str(tweet.get("id_str", ""))
+    return int(tid) if tid.isdigit() else 0
+
+def tweet_time(tweet):
+    """snowflake ID から投稿時刻（UNIX 秒）を求める（ID が無ければ None）"""
+    sid = snowflake_id(tweet)
+    return ((sid >> 22) + TWITTER_EPOCH_MS) / 1000 if sid else None
+
+def growth_rate(tweets, now=None, window_days=RATE_WINDOW_DAYS):
+    """直近 window_days 日のポスト数から求めた増加ペース（件/日）"""
+    since = (now or time.time()) - window_days * 86400
+    recent = sum(1 for t in tweets if (tweet_time(t) or 0) >= since)
+    return recent / window_days
+
+def merge_tweet_lists(lists, order=None):
+    """新しい順に並んだリスト群を結合し、id_str の重複を除く（order="snowflake" なら ID の降順に並べ直す）"""
+    seen = set()
+    merged = []
+    for tweets in lists:
+        for tweet in tweets:
+            tid = tweet.get("id_str")
+            if tid:
+                if tid in seen:
+                    continue
+                seen.add(tid)
+            merged.append(tweet)
+    if order == SNOWFLAKE_ORDER:
+        merged.sort(key=snowflake_id, reverse=True)
+    return merged
+
+def _load_index(store, gist_id):
+    """(メタデータ, 索引のファイル名, 索引) を返す"""
+    meta = store.get(gist_id)
+    for filename in DATA_FILENAMES:
+        text = store.read_text(gist_id, filename, meta)
+        if text and text.strip():
+            return meta, filename, load_json(text)
+    raise RuntimeError(f"{' / '.join(DATA_FILENAMES)} not found in Gist {gist_id}")
+
+def _read_file_tweets(store, gist_id, filename, meta):
+    text = store.read_text(gist_id, filename, meta)
+    if text is None:
+        raise RuntimeError(f"{filename} not found in Gist {gist_id}")
+    return load_json(text).get("tweets", [])
+
+def _read_entry(store, gist_id, entry, meta, order=None):
+    """エントリのベースとセグメントを読み、新しいセグメント → ベースの順に結合する"""
+    if not isinstance(entry, dict):
+        return []
+    if _is_inline(entry):
+        base = entry.get("tweets", [])
+    elif entry.get("file"):
+        base = _read_file_tweets(store, gist_id, entry["file"], meta)
+    else:
+        base = []
+    segments = [_read_file_tweets(store, gist_id, seg["file"], meta) for seg in reversed(_segments(entry))]
+    if not segments and order != SNOWFLAKE_ORDER:
+        return base
+    return merge_tweet_lists(segments + [base], order)
+
+def read_document(gist_id, store=None):
+    """Gist を読み、shard / セグメントを展開した従来形式の (ファイル名, JSON) を返す"""
+    store = store or get_store()
+    meta, filename, data = _load_index(store, gist_id)
+    if not is_sharded(data):
+        return filename, data
+    order = data.get("order")
+    users = {user: {"tweets": _read_entry(store, gist_id, entry, meta, order)}
+             for user, entry in data.get("users", {}).items()}
+    document = {k: v for k, v in data.items() if k not in ("layout", "order")}
+    document["users"] = users
+    return filename, document
+
+def read_many(gist_ids, store=None, **kwargs):
+    """read_document を並列に先読みして (gist_id, ファイル名, JSON, エラー) を渡した順に返す"""
+    store = store or get_store()
+    return store.read_many(gist_ids, reader=lambda gist_id: read_document(gist_id, store), **kwargs)
+
+def load_many(gist_ids, store=None, max_segments=SEGMENT_MAX_FILES, **kwargs):
+    """UserGist.load を並列に先読みして (gist_id, UserGist, エラー) を渡した順に返す"""
+    store = store or get_store()
+    reader = lambda gist_id: (None, UserGist.load(gist_id, store, max_segments=max_segments))
+    for gist_id, _, gist, error in store.read_many(gist_ids, reader=reader, **kwargs):
+        yield gist_id, gist, error
+
+def read_user_tweets(gist_id, user, store=None):
+    """1ユーザー分のツイートだけを読む（他のユーザーのファイルは解析しない）"""
+    store = store or get_store()
+    meta, _, data = _load_index(store, gist_id)
+    entry = data.get("users", {}).get(user)
+    if entry is not None:
+        return _read_entry(store, gist_id, entry, meta, data.get("order"))
+    return data.get("tweets", [])
+
+# ---------------------------------------------------------------------------
+# user_gists のチェーン（GIST_MAX_TWEETS を超えるユーザー）
+#   user_gists[user] = "<head の gist_id>"（従来）
+#                    | {"gist_id": "<head>", "chain": [{"gist_id", "min_id", "max_id", "count"}, ...]}
+#   head には新しいポストだけが入り、古いポストは snowflake の範囲ごとに封印済みの Gist（1ユーザーのみ）に移る
+#   chain は新しい順。封印済みの Gist は書き換えないので、読み込み側は必要になったときだけ取得すればよい
+# ---------------------------------------------------------------------------
+
+def user_gist_id(entry):
+    """user_gists の値（dict / 旧形式 string）から head の gist_id を取得"""
+    if isinstance(entry, dict):
+        return entry.get("gist_id")
+    return entry if isinstance(entry, str) else None
+
+def user_gist_chain(entry):
+    """封印済みの古いセグメント（新しい順）"""
+    return entry.get("chain", []) if isinstance(entry, dict) else []
+
+def user_gist_ids(entry):
+    """head と封印済みセグメントの gist_id（新しい順）"""
+    head = user_gist_id(entry)
+    return ([head] if head else []) + [seg["gist_id"] for seg in user_gist_chain(entry)]
+
+def chain_max_id(entry):
+    """封印済みセグメントの最新の snowflake ID（チェーンが無ければ 0）"""
+    chain = user_gist_chain(entry)
+    return int(chain[0]["max_id"]) if chain else 0
+
+def sealed_segment(gist_id, tweets):
+    """封印済み Gist のチェーン要素"""
+    ids = [snowflake_id(t) for t in tweets]
+    return {"gist_id": gist_id, "min_id": str(min(ids, default=0)), "max_id": str(max(ids, default=0)),
+            "count": len(tweets)}
+
+def chain_user_entry(entry, head_id, sealed=()):
+    """head を head_id にし、新しく封印したセグメント（新しい順）をチェーンの先頭に足した値を返す。
+    チェーンが無いユーザーは従来どおり string のまま（他のキーを持つ dict はそのまま引き継ぐ）"""
+    chain = list(sealed) + user_gist_chain(entry)
+    if not chain and not isinstance(entry, dict):
+        return head_id
+    updated = dict(entry) if isinstance(entry, dict) else {}
+    updated["gist_id"] = head_id
+    if chain:
+        updated["chain"] = chain
+    return updated
+
+def read_user_chain(entry, user, store=None, include_chain=True):
+    """head（と include_chain なら封印済みセグメント）を読み、新しい順に結合したツイートを返す"""
+    store = store or get_store()
+    gist_ids = user_gist_ids(entry) if include_chain else user_gist_ids(entry)[:1]
+    return merge_tweet_lists(read_user_tweets(gist_id, user, store) for gist_id in gist_ids)
+
+class UserGist:
+    """ユーザーGist を読み書きする。ファイルは必要になったときに読み、保存時は変更分だけを書き込む。
+    inline の Gist も最初の保存時に sharded へ移行する。"""
+
+    def __init__(self, gist_id, filename=INDEX_FILENAME, index=None, meta=None, store=None,
+                 max_segments=SEGMENT_MAX_FILES):
+        self.gist_id = gist_id
+        self.filename = filename
+        self.index = index if index is not None else {"users": {}}
+        self.max_segments = max_segments
+        self._meta = meta
+        self._store = store or get_store()
+        self._tweets = {}     # user -> 結合済みツイート（読み込み済み / 変更済み）
+        self._dirty = set()   # ベースごと書き直すユーザー
+        self._appends = {}    # user -> 新しいセグメントに書くツイート
+        self._removed = []    # 削除するファイル
+        self._index_dirty = False
+
+    @classmethod
+    def load(cls, gist_id, store=None, **kwargs):
+        store = store or get_store()
+        meta, filename, index = _load_index(store, gist_id)
+        return cls(gist_id, filename, index, meta, store, **kwargs)
+
+    @classmethod
+    def create(cls, user, tweets, description="Gallery User Data", store=None):
+        """1ユーザー分の sharded Gist を新規作成する"""
+        gist = cls(None, store=store)
+        gist.set_tweets(user, tweets)
+        gist.create_remote(description)
+        return gist
+
+    def create_remote(self, description):
+        """まだ Gist が無い（gist_id が None の）内容を新しい Gist として作成する"""
+        self.gist_id = self._store.create_files(self.pending_files(), description)
+        self.mark_saved()
+        return self.gist_id
+
+    @property
+    def order(self):
+        return self.index.get("order")
+
+    @order.setter
+    def order(self, value):
+        if self.index.get("order") != value:
+            self.index["order"] = value
+            self._index_dirty = True
+
+    def _entries(self):
+        return self.index.setdefault("users", {})
+
+    def users(self):
+        return list(self._entries())
+
+    def __contains__(self, user):
+        return user in self._entries()
+
+    def count(self, user):
+        """ユーザーのツイート数（ファイルは読まずに索引の件数を使う）"""
+        if user in self._tweets:
+            return len(self._tweets[user])
+        entry = self._entries().get(user)
+        if not isinstance(entry, dict):
+            return 0
+        if "count" in entry:
+            return entry["count"]
+        return len(entry.get("tweets", [])) + sum(seg.get("count", 0) for seg in _segments(entry))
+
+    def rate(self, user):
+        """ユーザーの増加ペース（件/日）。読み込み済みならツイートから、そうでなければ索引の値を使う"""
+        if user in self._tweets:
+            return growth_rate(self._tweets[user])
+        entry = self._entries().get(user)
+        return entry.get("rate", 0.0) if isinstance(entry, dict) else 0.0
+
+    def total_tweets(self, exclude=None):
+        return sum(self.count(user) for user in self._entries() if user != exclude)
+
+    def file_count(self, extra_users=0):
+        """保存後のファイル数の目安（索引 + ユーザーごとのベース + セグメント）"""
+        return 1 + extra_users + sum(1 + len(_segments(entry)) for entry in self._entries().values())
+
+    def segments(self, user):
+        """ユーザーの保存済みセグメント（[{"file", "count"}]）"""
+        return list(_segments(self._entries().get(user)))
+
+    def file_sizes(self, user):
+        """(ベースのバイト数, セグメントの合計バイト数)。メタデータの size を使う"""
+        files = (self._meta or {}).get("files", {})
+        entry = self._entries().get(user)
+        base = files.get(entry.get("file"), {}).get("size", 0) if isinstance(entry, dict) and entry.get("file") else 0
+        return base, sum(files.get(seg["file"], {}).get("size", 0) for seg in _segments(entry))
+
+    def tweets(self, user):
+        if user not in self._tweets:
+            self._tweets[user] = _read_entry(self._store, self.gist_id, self._entries().get(user),
+                                             self._meta, self.order)
+        return self._tweets[user]
+
+    def set_tweets(self, user, tweets):
+        """ユーザーのツイートを丸ごと置き換える（保存時にセグメントはベースへ畳み込まれる）"""
+        entry = self._entries().get(user)
+        if user not in self._dirty:
+            # ベースへ畳み込むので、保存済みのセグメント（と名前の違う旧ファイル）は削除する
+            self._removed.extend(f for f in _entry_files(entry) if f != shard_filename(user))
+        self._tweets[user] = tweets
+        self._dirty.add(user)
+        self._appends.pop(user, None)
+
+    def append(self, user, new_tweets):
+        """新しいツイートを追記する。保存時は新規分だけのセグメントファイルを書く。
+        セグメントが max_segments に達しているユーザーは、この機会にベースへ畳み込む。"""
+        if not new_tweets:
+            return
+        merged = merge_tweet_lists([new_tweets, self.tweets(user)], self.order)
+        entry = self._entries().get(user)
+        if entry is None or user in self._dirty or _is_inline(entry) \
+                or len(self.segments(user)) >= self.max_segments:
+            self.set_tweets(user, merged)
+            return
+        self._tweets[user] = merged
+        self._appends[user] = merge_tweet_lists([new_tweets, self._appends.get(user, [])])
+
+    def compact(self, user):
+        """セグメントをベースに畳み込む"""
+        self.set_tweets(user, self.tweets(user))
+
+    def remove_user(self, user):
+        entry = self._entries().pop(user, None)
+        if entry is None:
+            return
+        self._tweets.pop(user, None)
+        self._dirty.discard(user)
+        self._appends.pop(user, None)
+        self._removed.extend(_entry_files(entry))
+        self._index_dirty = True
+
+    def reset(self):
+        """マルチユーザー形式でない Gist を空の索引に置き換える"""
+        self.index = {"users": {}}
+        self._tweets.clear()
+        self._dirty.clear()
+        self._appends.clear()
+        self._index_dirty = True
+
+    @property
+    def is_modified(self):
+        return bool(self._dirty or self._appends or self._index_dirty)
+
+    def pending_files(self):
+        """保存時に PATCH する {ファイル名: 内容}（削除するファイルは None。変更がなければ空）"""
+        if not self.is_modified:
+            return {}
+        entries = self._entries()
+        # inline のユーザーが残っていれば、この機会に全員を shard に移す（移行は一度だけ）
+        for user, entry in entries.items():
+            if _is_inline(entry) and user not in self._dirty:
+                self.set_tweets(user, self.tweets(user))
+        files = {}
+        for user in self._dirty:
+            tweets = self._tweets[user]
+            entries[user] = {"file": shard_filename(user), "count": len(tweets), "rate": round(self.rate(user), 3)}
+            files[shard_filename(user)] = dump_json({"user": user, "tweets": tweets})
+        for user, new_tweets in self._appends.items():
+            entry = entries[user]
+            filename = segment_filename(new_tweets)
+            segments = entry.setdefault("segments", [])
+            if not any(seg["file"] == filename for seg in segments):
+                segments.append({"file": filename, "count": len(new_tweets)})
+            entry["count"] = self.count(user)
+            entry["rate"] = round(self.rate(user), 3)
+            files[filename] = dump_json({"user": user, "tweets": new_tweets})
+        for filename in self._removed:
+            files.setdefault(filename, None)
+        self.index["layout"] = SHARDED
+        files[self.filename] = dump_json(self.index)
+        return files
+
+    def mark_saved(self):
+        """pending_files の内容が書き込まれたことを記録する"""
+        self._dirty.clear()
+        self._appends.clear()
+        self._removed.clear()
+        self._index_dirty = False
+
+    def save(self):
+        """変更分を書き込み、送信したバイト数を返す"""
+        files = self.pending_files()
+        if not files:
+            return 0
+        sent = self._store.write_files(self.gist_id, files)
+        self.mark_saved()
+        return sent
@@ -0,0 +1,131 @@
+"""
+ユーザーGist の配置ポリシー（ビンパッキング）。
+
+  - ユーザーの見込みサイズ = 現在のツイート数 + 増加ペース（件/日）× GROWTH_HORIZON_DAYS
+    （ツイート数と増加ペースは head Gist の索引 data.json の count / rate を使うので、ユーザーのファイルは読まない）
+  - Gist の容量は 上限ツイート数 × TARGET_FILL（上限までの余白を残す）。ファイル数も GIST_MAX_FILES 未満に保つ
+  - 新規ユーザーは、見込みサイズが入る Gist のうち空きが最も少ないもの（best fit）に置く。どこにも入らなければ新しい Gist
+    Gist ごとの負荷はマスターの user_gist_loads（gist_summary の要約）から判断し、配置のために Gist を読まない
+  - plan_rebalance は
+      1. 容量を超えた Gist から大きいユーザーを順に移し（単独で容量を超えるユーザーはチェーンに任せて残す）
+      2. 小さい Gist から順に、全ユーザーを他の Gist に収められる限り空にする
+    移動計画を返す（全件走査で取得する Gist の数が減り、上限に近い Gist がなくなる）
+
+Usage:
+    from gist_placement import choose_gist, gist_summary, plan_rebalance
+    gist_id = choose_gist({gist_id: gist_summary(gist)}, size, max_tweets)   # None なら新しい Gist を作る
+    moves, loads = plan_rebalance(user_gists, max_tweets)     # [(user, 移動元 gist_id, 移動先)]
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gist_layout import GIST_MAX_FILES, growth_rate
+
+TARGET_FILL = 0.8            # 上限に対してここまで詰める
+GROWTH_HORIZON_DAYS = 90     # 何日分の増加を見込んで配置するか
+DRAIN_MAX_FILL = 0.5         # rebalance で空にする候補（負荷がこれ未満の Gist）
+
+def projected_size(count, rate, horizon=GROWTH_HORIZON_DAYS):
+    return count + rate * horizon
+
+def tweets_size(tweets):
+    """まだどの Gist にもいないユーザーの見込みサイズ"""
+    return projected_size(len(tweets), growth_rate(tweets))
+
+def user_size(gist, user):
+    return projected_size(gist.count(user), gist.rate(user))
+
+def gist_load(gist):
+    return sum(user_size(gist, user) for user in gist.users())
+
+def gist_summary(gist):
+    """マスターの user_gist_loads に保存する Gist の要約（見込み負荷・ツイート数・ファイル数）"""
+    return {"load": round(gist_load(gist), 1), "count": gist.total_tweets(), "files": gist.file_count()}
+
+def choose_gist(summaries, size, max_tweets, fill=TARGET_FILL):
+    """{gist_id: gist_summary} のうち、見込みサイズ size が容量内に収まり空きが最も少ない Gist の ID を返す（無ければ None）"""
+    capacity = max_tweets * fill
+    best, best_room = None, None
+    for gist_id, summary in summaries.items():
+        if summary.get("files", 1) + 1 >= GIST_MAX_FILES:
+            continue
+        room = capacity - summary.get("load", 0) - size
+        if room >= 0 and (best_room is None or room < best_room):
+            best, best_room = gist_id, room
+    return best
+
+class _Bin:
+    """計画中の Gist（負荷・ユーザー数を移動に合わせて更新する）"""
+
+    def __init__(self, key, users):
+        self.key = key
+        self.users = dict(users)  # user -> 見込みサイズ
+
+    @property
+    def load(self):
+        return sum(self.users.values())
+
+    def fits(self, size, capacity):
+        return self.load + size <= capacity and len(self.users) + 1 < GIST_MAX_FILES
+
+def _best_fit(bins, size, capacity, exclude):
+    candidates = [b for b in bins if b.key not in exclude and b.fits(size, capacity)]
+    return min(candidates, key=lambda b: capacity - b.load - size, default=None)
+
+def plan_rebalance(gists, max_tweets, fill=TARGET_FILL, drain_below=DRAIN_MAX_FILL, pinned=()):
+    """(移動計画 [(user, 移動元 gist_id, 移動先)], 移動後の {gist_id: 見込み負荷}) を返す。
+    移動先は既存の gist_id か、新しく作る Gist を表す "new:<n>"。1ユーザーの移動は1回まで。
+    pinned（{(user, gist_id)}）のユーザーは負荷には数えるが動かさない。"""
+    capacity = max_tweets * fill
+    bins = [_Bin(gist.gist_id, {user: user_size(gist, user) for user in gist.users()}) for gist in gists]
+    moves = []
+    new_count = 0
+    drained, receivers = set(), set()  # 空にした Gist には移さず、受け入れた Gist は空にしない
+
+    def place(user, size, src, exclude):
+        nonlocal new_count
+        dst = _best_fit(bins, size, capacity, exclude)
+        if dst is None:
+            new_count += 1
+            dst = _Bin(f"new:{new_count}", {})
+            bins.append(dst)
+        dst.users[user] = size
+        del src.users[user]
+        moves.append((user, src.key, dst.key))
+        receivers.add(dst.key)
+
+    # 1. 容量を超えた Gist から大きいユーザーを順に移す
+    #    （単独で容量を超えるユーザーは残し、追記時のチェーン封印に任せる）
+    for src in list(bins):
+        for user, size in sorted(src.users.items(), key=lambda kv: -kv[1]):
+            if src.load <= capacity:
+                break
+            if size <= capacity and len(src.users) > 1 and (user, src.key) not in pinned:
+                place(user, size, src, exclude={src.key})
+
+    # 2. 負荷の小さい Gist から順に、全ユーザーを他の Gist に移せるなら空にする
+    for src in sorted(bins, key=lambda b: b.load):
+        if not src.users or src.key in receivers or src.load >= capacity * drain_below \
+                or any((user, src.key) in pinned for user in src.users):
+            continue
+        trial = {b.key: (b.load, len(b.users)) for b in bins}
+        plan = []
+        for user, size in sorted(src.users.items(), key=lambda kv: -kv[1]):
+            fits = [b for b in bins if b.key not in drained and b is not src
+                    and trial[b.key][0] + size <= capacity and trial[b.key][1] + 1 < GIST_MAX_FILES]
+            dst = min(fits, key=lambda b: capacity - trial[b.key][0] - size, default=None)
+            if dst is None:
+                plan = None
+                break
+            trial[dst.key] = (trial[dst.key][0] + size, trial[dst.key][1] + 1)
+            plan.append((user, size, dst))
+        if plan is None:
+            continue
+        for user, size, dst in plan:
+            dst.users[user] = size
+            del src.users[user]
+            moves.append((user, src.key, dst.key))
+            receivers.add(dst.key)
+        drained.add(src.key)
+    return moves, {b.key: b.load for b in bins}
@@ -0,0 +1,349 @@
+"""
+GitHub Gist の読み書きをまとめた共有モジュール。
+
+  - gh / curl をプロセス起動せず、keep-alive の requests.Session（コネクションプール）で API を叩く
+  - ファイル内容は API レスポンスの content をそのまま使い、truncated（約1MB超）のときだけ raw_url を取得する
+  - トークンは GH_TOKEN → GITHUB_TOKEN → リポジトリ直下の .env → `gh auth token` の順に探す
+  - 失敗は RuntimeError で通知する（終了するかどうかは呼び出し側が決める）
+  - GET /gists/<id> の結果は ~/.cache/x-post-gallery/gists に ETag つきで保存し、次回は If-None-Match で
+    問い合わせる（変更がなければ 304 でキャッシュを使う）。同じプロセス内で2回目以降の取得は通信しない。
+    truncated ファイルの raw_url はリビジョンごとに固定なので、ディスクキャッシュから返す
+    （XPG_GIST_CACHE でキャッシュ先を変更、off で無効化）
+    キャッシュが効くのはディレクトリが実行をまたいで残る環境だけ。GitHub Actions では各ワークフローが
+    actions/cache でこのディレクトリを復元・保存している
+  - read_many はスレッドプールで先読みしつつ渡した順に返す。レート制限（403/429）に当たったら
+    Retry-After / X-RateLimit-Reset まで全スレッドで待ってから再試行する
+  - write_many は複数 Gist の PATCH を並列に送り、一時的な失敗（接続エラー・409・5xx）は間隔を空けて再試行する
+
+Usage:
+    from gist_store import get_store
+    store = get_store()
+    filename, data = store.read(gist_id)              # data.json（無ければ gallary_data.json）
+    store.list_gists()                                # {gist_id: updated_at}（変更検出用）
+    store.write(gist_id, filename, data)
+    new_id = store.create("data.json", data, "Gallery User Data")
+    for gist_id, filename, data, error in store.read_many(gist_ids):
+        ...
+    results = store.write_many({gist_id: {"data.json": text}, ...})   # {gist_id: (送信バイト数, エラー)}
+    print(store.cache_report())
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gist_format import dump_document, load_json
+
+GITHUB_API = "https://api.github.com"
+DATA_FILENAMES = ("data.json", "gallary_data.json")
+TOKEN_ENV_NAMES = ("GH_TOKEN", "GITHUB_TOKEN")
+FETCH_WORKERS = 8          # read_many の同時リクエスト数
+RATE_LIMIT_RETRIES = 3     # レート制限に当たったときの再試行回数
+RATE_LIMIT_MAX_WAIT = 300  # レート制限で待つ最大秒数（これより長ければ諦める）
+WRITE_WORKERS = 4          # write_many の同時 PATCH 数
+WRITE_RETRIES = 3          # write_many で一時的な失敗を再試行する回数（待ち時間は 2, 4, 8 秒）
+_cache_env = os.environ.get("XPG_GIST_CACHE", "")
+DEFAULT_CACHE_DIR = (None if _cache_env.lower() == "off"
+                     else Path(_cache_env or Path.home() / ".cache" / "x-post-gallery" / "gists"))
+
+def load_token():
+    """GitHub トークンを環境変数 / .env / gh CLI の順に探す"""
+    for name in TOKEN_ENV_NAMES:
+        token = os.environ.get(name, "")
+        if token:
+            return token
+    env_path = Path(__file__).resolve().parent.parent / ".env"
+    if env_path.exists():
+        text = env_path.read_text()
+        for name in TOKEN_ENV_NAMES:
+            m = re.search(rf"^{name}=(.+)$", text, re.MULTILINE)
+            if m:
+                return m.group(1).strip()
+    try:
+        result = subprocess.run(["gh", "auth", "token"], capture_output=True, text=True)
+        if result.returncode == 0 and result.stdout.strip():
+            return result.stdout.strip()
+    except FileNotFoundError:
+        pass
+    raise RuntimeError("GitHub token not found (GH_TOKEN / GITHUB_TOKEN / .env / gh auth login)")
+
+class GistRequestError(RuntimeError):
+    """API 呼び出しの失敗（status は HTTP ステータス。接続エラーは None）"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def transient(self):
+        return self.status is None or self.status == 409 or self.status >= 500
+
+def dump_json(data):
+    """Gist に保存する JSON 文字列（gist_format のコンパクト形式。XPG_GIST_SCHEMA=1 なら従来の indent=2）"""
+    return dump_document(data)
+
+class GistStore:
+    """コネクションプールつきセッションで Gist を読み書きする"""
+
+    def __init__(self, token=None, timeout=30, pool_size=16, cache_dir=DEFAULT_CACHE_DIR):
+        self.timeout = timeout
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {token or load_token()}",
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28",
+        })
+        # アダプタでの再試行は GET のみ（PATCH の再試行は _write_with_retry が受け持つ）
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({"GET"}))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        # ファイル内容の取得元（inline: メタデータに同梱 / raw: truncated のため別途ダウンロード）
+        # メタデータの取得元（memo: プロセス内 / not_modified: 304 でディスクキャッシュ / fetched: 200）
+        self.stats = {"inline": 0, "raw": 0, "raw_cached": 0,
+                      "memo": 0, "not_modified": 0, "fetched": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+        self._memo = {}  # gist_id -> メタデータ（このプロセスで書き込んだ Gist は破棄する）
+        self._paused_until = 0.0  # レート制限中はこの時刻まで全スレッドがリクエストを控える
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _rate_limit_wait(self, resp):
+        """レート制限のレスポンスなら待つべき秒数を返す（そうでなければ None）"""
+        if resp.status_code not in (403, 429):
+            return None
+        if resp.headers.get("Retry-After", "").isdigit():
+            return int(resp.headers["Retry-After"])
+        if resp.headers.get("X-RateLimit-Remaining") == "0" and resp.headers.get("X-RateLimit-Reset", "").isdigit():
+            return max(1, int(resp.headers["X-RateLimit-Reset"]) - int(time.time()) + 1)
+        if resp.status_code == 429 or "rate limit" in resp.text.lower():
+            return 60  # secondary rate limit でヘッダーが無い場合の目安
+        return None
+
+    def _request(self, method, url, **kwargs):
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            delay = self._paused_until - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                resp = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                raise GistRequestError(f"{method} {url} failed: {e}") from e
+            wait = self._rate_limit_wait(resp)
+            if wait is None or attempt == RATE_LIMIT_RETRIES or wait > RATE_LIMIT_MAX_WAIT:
+                break
+            self._count("rate_limited")
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.time() + wait)
+            print(f"⏳ GitHub rate limit: waiting {wait}s before retrying {method} {url}")
+        if resp.status_code >= 400:
+            raise GistRequestError(f"{method} {url} failed: {resp.status_code} {resp.text[:200]}", resp.status_code)
+        return resp
+
+    # ---- ディスクキャッシュ ----
+
+    def _cache_file(self, *parts):
+        return self.cache_dir.joinpath(*parts) if self.cache_dir else None
+
+    def _load_cached(self, gist_id):
+        path = self._cache_file(f"{gist_id}.json")
+        if not path or not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _save_cached(self, path, text):
+        """一時ファイル経由で書き込む（キャッシュに書けなくても処理は続ける）"""
+        if not path:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠️ Gist cache write failed ({path}): {e}")
+
+    def get(self, gist_id, refresh=False):
+        """Gist のメタデータ（files を含む）を返す。
+        プロセス内で取得済みならそのまま、ディスクに ETag があれば条件付きリクエストで確認する。"""
+        if not refresh:
+            with self._lock:
+                meta = self._memo.get(gist_id)
+            if meta is not None:
+                self._count("memo")
+                return meta
+        cached = self._load_cached(gist_id)
+        headers = {"If-None-Match": cached["etag"]} if cached and cached.get("etag") else {}
+        resp = self._request("GET", f"{GITHUB_API}/gists/{gist_id}", headers=headers)
+        if resp.status_code == 304 and cached:
+            self._count("not_modified")
+            meta = cached["meta"]
+        else:
+            self._count("fetched")
+            meta = resp.json()
+            if resp.headers.get("ETag"):
+                self._save_cached(self._cache_file(f"{gist_id}.json"),
+                                  json.dumps({"etag": resp.headers["ETag"], "updated_at": meta.get("updated_at"),
+                                              "meta": meta}, ensure_ascii=False))
+        with self._lock:
+            self._memo[gist_id] = meta
+        return meta
+
+    def forget(self, gist_id):
+        """プロセス内のメタデータを破棄する（書き込み後に古い内容を返さないため）"""
+        with self._lock:
+            self._memo.pop(gist_id, None)
+
+    def cache_report(self):
+        """キャッシュの利用状況を1行で返す"""
+        s = self.stats
+        requests_made = s["not_modified"] + s["fetched"]
+        hits = s["memo"] + s["not_modified"]
+        total = hits + s["fetched"]
+        rate = f"{hits / total:.0%}" if total else "-"
+        return (f"📦 Gist cache: hit {hits}/{total} ({rate}) | memo {s['memo']}, 304 {s['not_modified']},"
+                f" fetched {s['fetched']} | raw cached {s['raw_cached']}, raw downloaded {s['raw']}"
+                f" | API requests {requests_made}")
+
+    def list_gists(self, per_page=100):
+        """認証ユーザーの Gist 一覧を {gist_id: updated_at} で返す（内容は取得しない軽い呼び出し）"""
+        revisions = {}
+        page = 1
+        while True:
+            items = self._request("GET", f"{GITHUB_API}/gists",
+                                  params={"per_page": per_page, "page": page}).json()
+            revisions.update((g["id"], g.get("updated_at")) for g in items)
+            if len(items) < per_page:
+                return revisions
+            page += 1
+
+    def read_text(self, gist_id, filename, meta=None):
+        """Gist 内のファイルを文字列で返す（無ければ None）。
+        API はファイル内容をメタデータに含めて返すので、raw_url を取りに行くのは truncated の場合だけ。"""
+        meta = meta or self.get(gist_id)
+        file_info = meta.get("files", {}).get(filename)
+        if not file_info:
+            return None
+        if file_info.get("content") is not None and not file_info.get("truncated"):
+            self._count("inline")
+            return file_info["content"]
+        if not file_info.get("raw_url"):
+            return None
+        # raw_url はリビジョンの SHA を含むので、同じ URL の内容は変わらない
+        raw_path = self._cache_file("raw", hashlib.sha256(file_info["raw_url"].encode("utf-8")).hexdigest())
+        if raw_path and raw_path.exists():
+            self._count("raw_cached")
+            return raw_path.read_text(encoding="utf-8")
+        self._count("raw")
+        text = self._request("GET", file_info["raw_url"]).text
+        self._save_cached(raw_path, text)
+        return text
+
+    def read(self, gist_id, filenames=DATA_FILENAMES):
+        """候補ファイルのうち最初に見つかったものを (ファイル名, JSON) で返す"""
+        meta = self.get(gist_id)
+        for filename in filenames:
+            text = self.read_text(gist_id, filename, meta)
+            if text and text.strip():
+                return filename, load_json(text)
+        raise RuntimeError(f"{' / '.join(filenames)} not found in Gist {gist_id}")
+
+    def _read_result(self, gist_id, reader):
+        try:
+            filename, data = reader(gist_id)
+            return gist_id, filename, data, None
+        except (RuntimeError, ValueError) as e:
+            return gist_id, None, None, RuntimeError(str(e))
+
+    def read_many(self, gist_ids, filenames=DATA_FILENAMES, max_workers=FETCH_WORKERS, reader=None):
+        """複数の Gist を並列に先読みし、渡した順に (gist_id, ファイル名, JSON, エラー) を返すジェネレーター。
+        取得失敗はエラー（RuntimeError）に入れて返す。先読みは max_workers の2倍までに抑える。
+        reader（gist_id -> (ファイル名, JSON)）を渡すと read の代わりに使う。"""
+        gist_ids = list(gist_ids)
+        reader = reader or (lambda gist_id: self.read(gist_id, filenames))
+        pending = deque()
+        pool = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        try:
+            it = iter(gist_ids)
+            for gist_id in it:
+                pending.append(pool.submit(self._read_result, gist_id, reader))
+                if len(pending) >= max_workers * 2:
+                    break
+            while pending:
+                result = pending.popleft().result()
+                for gist_id in it:
+                    pending.append(pool.submit(self._read_result, gist_id, reader))
+                    break
+                yield result
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def write_files(self, gist_id, files):
+        """{ファイル名: 内容(文字列)} をまとめて1回の PATCH で更新し、送信したバイト数を返す（内容 None はファイル削除）"""
+        body = json.dumps({"files": {name: None if content is None else {"content": content}
+                                     for name, content in files.items()}},
+                          ensure_ascii=False).encode("utf-8")
+        self.forget(gist_id)
+        self._request("PATCH", f"{GITHUB_API}/gists/{gist_id}", data=body,
+                      headers={"Content-Type": "application/json; charset=utf-8"})
+        return len(body)
+
+    def _write_with_retry(self, gist_id, files):
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                return gist_id, self.write_files(gist_id, files), None
+            except GistRequestError as e:
+                if not e.transient or attempt == WRITE_RETRIES:
+                    return gist_id, 0, e
+                print(f"⚠️ PATCH {gist_id} failed ({e.status or 'connection'}), retrying in {2 ** (attempt + 1)}s...")
+                time.sleep(2 ** (attempt + 1))
+
+    def write_many(self, writes, max_workers=WRITE_WORKERS):
+        """{gist_id: {ファイル名: 内容(文字列)}} を並列に PATCH し、{gist_id: (送信バイト数, エラー)} を返す。
+        失敗した Gist があっても他の Gist の書き込みは続ける（エラーの扱いは呼び出し側が決める）。"""
+        if not writes:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(writes)))) as pool:
+            futures = [pool.submit(self._write_with_retry, gist_id, files) for gist_id, files in writes.items()]
+            return {gist_id: (sent, error) for gist_id, sent, error in (f.result() for f in futures)}
+
+    def write(self, gist_id, filename, data):
+        """JSON データ（または文字列）でファイルを更新する"""
+        return self.write_files(gist_id, {filename: data if isinstance(data, str) else dump_json(data)})
+
+    def create(self, filename, data, description, public=False):
+        """新しい Gist を作成して ID を返す（既定は secret）"""
+        return self.create_files({filename: data if isinstance(data, str) else dump_json(data)}, description, public)
+
+    def create_files(self, files, description, public=False):
+        """{ファイル名: 内容(文字列)} を持つ Gist を作成して ID を返す"""
+        payload = {"description": description, "public": public,
+                   "files": {name: {"content": content} for name, content in files.items()}}
+        return self._request("POST", f"{GITHUB_API}/gists", json=payload).json()["id"]
+
+_store = None
+
+def get_store():
+    """プロセス内で共有する GistStore（初回呼び出し時に作成）"""
+    global _store
+    if _store is None:
+        _store = GistStore()
+    return _store
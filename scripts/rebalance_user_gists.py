@@ -0,0 +1,143 @@
+"""
+ユーザーGist 間でユーザーを移動して負荷を均すオフラインのスクリプト（gist_placement.plan_rebalance の計画に従う）。
+
+  - 容量（上限 × TARGET_FILL）を超えた Gist からユーザーを移し、小さい Gist は他の Gist に収まるなら空にする
+  - 書き込みは3段階で、どこで失敗してもデータを失わない:
+      1. 移動先 Gist にユーザーを書き込む（新しい Gist はここで作成）
+      2. マスターGistの user_gists を1回の PATCH でまとめて書き換える
+      3. 移動元 Gist からユーザーを削除する（失敗しても移動元に重複が残るだけ）
+  - 封印済みのチェーン（user_gists の chain）はそのまま引き継ぐ
+  - マスターの user_gist_loads（配置に使う Gist ごとの要約）は移動後の状態で書き直す
+
+Usage:
+    python3 scripts/rebalance_user_gists.py -g <master_gist_id> --dry-run
+    python3 scripts/rebalance_user_gists.py -g <master_gist_id>
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gist_store import get_store, dump_json
+from gist_format import write_schema
+from gist_layout import UserGist, load_many, user_gist_id, chain_user_entry, GIST_MAX_TWEETS
+from gist_placement import plan_rebalance, gist_load, gist_summary, TARGET_FILL
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--gist-id", required=True, help="マスターGist ID")
+    parser.add_argument("--fill", type=float, default=TARGET_FILL, help="上限に対してここまで詰める（0〜1）")
+    parser.add_argument("--dry-run", action="store_true", help="移動計画の表示のみ（書き込まない）")
+    return parser.parse_args()
+
+def print_loads(label, loads):
+    used = [load for load in loads.values() if load > 0]
+    peak = max(used, default=0)
+    print(f"{label}: {len(used)} Gist(s), 最大 {peak:.0f} 件（上限の {peak / GIST_MAX_TWEETS:.0%}）")
+
+def save_all(gists, label):
+    """変更のある Gist を並列に書き込む。失敗したら終了する"""
+    writes = {gist.gist_id: gist.pending_files() for gist in gists if gist.is_modified}
+    if not writes:
+        return
+    print(f"☁️ {label}: {len(writes)} Gist(s)...")
+    results = get_store().write_many(writes)
+    failed = [g_id for g_id, (_, error) in results.items() if error]
+    for g_id in failed:
+        print(f"  ❌ {g_id}: {results[g_id][1]}")
+    if failed:
+        print(f"❌ Failed to update {len(failed)} Gist(s).")
+        sys.exit(1)
+    for gist in gists:
+        gist.mark_saved()
+
+def gist_loads(gists):
+    """マスターの user_gist_loads（ユーザーのいる Gist の要約）"""
+    return {gist.gist_id: gist_summary(gist) for gist in gists if gist.users()}
+
+def write_master(store, gist_id, filename, data, failure):
+    try:
+        store.write_files(gist_id, {filename: dump_json(data)})
+    except RuntimeError as e:
+        print(f"❌ {failure}: {e}")
+        sys.exit(1)
+
+def main():
+    args = parse_args()
+    try:
+        write_schema()  # XPG_GIST_SCHEMA の誤りは書き込み前に検出する
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    store = get_store()
+    try:
+        master_filename, master_data = store.read(args.gist_id)
+    except RuntimeError as e:
+        print(f"❌ Failed to fetch master Gist: {e}")
+        sys.exit(1)
+    user_gists_map = master_data.get("user_gists", {})
+    head_ids = list(dict.fromkeys(filter(None, (user_gist_id(entry) for entry in user_gists_map.values()))))
+
+    print(f"📥 Loading {len(head_ids)} user Gist(s)...")
+    gists = {}
+    for g_id, gist, error in load_many(head_ids, store):
+        if error:
+            print(f"❌ {g_id}: {error}")
+            sys.exit(1)
+        gists[g_id] = gist
+    # マスターが指していないユーザー（移行の残り等）は負荷には数えるが動かさない
+    pinned = {(user, g_id) for g_id, gist in gists.items() for user in gist.users()
+              if user_gist_id(user_gists_map.get(user)) != g_id}
+
+    moves, loads_after = plan_rebalance(list(gists.values()), GIST_MAX_TWEETS, fill=args.fill, pinned=pinned)
+    print_loads("Before", {g_id: gist_load(gist) for g_id, gist in gists.items()})
+    print_loads("After ", loads_after)
+    for user, src, dst in moves:
+        print(f"  🚚 @{user}: {src} → {dst} ({gists[src].count(user)} tweets)")
+    if not moves:
+        # 移動が無くても、配置に使う要約が古ければ書き直す
+        loads = gist_loads(gists.values())
+        if not args.dry_run and master_data.get("user_gist_loads") != loads:
+            master_data["user_gist_loads"] = loads
+            write_master(store, args.gist_id, master_filename, master_data, "Failed to update master Gist")
+            print("✅ Master user_gist_loads updated.")
+        print("✅ Already balanced.")
+        return
+    if args.dry_run:
+        print(f"✅ Dry run: {len(moves)} move(s).")
+        return
+
+    # 1. 移動先に書き込む（新しい Gist は最後に作成する）
+    new_gists = {}
+    for user, src, dst in moves:
+        if dst not in gists and dst not in new_gists:
+            new_gists[dst] = UserGist(None, store=store)
+        target = gists.get(dst) or new_gists[dst]
+        target.set_tweets(user, gists[src].tweets(user))
+    save_all(list(gists.values()), "Writing moved users")
+    for key, gist in new_gists.items():
+        try:
+            gist.create_remote("Gallery User Data")
+        except RuntimeError as e:
+            print(f"❌ Failed to create Gist: {e}")
+            sys.exit(1)
+        print(f"✨ Created {gist.gist_id} ({key})")
+
+    # 2. マスターの user_gists を1回の書き込みで切り替える
+    #    （移動元からの削除はメモリ上で先に反映し、user_gist_loads は移動後の状態にする。書き込みは 3. で行う）
+    for user, src, dst in moves:
+        dst_id = gists[dst].gist_id if dst in gists else new_gists[dst].gist_id
+        user_gists_map[user] = chain_user_entry(user_gists_map.get(user), dst_id)
+        gists[src].remove_user(user)
+    master_data["user_gists"] = user_gists_map
+    master_data["user_gist_loads"] = gist_loads([*gists.values(), *new_gists.values()])
+    write_master(store, args.gist_id, master_filename, master_data,
+                 "Failed to update master Gist (moved users remain in both Gists)")
+    print("✅ Master user_gists updated.")
+
+    # 3. 移動元から削除する
+    save_all(list(gists.values()), "Removing moved users from source Gists")
+    print(f"✅ Rebalanced: {len(moves)} user(s) moved.")
+
+if __name__ == "__main__":
+    main()
@@ -9,17 +9,17 @@
 """
 
 import argparse
-import json
 import os
 import re
 import sys
-import time
-from pathlib import Path
 
-import requests
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gist_store import GistStore, DATA_FILENAMES, load_token, dump_json
+from gist_format import write_schema
+from gist_format import load_json
+import gist_layout
 
 MASTER_GIST_ID = "a1d145b2d15d227ed1c051f3824b19fc"
-GITHUB_API = "https://api.github.com"
 USER_PATTERN = re.compile(r"^@([^:]+):")
 
 AVAILABLE_GIST_IDS = [
@@ -85,38 +85,12 @@ AVAILABLE_GIST_IDS = [
 ]
 
 
-def load_token():
-    token = os.environ.get("GITHUB_TOKEN", "")
-    if token:
-        return token
-    env_path = Path(__file__).resolve().parent.parent / ".env"
-    if env_path.exists():
-        text = env_path.read_text()
-        m = re.search(r"^GITHUB_TOKEN=(.+)$", text, re.MULTILINE)
-        if m:
-            return m.group(1).strip()
-    raise RuntimeError("GITHUB_TOKEN not found")
-
-
-def make_headers(token):
-    return {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/vnd.github.v3+json",
-    }
-
-
-def download_gist(gist_id, token):
-    headers = make_headers(token)
-    r = requests.get(f"{GITHUB_API}/gists/{gist_id}", headers=headers)
-    r.raise_for_status()
-    meta = r.json()
-    files = meta["files"]
-    for fname in ["data.json", "gallary_data.json"]:
-        if fname in files:
-            raw_url = files[fname]["raw_url"]
-            r2 = requests.get(raw_url)
-            r2.raise_for_status()
-            return fname, r2.json()
+def download_gist(store, gist_id):
+    meta = store.get(gist_id)
+    for fname in DATA_FILENAMES:
+        text = store.read_text(gist_id, fname, meta)
+        if text is not None:
+            return fname, load_json(text)
     return None, None
 
 
@@ -129,13 +103,19 @@ def main():
     parser = argparse.ArgumentParser(description="user_gists マッピングを再構築")
     parser.add_argument("--dry-run", action="store_true", help="サマリーのみ表示")
     args = parser.parse_args()
+    try:
+        write_schema()  # XPG_GIST_SCHEMA の誤りは書き込み前に検出する
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
 
     token = load_token()
     print(f"Token loaded (length={len(token)})")
+    store = GistStore(token)
 
     # マスターGistをダウンロード
     print(f"\nマスターGist ({MASTER_GIST_ID}) をダウンロード中...")
-    master_fname, master_data = download_gist(MASTER_GIST_ID, token)
+    master_fname, master_data = download_gist(store, MASTER_GIST_ID)
     if not master_data:
         print("❌ マスターGistのダウンロードに失敗")
         sys.exit(1)
@@ -150,44 +130,38 @@ def main():
     scanned = 0
     empty = 0
 
-    for idx, gist_id in enumerate(AVAILABLE_GIST_IDS):
-        try:
-            _, data = download_gist(gist_id, token)
-            if data is None:
-                empty += 1
-                print(f"  [{idx+1}/{len(AVAILABLE_GIST_IDS)}] {gist_id[:8]}... 空")
-                continue
-
-            # multi-user format: {users: {username: {tweets: [...]}}}
-            users = data.get("users", {})
-            if users:
-                user_count = len(users)
-                tweet_count = sum(len(u.get("tweets", [])) for u in users.values())
-                for username in users:
-                    user_gists[username] = gist_id
-                total_user_tweets += tweet_count
-                scanned += 1
-                print(f"  [{idx+1}/{len(AVAILABLE_GIST_IDS)}] {gist_id[:8]}... {user_count}ユーザー, {tweet_count}件")
-            else:
-                # single-user or other format
-                tweets = data.get("tweets", [])
-                if tweets:
-                    user = data.get("user_screen_name", "")
-                    if user:
-                        user_gists[user] = gist_id
-                        total_user_tweets += len(tweets)
-                        scanned += 1
-                        print(f"  [{idx+1}/{len(AVAILABLE_GIST_IDS)}] {gist_id[:8]}... @{user}: {len(tweets)}件")
-                    else:
-                        print(f"  [{idx+1}/{len(AVAILABLE_GIST_IDS)}] {gist_id[:8]}... 不明な形式")
+    # 並列に先読みし、一覧の順に集計する（レート制限は GistStore 側で待つ）
+    for idx, (gist_id, _, data, error) in enumerate(gist_layout.read_many(AVAILABLE_GIST_IDS, store)):
+        if error:
+            empty += 1
+            print(f"  [{idx+1}/{len(AVAILABLE_GIST_IDS)}] {gist_id[:8]}... 空 / エラー: {error}")
+            continue
+
+        # multi-user format: {users: {username: {tweets: [...]}}}
+        users = data.get("users", {})
+        if users:
+            user_count = len(users)
+            tweet_count = sum(len(u.get("tweets", [])) for u in users.values())
+            for username in users:
+                user_gists[username] = gist_id
+            total_user_tweets += tweet_count
+            scanned += 1
+            print(f"  [{idx+1}/{len(AVAILABLE_GIST_IDS)}] {gist_id[:8]}... {user_count}ユーザー, {tweet_count}件")
+        else:
+            # single-user or other format
+            tweets = data.get("tweets", [])
+            if tweets:
+                user = data.get("user_screen_name", "")
+                if user:
+                    user_gists[user] = gist_id
+                    total_user_tweets += len(tweets)
+                    scanned += 1
+                    print(f"  [{idx+1}/{len(AVAILABLE_GIST_IDS)}] {gist_id[:8]}... @{user}: {len(tweets)}件")
                 else:
-                    empty += 1
-                    print(f"  [{idx+1}/{len(AVAILABLE_GIST_IDS)}] {gist_id[:8]}... データなし")
-        except Exception as e:
-            print(f"  [{idx+1}/{len(AVAILABLE_GIST_IDS)}] {gist_id[:8]}... エラー: {e}")
-
-        if idx < len(AVAILABLE_GIST_IDS) - 1:
-            time.sleep(0.3)  # レートリミット対策
+                    print(f"  [{idx+1}/{len(AVAILABLE_GIST_IDS)}] {gist_id[:8]}... 不明な形式")
+            else:
+                empty += 1
+                print(f"  [{idx+1}/{len(AVAILABLE_GIST_IDS)}] {gist_id[:8]}... データなし")
 
     print(f"\n=== スキャン結果 ===")
     print(f"データ有り: {scanned} Gist")
@@ -200,19 +174,11 @@ def main():
         if not args.dry_run:
             print("マスターGistの user_screen_name のみ修正します。")
             master_data["user_screen_name"] = ""
-            headers = make_headers(token)
-            payload = {
-                "files": {
-                    master_fname: {
-                        "content": json.dumps(master_data, ensure_ascii=False, indent=2)
-                    }
-                }
-            }
-            r = requests.patch(f"{GITHUB_API}/gists/{MASTER_GIST_ID}", headers=headers, json=payload)
-            if r.status_code == 200:
+            try:
+                store.write(MASTER_GIST_ID, master_fname, master_data)
                 print("✅ マスターGist更新完了 (user_screen_name を空に)")
-            else:
-                print(f"❌ 更新失敗: {r.status_code}")
+            except RuntimeError as e:
+                print(f"❌ 更新失敗: {e}")
         return
 
     # マスターGistを更新
@@ -220,7 +186,7 @@ def main():
     master_data["user_screen_name"] = ""
     master_data["user_gists"] = user_gists
 
-    updated_json = json.dumps(master_data, ensure_ascii=False, indent=2)
+    updated_json = dump_json(master_data)
     print(f"  user_gists: {len(user_gists)} エントリ")
     print(f"  JSONサイズ: {len(updated_json) / 1024:.0f} KB")
 
@@ -233,22 +199,14 @@ def main():
             print(f"  ... 他 {len(user_gists) - 20} ユーザー")
         return
 
-    headers = make_headers(token)
-    payload = {
-        "files": {
-            master_fname: {
-                "content": updated_json
-            }
-        }
-    }
-    r = requests.patch(f"{GITHUB_API}/gists/{MASTER_GIST_ID}", headers=headers, json=payload)
-    if r.status_code == 200:
-        print(f"✅ マスターGist更新完了!")
-        print(f"   user_gists: {len(user_gists)} ユーザー")
-        print(f"   tweets: {len(master_tweets)} 件")
-    else:
-        print(f"❌ 更新失敗: {r.status_code} {r.text[:300]}")
+    try:
+        store.write_files(MASTER_GIST_ID, {master_fname: updated_json})
+    except RuntimeError as e:
+        print(f"❌ 更新失敗: {e}")
         sys.exit(1)
+    print(f"✅ マスターGist更新完了!")
+    print(f"   user_gists: {len(user_gists)} ユーザー")
+    print(f"   tweets: {len(master_tweets)} 件")
 
 
 if __name__ == "__main__":
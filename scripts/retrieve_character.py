@@ -12,12 +12,14 @@ Usage:
 マスターGistの character_gists フィールド（user_gists と同じフォーマット）:
     { "<キャラクター名>": "<gist_id>", ... }
 """
-import json
 import os
 import sys
 import argparse
-import subprocess
-import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gist_store import get_store
+from gist_format import write_schema
+import gist_layout
 
 
 def parse_args():
@@ -49,73 +51,18 @@ def parse_args():
 # ---------------------------------------------------------------------------
 
 def fetch_gist_data(gist_id):
-    """gh CLI でGistを取得し、(filename, data_dict) を返す。失敗時は RuntimeError を送出。"""
-    result = subprocess.run(
-        ['gh', 'api', f'gists/{gist_id}'],
-        capture_output=True, text=True,
-    )
-    if result.returncode != 0:
-        raise RuntimeError(f'Gist取得失敗 ({gist_id}): {result.stderr.strip()}')
-
-    gist_meta = json.loads(result.stdout)
-    files = gist_meta.get('files', {})
-
-    for filename in ['data.json', 'gallary_data.json']:
-        if filename not in files:
-            continue
-        raw_url = files[filename].get('raw_url')
-        if not raw_url:
-            continue
-        dl = subprocess.run(
-            ['curl', '-sf', '-L', raw_url],
-            capture_output=True, text=True,
-        )
-        if dl.returncode == 0 and dl.stdout.strip():
-            return filename, json.loads(dl.stdout)
-
-    raise RuntimeError(f'data.json が見つかりません ({gist_id})')
+    """GistStore でGistを取得し、(filename, data_dict) を返す。失敗時は RuntimeError を送出。"""
+    return gist_layout.read_document(gist_id)
 
 
 def create_secret_gist(data, description):
     """secret Gistを新規作成して gist_id を返す。失敗時は RuntimeError。"""
-    tmpdir = tempfile.mkdtemp()
-    tmp_file = os.path.join(tmpdir, 'data.json')
-    try:
-        with open(tmp_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        result = subprocess.run(
-            ['gh', 'gist', 'create', '--desc', description, tmp_file],
-            capture_output=True, text=True,
-        )
-        if result.returncode != 0:
-            raise RuntimeError(f'Gist作成失敗: {result.stderr.strip()}')
-        # Output例: https://gist.github.com/username/GIST_ID
-        return result.stdout.strip().rstrip('/').split('/')[-1]
-    finally:
-        if os.path.exists(tmp_file):
-            os.unlink(tmp_file)
-        if os.path.isdir(tmpdir):
-            os.rmdir(tmpdir)
+    return get_store().create('data.json', data, description)
 
 
 def update_gist(gist_id, filename, data):
     """既存GistのファイルをJSON dataで上書きする。失敗時は RuntimeError。"""
-    tmpdir = tempfile.mkdtemp()
-    tmp_file = os.path.join(tmpdir, filename)
-    try:
-        with open(tmp_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        result = subprocess.run(
-            ['gh', 'gist', 'edit', gist_id, '-f', filename, tmp_file],
-            capture_output=True, text=True,
-        )
-        if result.returncode != 0:
-            raise RuntimeError(f'Gist更新失敗 ({gist_id}): {result.stderr.strip()}')
-    finally:
-        if os.path.exists(tmp_file):
-            os.unlink(tmp_file)
-        if os.path.isdir(tmpdir):
-            os.rmdir(tmpdir)
+    get_store().write(gist_id, filename, data)
 
 
 def get_gist_id_from_entry(entry):
@@ -131,6 +78,11 @@ def get_gist_id_from_entry(entry):
 
 def main():
     args = parse_args()
+    try:
+        write_schema()  # XPG_GIST_SCHEMA の誤りは書き込み前に検出する
+    except ValueError as e:
+        print(f'❌ {e}')
+        sys.exit(1)
     char_names = args.chars
 
     # マスターGist ID の解決
@@ -165,7 +117,7 @@ def main():
         print('❌ マスターGistに user_gists フィールドがありません。')
         sys.exit(1)
 
-    unique_user_gist_ids = {get_gist_id_from_entry(v) for v in user_gists_map.values() if get_gist_id_from_entry(v)}
+    unique_user_gist_ids = {gid for v in user_gists_map.values() for gid in gist_layout.user_gist_ids(v)}
     print(f'👤 ユーザーGist数: {len(user_gists_map)}人 / {len(unique_user_gist_ids)}件のGist')
     print(f'🎭 対象キャラクター: {", ".join(char_names)}\n')
 
@@ -173,33 +125,28 @@ def main():
     collected = {name: [] for name in char_names}
 
     # gist_id ごとのキャッシュ（同じGistを複数ユーザーが共有している場合に再取得しない）
+    # 取得は並列に先読みし、マスターでの並び順どおりに受け取る（封印済みのチェーンも含む）
     gist_data_cache = {}
-
-    print('📥 全ユーザーGistを巡回してポストを収集します...')
-    for username, entry in user_gists_map.items():
-        gist_id = get_gist_id_from_entry(entry)
-        if not gist_id:
-            continue
-
-        if gist_id not in gist_data_cache:
-            print(f'  → Gist {gist_id} を取得中...', end=' ', flush=True)
-            try:
-                _, gist_data = fetch_gist_data(gist_id)
-                gist_data_cache[gist_id] = gist_data
-                print('OK')
-            except RuntimeError as e:
-                print(f'SKIP ({e})')
-                gist_data_cache[gist_id] = None
-                continue
+    ordered_gist_ids = list(dict.fromkeys(
+        gid for v in user_gists_map.values() for gid in gist_layout.user_gist_ids(v)
+    ))
+
+    print('📥 全ユーザーGistを取得しています...')
+    for gist_id, _, gist_data, error in gist_layout.read_many(ordered_gist_ids):
+        if error:
+            print(f'  → Gist {gist_id} SKIP ({error})')
         else:
-            gist_data = gist_data_cache[gist_id]
+            print(f'  → Gist {gist_id} OK')
+        gist_data_cache[gist_id] = gist_data
 
-        if gist_data is None:
-            continue
-
-        # users.{username}.tweets を対象にキャラクター名を検索
-        users_in_gist = gist_data.get('users', {})
-        user_tweets = users_in_gist.get(username, {}).get('tweets', [])
+    print('🔎 全ユーザーのポストを巡回して収集します...')
+    for username, entry in user_gists_map.items():
+        # head と封印済みの各Gistの users.{username}.tweets を対象にキャラクター名を検索
+        user_tweets = [
+            tweet
+            for gist_id in gist_layout.user_gist_ids(entry)
+            for tweet in (gist_data_cache.get(gist_id) or {}).get('users', {}).get(username, {}).get('tweets', [])
+        ]
 
         for tweet in user_tweets:
             full_text = tweet.get('full_text', '')
@@ -285,6 +232,7 @@ def main():
         print(f'❌ {e}')
         sys.exit(1)
 
+    print(get_store().cache_report())
     print('\n🎉 完了！')
 
 
@@ -17,15 +17,17 @@ Usage:
 """
 
 import argparse
-import json
 import os
-import subprocess
 import sys
-import tempfile
 
 import numpy as np
 import requests
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gist_store import get_store
+from gist_format import write_schema
+import gist_layout
+
 # --- InsightFace 初期化（遅延ロード） ---
 _face_app = None
 
@@ -88,33 +90,15 @@ def max_cosine_similarity(embedding: np.ndarray,
 
 
 # ---------------------------------------------------------------------------
-# Gist アクセス（gh CLI + requests）
+# Gist アクセス（GistStore）
 # ---------------------------------------------------------------------------
 
 def fetch_gist_raw(gist_id: str) -> tuple[str, dict]:
     """
-    gh CLI でGistメタデータを取得し、data.json の内容を返す。
+    GistStore でGistを取得し、data.json の内容を返す。
     戻り値: (filename, data_dict)  失敗時は RuntimeError
     """
-    result = subprocess.run(
-        ['gh', 'api', f'gists/{gist_id}'],
-        capture_output=True, text=True,
-    )
-    if result.returncode != 0:
-        raise RuntimeError(f'Gist取得失敗 ({gist_id}): {result.stderr.strip()}')
-
-    meta = json.loads(result.stdout)
-    for filename in ['data.json', 'gallary_data.json']:
-        file_info = meta.get('files', {}).get(filename)
-        if not file_info:
-            continue
-        raw_url = file_info.get('raw_url')
-        if not raw_url:
-            continue
-        resp = requests.get(raw_url, timeout=30)
-        if resp.status_code == 200 and resp.text.strip():
-            return filename, resp.json()
-    raise RuntimeError(f'data.json が見つかりません ({gist_id})')
+    return gist_layout.read_document(gist_id)
 
 
 def get_tweets(gist_data: dict, key: str) -> list[dict]:
@@ -135,22 +119,7 @@ def get_gist_id(entry) -> str | None:
 
 def update_gist(gist_id: str, filename: str, data: dict) -> None:
     """既存GistのファイルをJSON dataで上書き。失敗時は RuntimeError。"""
-    tmpdir = tempfile.mkdtemp()
-    tmp_file = os.path.join(tmpdir, filename)
-    try:
-        with open(tmp_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        result = subprocess.run(
-            ['gh', 'gist', 'edit', gist_id, '-f', filename, tmp_file],
-            capture_output=True, text=True,
-        )
-        if result.returncode != 0:
-            raise RuntimeError(f'Gist更新失敗 ({gist_id}): {result.stderr.strip()}')
-    finally:
-        if os.path.exists(tmp_file):
-            os.unlink(tmp_file)
-        if os.path.isdir(tmpdir):
-            os.rmdir(tmpdir)
+    get_store().write(gist_id, filename, data)
 
 
 # ---------------------------------------------------------------------------
@@ -268,33 +237,22 @@ def process_character(
     # 同じGist IDを持つユーザーをグループ化（1度のフェッチで済む）
     gist_to_users: dict[str, list[str]] = {}
     for username, entry in user_gists_map.items():
-        gid = get_gist_id(entry)
-        if gid:
+        for gid in gist_layout.user_gist_ids(entry):  # head と封印済みのチェーン
             gist_to_users.setdefault(gid, []).append(username)
 
-    gist_cache: dict[str, dict | None] = {}
     face_matched: list[dict] = []
     total_gists = len(gist_to_users)
 
-    for gi, (gid, usernames_in_gist) in enumerate(gist_to_users.items()):
+    # Gist は顔判定の裏で並列に先読みする
+    for gi, (gid, _, gd, error) in enumerate(gist_layout.read_many(gist_to_users)):
+        usernames_in_gist = gist_to_users[gid]
         label = ', '.join(usernames_in_gist[:2])
         if len(usernames_in_gist) > 2:
             label += f' +{len(usernames_in_gist) - 2}'
         print(f'  [{gi+1:3d}/{total_gists}] {gid[:8]}... ({label})', end=' ', flush=True)
 
-        # Gist データ取得（キャッシュ利用）
-        if gid not in gist_cache:
-            try:
-                _, gd = fetch_gist_raw(gid)
-                gist_cache[gid] = gd
-            except RuntimeError as e:
-                print(f'SKIP ({e})')
-                gist_cache[gid] = None
-                continue
-
-        gd = gist_cache[gid]
-        if gd is None:
-            print('SKIP')
+        if error:
+            print(f'SKIP ({error})')
             continue
 
         gist_found = 0
@@ -429,6 +387,11 @@ def main():
         help='スキャン時のユーザーあたり最大画像数（0=制限なし、デフォルト: 50）',
     )
     args = parser.parse_args()
+    try:
+        write_schema()  # XPG_GIST_SCHEMA の誤りは書き込み前に検出する
+    except ValueError as e:
+        print(f'❌ {e}')
+        sys.exit(1)
 
     # マスターGist ID の解決
     master_gist_id = args.gist_id or os.environ.get('MASTER_GIST_ID', '')
@@ -455,6 +418,7 @@ def main():
             max_images_per_user=args.max_images,
         )
 
+    print(get_store().cache_report())
     print('\n🎉 すべて完了！')
 
 
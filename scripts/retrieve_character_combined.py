@@ -18,13 +18,16 @@ Usage:
 import argparse
 import json
 import os
-import subprocess
 import sys
-import tempfile
 
 import numpy as np
 import requests
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gist_store import get_store
+from gist_format import write_schema
+import gist_layout
+
 # ---------------------------------------------------------------------------
 # InsightFace 初期化（遅延ロード）
 # ---------------------------------------------------------------------------
@@ -58,7 +61,7 @@ def load_state(path: str) -> dict:
     if os.path.exists(path):
         with open(path, encoding='utf-8') as f:
             return json.load(f)
-    return {'text_checked': {}, 'face_checked': {}}
+    return {'text_checked': {}, 'face_checked': {}, 'scanned_gists': {}}
 
 
 def save_state(state: dict, path: str) -> None:
@@ -80,30 +83,29 @@ def mark_checked(state: dict, phase: str, char_name: str, ids: list[str]) -> Non
     bucket.extend(new_ids)
 
 
+def get_scanned_gists(state: dict, phase: str, char_name: str) -> dict[str, str]:
+    """最後まで走査し終えた時点の {gist_id: updated_at}"""
+    return state.get('scanned_gists', {}).get(phase, {}).get(char_name, {})
+
+
+def mark_scanned_gists(state: dict, phase: str, char_name: str, revisions: dict[str, str]) -> None:
+    """走査し終えたユーザーGistのリビジョン（updated_at）を記録する。"""
+    state.setdefault('scanned_gists', {}).setdefault(phase, {}).setdefault(char_name, {}).update(revisions)
+
+
+def select_changed_gists(gist_ids: list[str], scanned: dict[str, str],
+                         gist_revisions: dict[str, str]) -> list[str]:
+    """前回走査時から updated_at が変わった（または一覧に無く判定できない）Gistだけを返す。"""
+    return [gid for gid in gist_ids
+            if not gist_revisions.get(gid) or scanned.get(gid) != gist_revisions[gid]]
+
+
 # ---------------------------------------------------------------------------
 # Gist アクセス
 # ---------------------------------------------------------------------------
 
 def fetch_gist_raw(gist_id: str) -> tuple[str, dict]:
-    result = subprocess.run(
-        ['gh', 'api', f'gists/{gist_id}'],
-        capture_output=True, text=True,
-    )
-    if result.returncode != 0:
-        raise RuntimeError(f'Gist取得失敗 ({gist_id}): {result.stderr.strip()}')
-
-    meta = json.loads(result.stdout)
-    for filename in ['data.json', 'gallary_data.json']:
-        file_info = meta.get('files', {}).get(filename)
-        if not file_info:
-            continue
-        raw_url = file_info.get('raw_url')
-        if not raw_url:
-            continue
-        resp = requests.get(raw_url, timeout=30)
-        if resp.status_code == 200 and resp.text.strip():
-            return filename, resp.json()
-    raise RuntimeError(f'data.json が見つかりません ({gist_id})')
+    return gist_layout.read_document(gist_id)
 
 
 def get_gist_id(entry) -> str | None:
@@ -120,42 +122,11 @@ def get_tweets(gist_data: dict, key: str) -> list[dict]:
 
 
 def create_secret_gist(data: dict, description: str) -> str:
-    tmpdir = tempfile.mkdtemp()
-    tmp_file = os.path.join(tmpdir, 'data.json')
-    try:
-        with open(tmp_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        result = subprocess.run(
-            ['gh', 'gist', 'create', '--desc', description, tmp_file],
-            capture_output=True, text=True,
-        )
-        if result.returncode != 0:
-            raise RuntimeError(f'Gist作成失敗: {result.stderr.strip()}')
-        return result.stdout.strip().rstrip('/').split('/')[-1]
-    finally:
-        if os.path.exists(tmp_file):
-            os.unlink(tmp_file)
-        if os.path.isdir(tmpdir):
-            os.rmdir(tmpdir)
+    return get_store().create('data.json', data, description)
 
 
 def update_gist(gist_id: str, filename: str, data: dict) -> None:
-    tmpdir = tempfile.mkdtemp()
-    tmp_file = os.path.join(tmpdir, filename)
-    try:
-        with open(tmp_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        result = subprocess.run(
-            ['gh', 'gist', 'edit', gist_id, '-f', filename, tmp_file],
-            capture_output=True, text=True,
-        )
-        if result.returncode != 0:
-            raise RuntimeError(f'Gist更新失敗 ({gist_id}): {result.stderr.strip()}')
-    finally:
-        if os.path.exists(tmp_file):
-            os.unlink(tmp_file)
-        if os.path.isdir(tmpdir):
-            os.rmdir(tmpdir)
+    get_store().write(gist_id, filename, data)
 
 
 # ---------------------------------------------------------------------------
@@ -224,9 +195,11 @@ def phase1_text(
     master_data: dict,
     state: dict,
     state_file: str,
+    gist_revisions: dict[str, str],
 ) -> tuple[str | None, str, list[dict]]:
     """
     full_text にキャラクター名を含むポストを収集し、キャラクターGistを作成/更新する。
+    gist_revisions（{gist_id: updated_at}）が前回走査時と同じユーザーGistは取得しない。
     戻り値: (char_gist_id, char_filename, all_text_tweets)
              char_gist_id は作成/更新失敗時 None
     """
@@ -265,33 +238,22 @@ def phase1_text(
         tagged_existing.append(t)
 
     # 全ユーザーGistをテキストスキャン
-    # gist_id 単位でキャッシュし重複フェッチを防ぐ
-    unique_gist_ids = {get_gist_id(v) for v in user_gists_map.values() if get_gist_id(v)}
-    gist_data_cache: dict[str, dict | None] = {}
+    # gist_id 単位で重複を除き、並列に先読みしながら順に処理する
+    unique_gist_ids = list(dict.fromkeys(gid for v in user_gists_map.values() for gid in gist_layout.user_gist_ids(v)))
+    changed_gist_ids = select_changed_gists(
+        unique_gist_ids, get_scanned_gists(state, 'text', char_name), gist_revisions)
     newly_found: list[dict] = []
     newly_checked_ids: list[str] = []
-    total = len(unique_gist_ids)
-    print(f'  ユーザーGist数: {total}')
+    newly_scanned: dict[str, str] = {}
+    total = len(changed_gist_ids)
+    print(f'  ユーザーGist数: {len(unique_gist_ids)}  (前回から変更なし: {len(unique_gist_ids) - total} → 取得: {total})')
 
-    for gi, gid in enumerate(unique_gist_ids):
+    for gi, (gid, _, gd, error) in enumerate(gist_layout.read_many(changed_gist_ids)):
         print(f'  [{gi+1:3d}/{total}] {gid[:8]}...', end=' ', flush=True)
-
-        if gid not in gist_data_cache:
-            try:
-                _, gd = fetch_gist_raw(gid)
-                gist_data_cache[gid] = gd
-                print('OK', end=' ')
-            except RuntimeError as e:
-                print(f'SKIP ({e})')
-                gist_data_cache[gid] = None
-                continue
-        else:
-            gd = gist_data_cache[gid]
-            print('(cached)', end=' ')
-
-        if gd is None:
-            print()
+        if error:
+            print(f'SKIP ({error})')
             continue
+        print('OK', end=' ')
 
         gist_found = 0
         for username, udata in gd.get('users', {}).items():
@@ -309,12 +271,15 @@ def phase1_text(
                     newly_found.append(t)
                     gist_found += 1
 
+        if gist_revisions.get(gid):
+            newly_scanned[gid] = gist_revisions[gid]
         print(f'+{gist_found}')
 
     print(f'\n  新規テキストマッチ: {len(newly_found)}件  (スキャン: {len(newly_checked_ids)}件)')
 
     # 状態を更新・保存
     mark_checked(state, 'text_checked', char_name, newly_checked_ids)
+    mark_scanned_gists(state, 'text', char_name, newly_scanned)
     save_state(state, state_file)
 
     # 既存 + 新規をマージ（id_str で重複除去）
@@ -373,10 +338,12 @@ def phase2_face(
     threshold: float,
     max_ref_images: int,
     max_images_per_user: int,
+    gist_revisions: dict[str, str],
 ) -> None:
     """
     text_tweets を顔リファレンスとして全ユーザーGistをスキャンし、
     face-matched ポストをキャラクターGistに追加する。
+    前回最後まで走査し、その後 updated_at が変わっていないユーザーGistは取得しない。
     """
     print(f'\n{"="*60}')
     print(f'[Phase 2 - face] {char_name}')
@@ -388,6 +355,19 @@ def phase2_face(
     face_checked_ids = get_checked_ids(state, 'face_checked', char_name)
     print(f'  スキップ済みID数（face）: {len(face_checked_ids)}')
 
+    # 同じGist IDを持つユーザーをグループ化し、前回走査後に変更されたGistだけに絞る
+    gist_to_users: dict[str, list[str]] = {}
+    for username, entry in user_gists_map.items():
+        for gid in gist_layout.user_gist_ids(entry):  # head と封印済みのチェーン
+            gist_to_users.setdefault(gid, []).append(username)
+    changed_gist_ids = select_changed_gists(
+        list(gist_to_users), get_scanned_gists(state, 'face', char_name), gist_revisions)
+    print(f'  ユーザーGist数: {len(gist_to_users)}  (前回から変更なし: {len(gist_to_users) - len(changed_gist_ids)}'
+          f' → 取得: {len(changed_gist_ids)})')
+    if not changed_gist_ids:
+        print(f'  変更されたユーザーGistがないため Phase 2 をスキップします。')
+        return
+
     # リファレンス embedding 構築
     print(f'  リファレンス顔特徴を抽出中（最大{max_ref_images}枚）...')
     ref_embeddings = build_ref_embeddings(text_tweets, max_ref_images)
@@ -416,42 +396,28 @@ def phase2_face(
         except RuntimeError as e:
             print(f'    [WARN] {other_char} の取得失敗、スキップ: {e}')
 
-    # 同じGist IDを持つユーザーをグループ化
-    gist_to_users: dict[str, list[str]] = {}
-    for username, entry in user_gists_map.items():
-        gid = get_gist_id(entry)
-        if gid:
-            gist_to_users.setdefault(gid, []).append(username)
-
-    gist_cache: dict[str, dict | None] = {}
     face_matched: list[dict] = []
     newly_face_checked_ids: list[str] = []
-    total_gists = len(gist_to_users)
+    newly_scanned: dict[str, str] = {}
+    total_gists = len(changed_gist_ids)
 
     limit_str = str(max_images_per_user) if max_images_per_user > 0 else '制限なし'
-    print(f'  ユーザーGist数: {total_gists}  threshold: {threshold}  max_images: {limit_str}')
+    print(f'  threshold: {threshold}  max_images: {limit_str}')
 
-    for gi, (gid, usernames_in_gist) in enumerate(gist_to_users.items()):
+    # Gist は顔判定の裏で並列に先読みする
+    for gi, (gid, _, gd, error) in enumerate(gist_layout.read_many(changed_gist_ids)):
+        usernames_in_gist = gist_to_users[gid]
         label = ', '.join(usernames_in_gist[:2])
         if len(usernames_in_gist) > 2:
             label += f' +{len(usernames_in_gist) - 2}'
         print(f'  [{gi+1:3d}/{total_gists}] {gid[:8]}... ({label})', end=' ', flush=True)
 
-        if gid not in gist_cache:
-            try:
-                _, gd = fetch_gist_raw(gid)
-                gist_cache[gid] = gd
-            except RuntimeError as e:
-                print(f'SKIP ({e})')
-                gist_cache[gid] = None
-                continue
-
-        gd = gist_cache[gid]
-        if gd is None:
-            print('SKIP')
+        if error:
+            print(f'SKIP ({error})')
             continue
 
         gist_found = 0
+        fully_scanned = True  # max_images で打ち切ったユーザーがいれば次回も走査する
         for username in usernames_in_gist:
             tweets = get_tweets(gd, username)
 
@@ -473,6 +439,7 @@ def phase2_face(
                     continue
 
                 if max_images_per_user > 0 and images_since_match >= max_images_per_user:
+                    fully_scanned = False
                     break
 
                 # このツイートを処理済みとしてマーク（マッチ有無にかかわらず）
@@ -502,12 +469,15 @@ def phase2_face(
                     if tweet_matched:
                         break
 
+        if fully_scanned and gist_revisions.get(gid):
+            newly_scanned[gid] = gist_revisions[gid]
         print(f'+{gist_found}')
 
     print(f'\n  新規 face-matched ポスト数: {len(face_matched)}')
 
     # 状態を更新・保存（マッチ有無にかかわらず処理済IDを記録）
     mark_checked(state, 'face_checked', char_name, newly_face_checked_ids)
+    mark_scanned_gists(state, 'face', char_name, newly_scanned)
     save_state(state, state_file)
 
     if not face_matched:
@@ -586,7 +556,16 @@ def main():
         '--state-file', default=DEFAULT_STATE_FILE,
         help=f'処理済ID記録ファイル（デフォルト: {DEFAULT_STATE_FILE}）',
     )
+    parser.add_argument(
+        '--full-scan', action='store_true',
+        help='前回から変更のないユーザーGistも取得して走査する',
+    )
     args = parser.parse_args()
+    try:
+        write_schema()  # XPG_GIST_SCHEMA の誤りは書き込み前に検出する
+    except ValueError as e:
+        print(f'❌ {e}')
+        sys.exit(1)
 
     master_gist_id = args.gist_id or os.environ.get('MASTER_GIST_ID', '')
     if not master_gist_id:
@@ -622,6 +601,15 @@ def main():
     state = load_state(args.state_file)
     print(f'  状態ファイル: {args.state_file}')
 
+    # Gist 一覧（updated_at）を取得し、前回走査後に変更されたユーザーGistだけを読む
+    gist_revisions: dict[str, str] = {}
+    if not args.full_scan:
+        try:
+            gist_revisions = get_store().list_gists()
+            print(f'  Gist一覧: {len(gist_revisions)} 件（updated_at で変更を判定）')
+        except RuntimeError as e:
+            print(f'  [WARN] Gist一覧の取得に失敗したため全Gistを走査します: {e}')
+
     for char_name in args.chars:
         # Phase 1: テキスト抽出
         char_gist_id, char_filename, text_tweets = phase1_text(
@@ -629,6 +617,7 @@ def main():
             master_data=master_data,
             state=state,
             state_file=args.state_file,
+            gist_revisions=gist_revisions,
         )
 
         if not char_gist_id:
@@ -647,6 +636,7 @@ def main():
             threshold=args.threshold,
             max_ref_images=args.max_ref_images,
             max_images_per_user=args.max_images,
+            gist_revisions=gist_revisions,
         )
 
     # キャラクターGist を更新（character_gists に新規Gistが追加された可能性があるため）
@@ -686,6 +676,7 @@ def main():
         print(f'❌ {e}')
         sys.exit(1)
 
+    print(get_store().cache_report())
     print('\n🎉 すべて完了！')
 
 
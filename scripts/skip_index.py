@@ -0,0 +1,134 @@
+"""
+スクレイパー用の既知ID（スキップID）インデックス。
+
+  - 既知IDは X のステータスID（snowflake = 符号なし64bit整数）なので、
+    文字列の set / dict ではなくソート済み uint64 配列として保持し二分探索する
+  - ファイル形式（リトルエンディアン）:
+      magic "XPGSKIP1" | 件数 uint64 | ソート済みID uint64 × 件数 | Gist内の並び位置 uint32 × 件数
+    並び位置は --stop-on-existing の「Gist と同じ順で連続一致」判定に使う
+  - ファイルは mmap で開くため、数十万件でも読み込み時間・メモリはほぼかからない
+  - 旧形式（1行1IDのテキスト）もそのまま読める
+
+Usage:
+    write_skip_ids_file("data/skip_ids.bin", ordered_ids)   # 新しい順の ID リスト
+    with SkipIdIndex.open("data/skip_ids.bin") as skip_ids:
+        "1234567890" in skip_ids; skip_ids.position("1234567890")
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+MAGIC = b"XPGSKIP1"
+HEADER = struct.Struct("<8sQ")
+
+def _to_int_id(tid):
+    """ID を int に変換（数値でないものは None）"""
+    if isinstance(tid, int):
+        return tid
+    tid = str(tid).strip()
+    return int(tid) if tid.isdigit() else None
+
+def _build_arrays(ordered_ids):
+    """新しい順の ID 列から (ソート済みID配列, 並び位置配列) を作る（重複は先頭の位置を残す）"""
+    first_pos = {}
+    for pos, tid in enumerate(ordered_ids):
+        n = _to_int_id(tid)
+        if n is not None and n < 2 ** 64 and n not in first_pos:
+            first_pos[n] = pos
+    ids = sorted(first_pos)
+    return array("Q", ids), array("I", (first_pos[n] for n in ids))
+
+def write_skip_ids_file(path, ordered_ids):
+    """既知ID（新しい順）をバイナリ形式で書き出し、件数を返す"""
+    ids, positions = _build_arrays(ordered_ids)
+    if sys.byteorder != "little":
+        ids.byteswap(); positions.byteswap()
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(ids)))
+        ids.tofile(f)
+        positions.tofile(f)
+    os.replace(tmp, path)
+    return len(ids)
+
+class SkipIdIndex:
+    """ソート済み uint64 配列による既知IDの集合（in / position / len が使える）"""
+
+    def __init__(self, ids, positions, mm=None, view=None):
+        self._ids = ids
+        self._positions = positions
+        self._mmap = mm
+        self._view = view
+
+    @classmethod
+    def from_ids(cls, ordered_ids):
+        """メモリ上の ID 列（新しい順）から作る"""
+        ids, positions = _build_arrays(ordered_ids)
+        return cls(ids, positions)
+
+    @classmethod
+    def open(cls, path):
+        """ファイルから開く（バイナリ形式は mmap、旧テキスト形式は読み込んで変換。無ければ空）"""
+        if not path or not os.path.exists(path) or os.path.getsize(path) == 0:
+            return cls.from_ids([])
+        with open(path, "rb") as f:
+            head = f.read(HEADER.size)
+            if not head.startswith(MAGIC):
+                f.seek(0)
+                return cls.from_ids(line.strip() for line in f.read().decode("utf-8").splitlines())
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, count = HEADER.unpack(head)
+        ids_end = HEADER.size + count * 8
+        if len(mm) < ids_end + count * 4:
+            mm.close()
+            raise ValueError(f"Truncated skip-id index: {path}")
+        if sys.byteorder != "little":
+            # ビッグエンディアン環境ではコピーして並べ替える（通常は通らない）
+            ids, positions = array("Q"), array("I")
+            ids.frombytes(mm[HEADER.size:ids_end]); positions.frombytes(mm[ids_end:ids_end + count * 4])
+            ids.byteswap(); positions.byteswap()
+            mm.close()
+            return cls(ids, positions)
+        view = memoryview(mm)
+        return cls(view[HEADER.size:ids_end].cast("Q"), view[ids_end:ids_end + count * 4].cast("I"), mm, view)
+
+    def _find(self, tid):
+        n = _to_int_id(tid)
+        if n is None:
+            return -1
+        i = bisect_left(self._ids, n)
+        return i if i < len(self._ids) and self._ids[i] == n else -1
+
+    def __contains__(self, tid):
+        return self._find(tid) >= 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __bool__(self):
+        return len(self._ids) > 0
+
+    def position(self, tid, default=-1):
+        """Gist 内の並び位置（0 = 最新）。未知の ID は default"""
+        i = self._find(tid)
+        return self._positions[i] if i >= 0 else default
+
+    def max_id(self):
+        """最大（= 最新）の ID。空なら None"""
+        return self._ids[-1] if len(self._ids) else None
+
+    def close(self):
+        if self._mmap is not None:
+            self._ids.release(); self._positions.release(); self._view.release()
+            self._ids, self._positions, self._view = array("Q"), array("I"), None
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -2,12 +2,13 @@
 マスターGistのtweetsをスリム形式に移行する一回限りスクリプト。
 {full_text, created_at, post_url} を削除し、{username, id_str, media_urls[0:1]} のみ残す。
 """
-import json
 import os
 import re
-import subprocess
 import sys
-import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gist_store import get_store
+from gist_format import write_schema
 
 USER_PATTERN = re.compile(r"^@([^:]+):")
 
@@ -24,25 +25,21 @@ def extract_username(tweet):
     return "Unknown"
 
 def fetch_gist(gist_id):
-    result = subprocess.run(
-        ["gh", "api", f"gists/{gist_id}"],
-        capture_output=True, text=True, check=True,
-    )
-    meta = json.loads(result.stdout)
-    files = meta.get("files", {})
-    for fname in ["data.json", "gallary_data.json"]:
-        if fname in files:
-            raw_url = files[fname]["raw_url"]
-            dl = subprocess.run(["curl", "-sf", "-L", raw_url], capture_output=True, text=True)
-            if dl.returncode == 0:
-                return fname, json.loads(dl.stdout)
-    print("❌ data.json not found")
-    sys.exit(1)
+    try:
+        return get_store().read(gist_id)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
 
 def main():
     if len(sys.argv) < 2:
         print("Usage: python3 slim_master_gist.py <master_gist_id>")
         sys.exit(1)
+    try:
+        write_schema()  # XPG_GIST_SCHEMA の誤りは書き込み前に検出する
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
 
     gist_id = sys.argv[1]
     print(f"Fetching master Gist {gist_id}...")
@@ -65,21 +62,12 @@ def main():
 
     data["tweets"] = slimmed
 
-    fd, tmp = tempfile.mkstemp(suffix=".json")
+    print(f"Updating Gist {gist_id}...")
     try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        print(f"Updating Gist {gist_id}...")
-        result = subprocess.run(
-            ["gh", "gist", "edit", gist_id, "-f", filename, tmp],
-            capture_output=True, text=True,
-        )
-        if result.returncode != 0:
-            print(f"❌ Failed: {result.stderr}")
-            sys.exit(1)
-    finally:
-        if os.path.exists(tmp):
-            os.unlink(tmp)
+        get_store().write(gist_id, filename, data)
+    except RuntimeError as e:
+        print(f"❌ Failed: {e}")
+        sys.exit(1)
 
     print(f"✅ Done. {len(slimmed)} tweets slimmed.")
 